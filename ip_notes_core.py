@@ -0,0 +1,5092 @@
+#!env python
+
+import pickle
+import os
+import argparse
+import re
+import sys
+import io
+import collections
+import mmap
+import struct
+import collections.abc
+import contextlib
+import functools
+import itertools
+import time
+
+# 脚本常在管道中被频繁调用，耗时较多的模块只在用到的函数中导入：
+# ipaddress, pprint, wcwidth, code, multiprocessing, sqlite3, subprocess, asyncio, socket, threading
+
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
+import bisect
+import heapq
+from array import array
+
+# 版本信息
+version = '0.1'
+
+# IP 字典
+# 字典元素结构 ’192.168.1.1' : ['备注1’， '备注2', ...]
+ip_dict = dict()
+
+# IP 备注历史，按 key 分组的历史版本，各版本按被替换的时间先后排列
+# 字典元素结构 '192.168.1.1' : [(被替换时的时间戳, ('备注1', ...)), ...]，key 也可以是网段/范围
+ip_history = dict()
+
+# 各 key 第一个已知版本的导入时间，与 ip_history 中被替换的时间一起给出每个版本的导入时间：
+# 第一个版本自该时间起有效，之后的版本（含当前备注）自前一版本被替换时起有效，在此之前没有备注
+# 字典元素结构 '192.168.1.1' : 时间戳，key 也可以是网段/范围；旧数据文件中没有记录的 key 视为一直有效
+ip_added = dict()
+
+# IP 标签
+# 标签元素结构 ’192.168.1.1' : {'标签1’， '标签2', ...}
+ip_tag = dict()
+
+# IP 网段/范围备注
+# 字典元素结构 '10.20.0.0/16' : ('备注1', ...), '10.0.0.1-10.0.0.50' : ('备注1', ...)
+ip_range = dict()
+
+# 网段/范围查找索引，由 build_range_index 生成，ip_range 变化后置为 None
+# 结构 (起始IP整数数组, 结束IP整数数组, 备注列表)，各区间互不重叠
+range_index = None
+
+# IPv4 地址的最大整数值
+ip_max = (1 << 32) - 1
+
+# IP 排序索引，随数据文件保存，-od/-oh/-ot 按此顺序输出，不必每次重新排序
+# 结构 {'dict': array('I', [IP整数, ...]), 'history': ..., 'tag': ...}，IP 整数去重并升序排列
+# history 只包含单个 IP 的 key，网段/范围较少，输出时再排序
+ip_order = {'dict': array('I'), 'history': array('I'), 'tag': array('I')}
+
+# 装载后新增、尚未合并到 ip_order 的 key，用到排序索引时再合并
+# 结构 {'dict': ['192.168.1.1', ...], ...}
+order_added = {'dict': [], 'history': [], 'tag': []}
+
+# 备注倒排索引，--find-note 使用，随 pickle 数据文件保存
+# 结构 {'size': 已索引的 IP 数,
+#       'parts': {'备注片段': IP整数 或 array('I', [IP整数, ...])},
+#       'tokens': {'索引词': '备注片段' 或 {'备注片段', ...}},
+#       'grams': {'三字片段': '索引词' 或 {'索引词', ...}}}
+# 备注片段即按空白切分后的各项，不同 IP 的备注多有重复，每个片段只分词一次；
+# 英文、数字按整词索引，中日韩文字按单字及相邻两字索引；只有一个值时直接存整数/字符串，节省空间
+# 英文、数字的索引词再按相邻三个字符（不足三个字符时为整词）索引，查询词只是索引词的一部分时不必遍历全部索引词
+note_index = {'size': 0, 'parts': dict(), 'tokens': dict(), 'grams': dict()}
+
+# 装载后修改过的备注，尚未合并到 note_index
+# 结构 [('192.168.1.1', 修改前的备注，新增的 IP 为 None), ...]
+note_changes = []
+
+# 历史版本的时间索引，--prune-history 使用，随 pickle 数据文件保存
+# 结构 {'times': array('I', [被替换的时间, ...]), 'keys': ['192.168.1.1', ...],
+#       'counts': {版本数: {'192.168.1.1', ...}}, 'total': 历史版本总数}
+# times 升序，keys 与之逐条对应，按时间删除时只需切掉开头一段；counts 只记录有两个及以上版本的 key，
+# 按版本数删除时只处理超出的 key；被按版本数删除或整体删除的 key 在 times 中留有过时的条目，
+# 按时间删除时跳过，过时条目多于有效条目时重建；total 为 -1 表示尚未建立（旧数据文件、ipdb 等），用到时重建
+history_index = {'times': array('I'), 'keys': [], 'counts': dict(), 'total': -1}
+
+# 数据段名称及对应的全局变量，各数据段可单独装载
+data_sections = {'dict': 'ip_dict', 'history': 'ip_history', 'tag': 'ip_tag', 'range': 'ip_range',
+                 'order': 'ip_order', 'notes': 'note_index', 'tags': 'tag_index', 'added': 'ip_added',
+                 'hindex': 'history_index'}
+
+# 当前打开的 pickle 数据文件，未装载的数据段从中读取，由 release_snapshot 关闭
+# 结构 (文件对象, 数据段起始位置, {'dict': (偏移, 长度), ...})
+pickle_file = None
+
+# 本次导入产生的修改记录，存盘时追加到导入日志
+# 记录结构 ('note', '192.168.1.1', ('备注1', ...), 导入时间戳)、('tag', ...)、('range', '10.0.0.0/8', (...), ...)
+pending_records = []
+
+# 导入日志超过该大小、记录数，或最早的记录超过该时间（秒）时在后台合并到数据文件；
+# 记录数与时间限制让小而频繁的导入也会合并，读取数据时重放的日志及其覆盖层保持较小
+journal_compact_size = 4 << 20
+journal_compact_records = 50000
+journal_compact_age = 86400
+
+# 本进程装载时重放的导入日志记录数，与本次追加的记录数一起判断是否需要合并
+journal_records = 0
+
+# 标签倒排索引，-m -t 统计与 --tags 查询使用，随 pickle 数据文件保存
+# 结构 {'ips': 已索引的 IP 数（-1 表示尚未建立）, 'tags': {'标签1': IP整数 或 array('I', [IP整数, ...])}}
+tag_index = {'ips': -1, 'tags': dict()}
+
+# 装载后新增、尚未合并到 tag_index 的标签
+# 结构 [('192.168.1.1', ('标签1', ...), 是否新增的 IP，未知时为 None), ...]
+tag_changes = []
+
+def default_ipdata():
+    """默认IP数据文件
+    如果没有指定数据文件，则使用默认数据文件；
+    默认数据文件可能位置：
+    ./IP.ipdb
+    ./IP.pkl
+    ~/.ip_data/IP.ipdb
+    ~/.ip_data/IP.pkl
+    如果当前目录有数据文件，则使用当前目录数据文件，ipdb 格式优先
+    否则使用 ~/.ip_data/IP.pkl 作为默认数据文件
+    """
+    for ipdata in ('IP.ipdb', 'IP.pkl'):
+        if os.path.exists(ipdata):
+            return ipdata
+    if os.name == 'nt':
+        home_dir = os.environ.get('USERPROFILE')
+    else:
+        home_dir = os.environ.get('HOME')
+    for name in ('IP.ipdb', 'IP.pkl'):
+        ipdata = os.path.join(home_dir, '.ip_notes', name)
+        if os.path.exists(ipdata):
+            return ipdata
+    data_folder = os.path.dirname(os.path.abspath(ipdata))
+    if not os.path.exists(data_folder):
+        os.makedirs(data_folder)
+    return ipdata
+
+
+# 完整匹配一个 IPv4 地址，与 ipaddress.IPv4Address 的规则一致：ASCII 数字、每段 0-255、不允许前导 0
+pattern_ipv4_full = re.compile(
+    r'(?:(?:25[0-5]|2[0-4][0-9]|1[0-9][0-9]|[1-9]?[0-9])\.){3}(?:25[0-5]|2[0-4][0-9]|1[0-9][0-9]|[1-9]?[0-9])')
+
+
+def is_ipv4(ip):
+    """检查是否是IPV4"""
+    return pattern_ipv4_full.fullmatch(ip) is not None
+
+
+def ip_to_int(ip):
+    """点分十进制 IPv4 转整数，调用方需保证格式正确"""
+    a, b, c, d = ip.split('.')
+    return (int(a) << 24) | (int(b) << 16) | (int(c) << 8) | int(d)
+
+
+def int_to_ip(n):
+    """整数转点分十进制 IPv4"""
+    return f'{n >> 24}.{(n >> 16) & 255}.{(n >> 8) & 255}.{n & 255}'
+
+
+def ips_to_ints(keys):
+    """点分十进制 IPv4 批量转为整数数组，调用方需保证格式正确"""
+    import socket
+    ints = array('I', b''.join(map(socket.inet_aton, keys)))
+    if sys.byteorder == 'little':
+        ints.byteswap()
+    return ints
+
+
+def ints_to_ips(ints, encode=False):
+    """整数批量转为点分十进制 IPv4 列表，encode 为 True 时为字节"""
+    packed = array('I', ints)
+    if sys.byteorder == 'little':
+        packed.byteswap()
+    form = b'%d.%d.%d.%d' if encode else '%d.%d.%d.%d'
+    return [form % octets for octets in struct.iter_unpack('4B', packed)]
+
+
+def parse_ip_range(text):
+    """解析网段或 IP 范围
+    支持 '10.20.0.0/16' 与 '10.0.0.1-10.0.0.50' 两种写法，
+    返回 (规范化的 key, 起始IP整数, 结束IP整数)，无法解析时返回 None
+    """
+    if '/' in text:
+        import ipaddress
+        try:
+            network = ipaddress.IPv4Network(text, strict=False)
+        except ValueError:
+            return None
+        return str(network), int(network.network_address), int(network.broadcast_address)
+    if '-' in text:
+        first, _, last = text.partition('-')
+        if not (is_ipv4(first) and is_ipv4(last)):
+            return None
+        start, end = ip_to_int(first), ip_to_int(last)
+        if start > end:
+            return None
+        return f'{int_to_ip(start)}-{int_to_ip(end)}', start, end
+    return None
+
+
+def range_bounds(key):
+    """ip_range 中已规范化的 key 转为 (起始IP整数, 结束IP整数)"""
+    if '/' in key:
+        address, prefix = key.split('/')
+        size = 1 << (32 - int(prefix))
+        start = ip_to_int(address)
+        return start, start + size - 1
+    first, last = key.split('-')
+    return ip_to_int(first), ip_to_int(last)
+
+
+def ip_sort_key(key):
+    """IP、网段、范围统一的排序 key：(起始IP, 结束IP)"""
+    if is_ipv4(key):
+        n = ip_to_int(key)
+        return n, n
+    parsed = parse_ip_range(key)
+    if parsed:
+        return parsed[1], parsed[2]
+    return -1, -1
+
+
+# 单个 IP 段，用于解析通配符与前缀查询
+pattern_octet = re.compile(r'25[0-5]|2[0-4][0-9]|1[0-9][0-9]|[1-9]?[0-9]')
+
+
+def parse_query(text):
+    """解析 -s 的查询条件，返回 (起始IP整数, 结束IP整数)，无法解析时返回 None
+    支持单个 IP '10.1.1.1'、网段 '10.1.0.0/16'、范围 '10.1.1.1-10.1.1.99'、
+    通配符 '10.1.*.*' 及前缀 '10.1.'，通配符只能出现在末尾的若干段
+    """
+    text = text.strip()
+    if is_ipv4(text):
+        n = ip_to_int(text)
+        return n, n
+    parsed = parse_ip_range(text)
+    if parsed:
+        return parsed[1], parsed[2]
+
+    parts = text.split('.')
+    if parts[-1] == '':
+        parts.pop()
+    fixed = []
+    for part in parts:
+        if part == '*':
+            break
+        if not pattern_octet.fullmatch(part):
+            return None
+        fixed.append(int(part))
+    if not parts or len(parts) > 4 or any(part != '*' for part in parts[len(fixed):]):
+        return None
+    start = 0
+    for octet in fixed:
+        start = (start << 8) | octet
+    shift = 8 * (4 - len(fixed))
+    start <<= shift
+    return start, start | ((1 << shift) - 1)
+
+
+def reset_indexes():
+    """清空排序索引、备注及标签倒排索引，重新装载或重置数据时调用"""
+    global ip_order, note_index, tag_index, history_index
+    ip_order = empty_section('order')
+    note_index = empty_section('notes')
+    tag_index = empty_section('tags')
+    history_index = empty_section('hindex')
+    for added in order_added.values():
+        added.clear()
+    note_changes.clear()
+    tag_changes.clear()
+
+
+def empty_section(name):
+    """索引数据段及导入时间的初始值，旧版本数据文件中没有这些数据段"""
+    if name == 'added':
+        return dict()
+    if name == 'hindex':
+        return {'times': array('I'), 'keys': [], 'counts': dict(), 'total': -1}
+    if name == 'order':
+        return {key: array('I') for key in order_added}
+    if name == 'tags':
+        return {'ips': -1, 'tags': dict()}
+    return {'size': 0, 'parts': dict(), 'tokens': dict(), 'grams': dict()}
+
+
+def build_order(keys):
+    """整体重建排序索引，返回去重升序的 IP 整数数组
+    装有 NumPy 时向量化解析点分十进制 IP 并排序
+    """
+    keys = list(keys)
+    try:
+        import numpy
+    except ImportError:
+        return array('I', sorted(set(map(ip_to_int, keys))))
+    if not keys:
+        return array('I')
+    return array('I', numpy.unique(parse_ips_numpy(numpy, keys)).astype(numpy.uint32).tobytes())
+
+
+def parse_ips_numpy(numpy, keys):
+    """向量化解析点分十进制 IP（字符串或字节），返回 uint32 数组，调用方需保证格式正确"""
+    # 每个 IP 最多 15 个字节，逐列处理：数字累加到当前段，遇到 '.' 把当前段移入结果
+    chars = numpy.array(keys, dtype='S15').view(numpy.uint8).reshape(len(keys), 15)
+    result = numpy.zeros(len(keys), dtype=numpy.uint32)
+    part = numpy.zeros(len(keys), dtype=numpy.uint32)
+    for column in chars.T:
+        digit = (column >= 48) & (column <= 57)
+        dot = column == 46
+        part = numpy.where(digit, part * 10 + (column - 48), part)
+        result = numpy.where(dot, (result << 8) | part, result)
+        part = numpy.where(dot, 0, part)
+    return (result << 8) | part
+
+
+def merge_sorted(arr, ints):
+    """将整数合并到升序去重的数组，返回新数组
+    已有部分按切片整体复制，只对新增的整数二分查找，不重新排序
+    """
+    merged = array('I')
+    start = 0
+    for n in sorted(set(ints)):
+        i = bisect.bisect_left(arr, n, start)
+        merged.extend(arr[start:i])
+        if i == len(arr) or arr[i] != n:
+            merged.append(n)
+        start = i
+    merged.extend(arr[start:])
+    return merged
+
+
+def remove_sorted(arr, ints):
+    """从升序去重的数组中删除整数，返回新数组
+    删除的数量少时二分查找后逐个删除，否则整体过滤
+    """
+    ints = set(ints)
+    if len(ints) * 64 > len(arr):
+        return array('I', (n for n in arr if n not in ints))
+    arr = array('I', arr)
+    for n in sorted(ints, reverse=True):
+        i = bisect.bisect_left(arr, n)
+        if i < len(arr) and arr[i] == n:
+            del arr[i]
+    return arr
+
+
+def sorted_order(name, keys, count):
+    """返回数据段的排序索引
+    先合并新增的 key；索引长度与数据段中 IP 数量 count 不一致时（旧数据文件、
+    手工修改过数据等）用 keys 整体重建
+    """
+    added = order_added[name]
+    if isinstance(keys, CompactSection):
+        # 紧凑结构的 IP 数组即排序索引
+        added.clear()
+        ip_order[name] = keys.sorted_keys()
+        return ip_order[name]
+    order = ip_order[name]
+    if added:
+        order = merge_sorted(order, map(ip_to_int, added))
+        added.clear()
+    if len(order) != count:
+        order = build_order(keys)
+    ip_order[name] = order
+    return order
+
+
+def sorted_items(name, section):
+    """按 IP 顺序遍历数据段，返回 (IP整数, 值)
+    紧凑结构的值编号数组与排序索引一一对应，直接取值，不逐个 IP 查找
+    """
+    section = loaded(section)
+    order = sorted_order(name, section, len(section))
+    if isinstance(section, CompactSection):
+        return zip(order, map(section.decode, section.ids))
+    return ((n, section[int_to_ip(n)]) for n in order)
+
+
+def section_values(section, ints):
+    """升序的 IP 整数在数据段中各自的值，没有时为 None；紧凑结构按数组归并查找"""
+    section = loaded(section)
+    if isinstance(section, CompactSection):
+        decode = section.decode
+        return (None if i is None else decode(i) for i in section.find_ints(ints))
+    get = section.get
+    return (get(int_to_ip(n)) for n in ints)
+
+
+# 中日韩文字，备注中按单字及相邻两字建立索引，支持按任意子串查找
+cjk_chars = '\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff'
+
+
+@functools.lru_cache(maxsize=None)
+def note_token_pattern():
+    """备注分词的正则，字符集较大、编译需要数毫秒，只在 --find-note 与建立索引时编译"""
+    return re.compile(f'([{cjk_chars}]+)|[^\\W_{cjk_chars}]+')
+
+
+def note_tokens(text):
+    """备注文本的索引词：英文、数字按整词（小写），中日韩文字按单字及相邻两字"""
+    text = text.lower()
+    if text.isascii() and text.isalnum():
+        return frozenset((text,))
+    tokens = set()
+    for match in note_token_pattern().finditer(text):
+        run = match.group()
+        if match.group(1):
+            tokens.update(run)
+            tokens.update(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.add(run)
+    return frozenset(tokens)
+
+
+def token_grams(token):
+    """英文、数字索引词的三字片段，不足三个字符时为整词本身；中日韩文字的索引词没有片段"""
+    if note_token_pattern().match(token).group(1):
+        return ()
+    return {token[i:i + 3] for i in range(len(token) - 2)} or (token,)
+
+
+def add_note_token(index, token, part):
+    """索引词增加一个备注片段，新出现的索引词同时加入三字片段索引"""
+    tokens = index['tokens']
+    if token not in tokens:
+        for gram in token_grams(token):
+            add_token_part(index['grams'], gram, token)
+    add_token_part(tokens, token, part)
+
+
+def discard_note_token(index, token, part):
+    """索引词删除一个备注片段，不再有片段的索引词同时从三字片段索引中删除"""
+    tokens = index['tokens']
+    discard_token_part(tokens, token, part)
+    if token not in tokens:
+        for gram in token_grams(token):
+            discard_token_part(index['grams'], gram, token)
+
+
+def build_token_grams(tokens):
+    """由全部索引词重建三字片段索引，旧版本数据文件保存的备注索引没有这一项"""
+    grams = dict()
+    for token in tokens:
+        for gram in token_grams(token):
+            add_token_part(grams, gram, token)
+    return grams
+
+
+def posting_ints(posting):
+    """倒排列表统一为可迭代的 IP 整数序列"""
+    if posting is None:
+        return ()
+    return (posting,) if isinstance(posting, int) else posting
+
+
+def pack_ints(arr):
+    """倒排列表的存储形式：只有一个 IP 时直接存整数"""
+    return arr[0] if len(arr) == 1 else arr
+
+
+def token_parts(parts):
+    """索引词对应的备注片段统一为可迭代的集合"""
+    if parts is None:
+        return ()
+    return (parts,) if isinstance(parts, str) else parts
+
+
+def add_token_part(tokens, token, part):
+    """索引词增加一个备注片段，只有一个片段时直接存字符串"""
+    parts = tokens.get(token)
+    if parts is None:
+        tokens[token] = part
+    elif isinstance(parts, str):
+        if parts != part:
+            tokens[token] = {parts, part}
+    else:
+        parts.add(part)
+
+
+def discard_token_part(tokens, token, part):
+    """索引词删除一个备注片段"""
+    parts = tokens.get(token)
+    if parts == part:
+        del tokens[token]
+    elif isinstance(parts, set):
+        parts.discard(part)
+        if len(parts) == 1:
+            tokens[token] = parts.pop()
+
+
+def build_note_index():
+    """由 ip_dict 整体重建备注倒排索引
+    按 IP 升序遍历，倒排列表依次追加即已有序；每个不同的备注片段只分词一次
+    """
+    parts = dict()
+    for n, value in sorted_items('dict', ip_dict):
+        for part in value:
+            ints = parts.get(part)
+            if ints is None:
+                parts[part] = [n]
+            elif ints[-1] != n:
+                ints.append(n)
+    index = {'size': len(ip_dict), 'parts': parts, 'tokens': dict(), 'grams': dict()}
+    for part, ints in parts.items():
+        parts[part] = pack_ints(array('I', ints))
+        for token in note_tokens(part):
+            add_note_token(index, token, part)
+    return index
+
+
+def update_note_index():
+    """将修改过的备注合并到倒排索引，索引与 ip_dict 数量不一致时整体重建，返回索引"""
+    global note_index
+    index = note_index
+    if 'grams' not in index:
+        index['grams'] = build_token_grams(index['tokens'])
+    if note_changes:
+        # 每个 IP 只需从原有备注的片段中删除、加入当前备注的片段，中间值未进入过索引
+        first = dict()
+        for key, old in note_changes:
+            first.setdefault(key, old)
+        note_changes.clear()
+
+        removed = dict()
+        added = dict()
+        for key, old in first.items():
+            n = ip_to_int(key)
+            if old is None:
+                index['size'] += 1
+                old = ()
+            old = set(old)
+            new = set(ip_dict[key])
+            for part in old - new:
+                removed.setdefault(part, []).append(n)
+            for part in new - old:
+                added.setdefault(part, []).append(n)
+
+        parts = index['parts']
+        for part in removed.keys() | added.keys():
+            exists = part in parts
+            arr = array('I', posting_ints(parts.get(part)))
+            if part in removed:
+                arr = remove_sorted(arr, removed[part])
+            if part in added:
+                arr = merge_sorted(arr, added[part])
+            if arr:
+                parts[part] = pack_ints(arr)
+                if not exists:
+                    for token in note_tokens(part):
+                        add_note_token(index, token, part)
+            elif exists:
+                del parts[part]
+                for token in note_tokens(part):
+                    discard_note_token(index, token, part)
+
+    if index['size'] != len(ip_dict):
+        index = build_note_index()
+    note_index = index
+    return index
+
+
+def parse_note_query(query):
+    """解析 --find-note 的查询条件
+    空白分隔的词需同时出现，'|' 分隔的各组任一满足即可，如 '阿里云 dns | 腾讯云'；
+    返回小写的 [[词, ...], ...]
+    """
+    groups = []
+    for part in query.lower().split('|'):
+        terms = part.split()
+        if terms:
+            groups.append(terms)
+    return groups
+
+
+def note_matches(text, groups):
+    """备注是否满足查询条件：不区分大小写，每个词都是备注的子串"""
+    lowered = text.lower()
+    return any(all(term in lowered for term in terms) for terms in groups)
+
+
+def gram_tokens(grams, run):
+    """包含英文、数字查询词 run 的全部索引词"""
+    if len(run) >= 3:
+        sets = sorted((token_parts(grams.get(gram)) for gram in token_grams(run)), key=len)
+        found = set(sets[0]).intersection(*sets[1:])
+    else:
+        found = set()
+        for gram, tokens in grams.items():
+            if run in gram:
+                found.update(token_parts(tokens))
+    return [token for token in found if run in token]
+
+
+def term_ips(index, term):
+    """倒排索引中备注包含查询词（不区分大小写的子串）的 IP 整数集合
+
+    查询词中的中文取单字、两字索引词；英文、数字的索引词是整词，查询词中的一段可能只是其中一部分
+    （如 dns 之于 googledns），取包含它的全部索引词：由三字片段索引取交集得到候选索引词，
+    不足三个字符的查询只遍历片段索引的 key。各段的候选片段取交集，再按子串核对
+    """
+    tokens = index['tokens']
+    runs = list(note_token_pattern().finditer(term))
+    sets = []
+    for match in runs:
+        run = match.group()
+        if match.group(1):
+            sets.extend(token_parts(tokens.get(token)) for token in note_tokens(run))
+        else:
+            sets.append({part for token in gram_tokens(index['grams'], run) for part in token_parts(tokens[token])})
+    if sets:
+        sets.sort(key=len)
+        candidates = set(sets[0]).intersection(*sets[1:])
+    else:
+        candidates = index['parts']
+    # 查询词只有一段英文、数字，或是不超过两个字的中文时，候选片段必然包含查询词，无需核对
+    exact = len(runs) == 1 and runs[0].group() == term and not (runs[0].group(1) and len(term) > 2)
+    if not exact:
+        candidates = [part for part in candidates if term in part.lower()]
+
+    ips = set()
+    for part in candidates:
+        ips.update(posting_ints(index['parts'][part]))
+    return ips
+
+
+def build_tag_index():
+    """由 ip_tag 整体重建标签倒排索引，按 IP 升序遍历，倒排列表依次追加即已有序"""
+    tags = dict()
+    for n, value in sorted_items('tag', ip_tag):
+        for tag in value:
+            if tag in tags:
+                tags[tag].append(n)
+            else:
+                tags[tag] = [n]
+    for tag, ints in tags.items():
+        tags[tag] = pack_ints(array('I', ints))
+    return {'ips': len(ip_tag), 'tags': tags}
+
+
+def update_tag_index():
+    """将新增的标签合并到标签倒排索引，返回索引
+
+    ip_tag 尚未装载时（-m -t 等只需要索引）直接信任随数据文件保存的索引；
+    已装载时按 IP 数量校验，不一致时整体重建
+    """
+    global tag_index
+    index = tag_index
+    if tag_changes:
+        added = dict()
+        for key, values, new in tag_changes:
+            n = ip_to_int(key)
+            if new:
+                index['ips'] += 1
+            for tag in values:
+                added.setdefault(tag, []).append(n)
+        tag_changes.clear()
+        tags = index['tags']
+        for tag, ints in added.items():
+            tags[tag] = pack_ints(merge_sorted(array('I', posting_ints(tags.get(tag))), ints))
+
+    if index['ips'] < 0 or (not isinstance(ip_tag, LazySection) and index['ips'] != len(ip_tag)):
+        index = build_tag_index()
+    tag_index = index
+    return index
+
+
+def bisect_contains(arr, n):
+    """升序数组中是否包含 n"""
+    i = bisect.bisect_left(arr, n)
+    return i < len(arr) and arr[i] == n
+
+
+def foreach_set(ip_set):
+    """遍历集合"""
+    from pprint import pprint
+    iterator = iter(ip_set)
+
+    # 使用while循环和next函数遍历集合中的元素
+    while True:
+        try:
+            element = next(iterator)
+            pprint(element)
+        except StopIteration:
+            break
+
+
+def foreach_dict(mydict):
+    """遍历字典"""
+    for key, value in mydict.items():
+        print(f"{key}: {value}")
+
+
+def load_data(file_path, sections=tuple(data_sections)):
+    """装载数据到字典
+    sections 中的数据段立即装载，其余数据段在首次访问时装载
+    """
+    global ip_dict, ip_history, ip_tag, ip_range, range_index
+    if not file_path:
+        return
+    if is_sqlite(file_path):
+        load_sqlite(file_path)
+        reset_indexes()
+        range_index = None
+        return
+    # 其他进程合并日志时，等待其完成再读取，避免读到新数据文件加旧日志
+    lock = journal_lock(file_path, shared=True) if os.path.exists(file_path + '.lock') else contextlib.nullcontext()
+    with lock:
+        load_snapshot(file_path, sections)
+        replay_journal(file_path)
+    range_index = None
+
+
+class LazySection:
+    """尚未装载的数据段，首次访问时装载并替换对应的全局变量
+
+    装载前新增的历史版本及重放日志时的标签记录先暂存，装载后再应用，
+    这样 -a 重放导入日志时不必装载历史与标签
+    """
+
+    def __init__(self, name, loader):
+        self.name = name
+        self.loader = loader
+        self.writable = False
+        self.overlay = False
+        self.added = []
+        self.records = []
+
+    def load(self):
+        var = data_sections[self.name]
+        value = globals()[var]
+        if value is not self:
+            return value
+        value = self.loader()
+        if self.writable:
+            value = materialize_section(value)
+        elif self.overlay or self.added or self.records:
+            value = overlay_section(value)
+        globals()[var] = value
+        for item in self.added:
+            add_history(*item)
+        for record in self.records:
+            apply_record(*record)
+        return value
+
+    def add(self, item):
+        self.added.append(item)
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+    def __contains__(self, key):
+        return key in self.load()
+
+    def __iter__(self):
+        return iter(self.load())
+
+    def __len__(self):
+        return len(self.load())
+
+    def __bool__(self):
+        return bool(self.load())
+
+    def __getitem__(self, key):
+        return self.load()[key]
+
+    def __setitem__(self, key, value):
+        self.load()[key] = value
+
+    def __delitem__(self, key):
+        del self.load()[key]
+
+
+def load_snapshot(file_path, sections=tuple(data_sections)):
+    """装载数据文件本身，不含导入日志"""
+    global ip_dict, ip_history, ip_tag, ip_range, ip_added, pickle_file
+    reset_indexes()
+    if is_ipdb(file_path):
+        if os.path.exists(file_path):
+            load_ipdb(file_path, sections)
+        return
+    if not os.path.exists(file_path):
+        return
+    close_snapshot()
+    file = open(file_path, 'rb')
+    loaded_data = pickle.load(file)
+    if isinstance(loaded_data, list):
+        # 旧格式，整体装载，没有导入时间
+        file.close()
+        ip_added = dict()
+        ip_dict = loaded_data[0]
+        ip_history = upgrade_history(loaded_data[1], os.path.getmtime(file_path))
+        try:
+            # 新增加的字段
+            ip_tag = loaded_data[2]
+            ip_range = loaded_data[3]
+        except:
+            pass
+        return
+
+    pickle_file = (file, file.tell(), loaded_data['sections'])
+    for name in data_sections:
+        section = LazySection(name, functools.partial(load_pickle_section, name))
+        globals()[data_sections[name]] = section
+        if name in sections:
+            section.load()
+
+
+def load_pickle_section(name):
+    """从 pickle 数据文件中读取一个数据段"""
+    file, base, index = pickle_file
+    if name not in index:
+        # 旧版本的数据文件没有索引数据段，用到时重建
+        return empty_section(name)
+    offset, length = index[name]
+    file.seek(base + offset)
+    value = restore_section(pickle.loads(file.read(length)))
+    if name == 'history':
+        value = upgrade_history(value, os.fstat(file.fileno()).st_mtime)
+    return value
+
+
+def upgrade_history(history, when):
+    """旧版本的历史集合 {('192.168.1.1', '备注1', ...), ...} 转为按 key 分组的历史版本
+    旧记录没有时间，按数据文件的修改时间计；已是新格式时原样返回
+    """
+    if isinstance(history, dict):
+        return history
+    when = int(when)
+    versions = dict()
+    for item in sorted(history):
+        if item[0] in versions:
+            versions[item[0]].append((when, item[1:]))
+        else:
+            versions[item[0]] = [(when, item[1:])]
+    return versions
+
+
+def materialize_section(value):
+    """mmap 只读数据转为可修改的数据
+    备注与标签转为紧凑结构，ipdb 中的 IP 已排序，数组直接复制；每个不同的字符串只解码一次；
+    重放导入日志的覆盖层先转换原数据，再应用其中的修改
+    """
+    if isinstance(value, JournalOverlay):
+        data = materialize_section(value.base)
+        for key, item in value.changes.items():
+            if item is None:
+                data.pop(key, None)
+            else:
+                data[key] = item
+        return data
+    if isinstance(value, (MappedNotes, MappedTags)):
+        compact = CompactNotes() if isinstance(value, MappedNotes) else CompactTags()
+        compact.load_sorted(value.keys, value.ids, lambda i: value.db.string(i).split(' '))
+        return compact
+    if isinstance(value, MappedHistory):
+        history = dict()
+        for key, when, notes in value.rows():
+            if key in history:
+                history[key].append((when, notes))
+            else:
+                history[key] = [(when, notes)]
+        return history
+    if isinstance(value, MappedAdded):
+        # 单个 IP 的 key 在 ipdb 中已按 IP 排序，直接装入紧凑结构
+        single = [i == compact_deleted for i in value.ids]
+        times = CompactTimes()
+        times.load_sorted(itertools.compress(value.keys, single), itertools.compress(value.times, single), int)
+        times.others = {value.db.string(i): when for i, when in zip(value.ids, value.times) if i != compact_deleted}
+        return times
+    return value
+
+
+class JournalOverlay(collections.abc.MutableMapping):
+    """只读的 mmap 数据段上的修改，重放导入日志时使用，不必把整个数据段复制到内存
+
+    changes 中是修改过的 key 及其新值，值为 None 表示已删除；其余 key 从原数据 base 中读取。
+    导入日志在积累到一定大小、记录数或时间后合并到数据文件，覆盖层始终较小
+    """
+
+    def __init__(self, base):
+        self.base = base
+        self.changes = dict()
+        # 原数据中没有、修改后新增的 key 数减去删除的原有 key 数
+        self.extra = 0
+
+    def __getitem__(self, key):
+        if key in self.changes:
+            value = self.changes[key]
+            if value is None:
+                raise KeyError(key)
+            return value
+        return self.base[key]
+
+    def __contains__(self, key):
+        if key in self.changes:
+            return self.changes[key] is not None
+        return key in self.base
+
+    def __setitem__(self, key, value):
+        if key not in self:
+            self.extra += 1
+        self.changes[key] = value
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self.extra -= 1
+        self.changes[key] = None
+
+    def __iter__(self):
+        changes = self.changes
+        for key in self.base:
+            if changes.get(key, key) is not None:
+                yield key
+        for key, value in changes.items():
+            if value is not None and key not in self.base:
+                yield key
+
+    def __len__(self):
+        return len(self.base) + self.extra
+
+
+def overlay_section(value):
+    """只读的 mmap 数据段包上 JournalOverlay，其他数据本身可以修改，原样返回"""
+    if isinstance(value, MappedSection):
+        return JournalOverlay(value)
+    return value
+
+
+def overlay_data():
+    """重放导入日志前调用：只读数据段的修改记在覆盖层中，未装载的数据段在装载时再包上覆盖层"""
+    for name, var in data_sections.items():
+        value = globals()[var]
+        if isinstance(value, LazySection):
+            value.overlay = True
+        else:
+            globals()[var] = overlay_section(value)
+
+
+def materialize_data():
+    """将只读数据转为普通的字典与集合，修改数据前调用
+    未装载的数据段在装载时再转换
+    """
+    for name, var in data_sections.items():
+        value = globals()[var]
+        if isinstance(value, LazySection):
+            value.writable = True
+        else:
+            globals()[var] = materialize_section(value)
+
+
+def release_snapshot():
+    """装载全部数据段并转为普通的字典与集合，然后关闭打开的数据文件
+    重写数据文件前调用
+    """
+    for name, var in data_sections.items():
+        value = globals()[var]
+        if isinstance(value, LazySection):
+            value = value.load()
+        globals()[var] = materialize_section(value)
+    close_snapshot()
+
+
+def close_snapshot():
+    """关闭打开的数据文件，重新装载前调用"""
+    global pickle_file, ipdb_file
+    if pickle_file:
+        pickle_file[0].close()
+        pickle_file = None
+    if ipdb_file:
+        ipdb_file.close()
+        ipdb_file = None
+
+
+def save_data(file_path):
+    """存盘，整体写入数据文件，导入日志已包含在内存数据中，一并清除"""
+    if is_sqlite(file_path):
+        save_sqlite(file_path)
+        return
+    global journal_records
+    with journal_lock(file_path):
+        write_snapshot(file_path)
+        if os.path.exists(file_path + '.journal'):
+            os.remove(file_path + '.journal')
+    pending_records.clear()
+    journal_records = 0
+
+
+# Windows 下数据文件被其他进程打开或映射时无法替换，替换失败后重试的最长时间（秒）
+replace_timeout = 10.0
+
+
+def replace_file(tmp_path, file_path):
+    """用写好的临时文件原子替换数据文件
+    Windows 下其他进程（如正在运行的 -a）打开或映射着数据文件时替换会失败，等待其退出，间隔逐次加倍，
+    最多重试 replace_timeout 秒；长时间运行的 --follow、--serve 装载后不再持有数据文件，见 unpin_snapshot
+    """
+    deadline = time.monotonic() + replace_timeout
+    interval = 0.05
+    while True:
+        try:
+            os.replace(tmp_path, file_path)
+            return
+        except PermissionError:
+            if os.name != 'nt' or time.monotonic() >= deadline:
+                raise
+            time.sleep(interval)
+            interval = min(interval * 2, 1.0)
+
+
+def unpin_snapshot():
+    """Windows 下打开或映射中的文件不能被替换，长时间运行的进程装载后把全部数据段读入内存并关闭数据文件，
+    其他进程合并日志、存盘时不必等待其退出；其他系统上替换不受影响，保持按需装载
+    """
+    global ip_dict
+    if os.name != 'nt':
+        return
+    # --at 视图引用着装载的备注，一并换成内存中的数据
+    view = ip_dict if isinstance(ip_dict, NotesAt) else None
+    if view is not None:
+        ip_dict = view.notes
+    release_snapshot()
+    if view is not None:
+        view.notes = ip_dict
+        ip_dict = view
+
+
+def write_snapshot(file_path):
+    """整体写入数据文件，先写临时文件再替换
+    IP 较多的备注与标签以紧凑结构保存，装载时不必逐个 IP 重建元组与集合
+    """
+    global ip_dict, ip_tag, ip_added
+    if is_ipdb(file_path):
+        save_ipdb(file_path)
+        return
+    release_snapshot()
+    ip_dict = compact_section(ip_dict, CompactNotes)
+    ip_tag = compact_section(ip_tag, CompactTags)
+    ip_added = compact_section(ip_added, CompactTimes)
+    # 排序索引合并新增的 key、校验后一并保存，下次导出时不必重新排序
+    sorted_order('dict', ip_dict, len(ip_dict))
+    sorted_order('tag', ip_tag, len(ip_tag))
+    ips = [key for key in ip_history if is_ipv4(key)]
+    sorted_order('history', ips, len(ips))
+    update_note_index()
+    update_tag_index()
+
+    # 数据段分别序列化，文件头记录各段位置，装载时可只读取需要的数据段
+    blobs = []
+    index = dict()
+    offset = 0
+    for name, var in data_sections.items():
+        blob = pickle.dumps(dump_section(globals()[var]))
+        index[name] = (offset, len(blob))
+        offset += len(blob)
+        blobs.append(blob)
+
+    tmp_path = file_path + '.tmp'
+    with open(tmp_path, 'wb') as file:
+        pickle.dump({'version': 2, 'sections': index}, file)
+        for blob in blobs:
+            file.write(blob)
+    replace_file(tmp_path, file_path)
+
+
+@contextlib.contextmanager
+def journal_lock(file_path, shared=False):
+    """数据文件的建议锁，追加日志与合并日志时持有，读取时以 shared 持有
+
+    Windows 的 msvcrt 没有共享锁，shared 也是排他锁：同时装载数据的进程依次等待，
+    LK_LOCK 最多重试 10 秒，超时抛出 OSError
+    """
+    with open(file_path + '.lock', 'a+b') as f:
+        if os.name == 'nt':
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            fcntl.flock(f.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def add_history(key, when, notes):
+    """key 的备注在时间戳 when 被替换，旧备注 notes 存为历史版本"""
+    history = ip_history
+    if isinstance(history, (LazySection, SqliteHistory)):
+        history.add((key, when, notes))
+        return
+    versions = history.get(key)
+    if versions is None:
+        history[key] = versions = [(when, notes)]
+    else:
+        # 多个进程的导入日志可能交错，保持按时间排列
+        i = len(versions)
+        while i and versions[i - 1][0] > when:
+            i -= 1
+        versions.insert(i, (when, notes))
+        if isinstance(history, JournalOverlay):
+            # 覆盖层从原数据取出的是新列表，修改后写回
+            history[key] = versions
+    index_history(key, when, len(versions))
+
+
+def index_history(key, when, count):
+    """key 新增了一个在 when 被替换的版本，现有 count 个版本，更新时间索引；索引尚未建立时不必更新"""
+    index = history_index
+    if index['total'] < 0:
+        return
+    times, keys = index['times'], index['keys']
+    if not times or times[-1] <= when:
+        times.append(int(when))
+        keys.append(key)
+    else:
+        i = bisect.bisect_right(times, when)
+        times.insert(i, int(when))
+        keys.insert(i, key)
+    move_history_count(key, count - 1, count)
+    index['total'] += 1
+
+
+def move_history_count(key, old, new):
+    """key 的版本数由 old 变为 new，更新时间索引中按版本数分组的 key"""
+    counts = history_index['counts']
+    if old > 1:
+        group = counts[old]
+        group.discard(key)
+        if not group:
+            del counts[old]
+    if new > 1:
+        counts.setdefault(new, set()).add(key)
+
+
+def build_history_index(history):
+    """遍历全部历史版本建立时间索引，旧数据文件及过时条目过多时调用"""
+    global history_index
+    times, keys = array('I'), []
+    counts = dict()
+    for key, versions in history.items():
+        times.extend([when for when, _ in versions])
+        keys.extend([key] * len(versions))
+        if len(versions) > 1:
+            counts.setdefault(len(versions), set()).add(key)
+    # 按时间取下标排序，比按 (时间, key) 元组排序快
+    order = sorted(range(len(times)), key=times.__getitem__)
+    history_index = {'times': array('I', [times[i] for i in order]), 'keys': [keys[i] for i in order],
+                     'counts': counts, 'total': len(order)}
+    return history_index
+
+
+def apply_record(op, key, values, when=None):
+    """将一条修改记录应用到内存数据，导入与重放日志共用
+    when 为导入时间戳，被替换的备注以此时间存入历史，不指定时使用当前时间
+    """
+    global range_index
+    if when is None:
+        when = int(time.time())
+    if op == 'note':
+        if key in ip_dict:
+            old_ip = ip_dict[key]
+            if values != old_ip:
+                ip_dict[key] = values
+                add_history(key, when, old_ip)
+                order_added['history'].append(key)
+                note_changes.append((key, old_ip))
+        else:
+            ip_dict[key] = values
+            ip_added[key] = when
+            order_added['dict'].append(key)
+            note_changes.append((key, None))
+    elif op == 'tag':
+        if key in ip_tag:
+            current = ip_tag[key]
+            new_tags = tuple(i for i in values if i not in current)
+            if new_tags:
+                # 紧凑结构取出的是新集合，合并后赋值回去
+                ip_tag[key] = current.union(new_tags)
+                tag_changes.append((key, new_tags, False))
+        else:
+            ip_tag[key] = set(values)
+            order_added['tag'].append(key)
+            tag_changes.append((key, values, True))
+    elif op == 'range':
+        # 网段/范围备注，与单个 IP 一样保留历史
+        if key not in ip_range:
+            ip_added[key] = when
+        elif values != ip_range[key]:
+            add_history(key, when, ip_range[key])
+        ip_range[key] = values
+        range_index = None
+
+
+def replay_journal(file_path):
+    """在已装载的数据上重放导入日志
+
+    记录只描述“设置备注/添加标签”，历史在重放时按当前数据推导，
+    重复重放同一条记录不会改变结果。'time 时间戳' 行给出其后各记录的导入时间，
+    没有该行的旧日志按日志文件的修改时间计；
+    ipdb 的只读数据段不复制到内存，修改记在覆盖层中（见 JournalOverlay）
+    """
+    global journal_records
+    journal_records = 0
+    journal = file_path + '.journal'
+    if not os.path.exists(journal) or not os.path.getsize(journal):
+        return
+    overlay_data()
+    when = int(os.path.getmtime(journal))
+    with open(journal, 'r', encoding='utf-8') as f:
+        for line in f:
+            record = line.split()
+            if len(record) == 2 and record[0] == 'time' and record[1].isdigit():
+                when = int(record[1])
+                continue
+            # 写入中断留下的不完整行
+            if not line.endswith('\n') or len(record) < 3 or record[0] not in ('note', 'tag', 'range'):
+                continue
+            op, key, values = record[0], record[1], tuple(record[2:])
+            journal_records += 1
+            if op == 'tag' and isinstance(ip_tag, LazySection):
+                ip_tag.records.append((op, key, values))
+                # 标签索引不必等 ip_tag 装载，重复合并同一标签不影响结果
+                tag_changes.append((key, values, None))
+            else:
+                apply_record(op, key, values, when)
+
+
+def save_changes(file_path):
+    """保存本次导入的修改
+
+    SQLite 只写入变化的行；其他格式把修改记录追加到导入日志，
+    不重写数据文件，日志过大时在后台合并
+    """
+    if is_sqlite(file_path):
+        save_sqlite(file_path)
+        pending_records.clear()
+        return
+    if not pending_records:
+        return
+    # 备注和标签都按空白切分而来，不含空白，日志每行就是 “操作 IP 值...”；
+    # 导入时间变化时先写一行 “time 时间戳”，旧版本读取时按不完整的行跳过
+    lines = []
+    last = None
+    for op, key, values, when in pending_records:
+        if when != last:
+            lines.append(f'time {when}\n')
+            last = when
+        lines.append(' '.join((op, key) + values) + '\n')
+    lines = ''.join(lines)
+    journal = file_path + '.journal'
+    with journal_lock(file_path):
+        with open(journal, 'a', encoding='utf-8') as f:
+            f.write(lines)
+            f.flush()
+            os.fsync(f.fileno())
+        size = os.path.getsize(journal)
+        started = journal_started(journal)
+    records = journal_records + len(pending_records)
+    pending_records.clear()
+    if size > journal_compact_size or records > journal_compact_records \
+            or (started is not None and time.time() - started > journal_compact_age):
+        compact_in_background(file_path)
+
+
+def journal_started(journal):
+    """导入日志中最早记录的导入时间，即第一行 'time 时间戳'；旧格式的日志没有时返回 None"""
+    with open(journal, 'r', encoding='utf-8') as f:
+        record = f.readline().split()
+    if len(record) == 2 and record[0] == 'time' and record[1].isdigit():
+        return int(record[1])
+    return None
+
+
+def compact_data(file_path):
+    """合并导入日志到数据文件，持有锁期间其他进程不能追加"""
+    if is_sqlite(file_path):
+        return
+    with journal_lock(file_path):
+        journal = file_path + '.journal'
+        if not os.path.exists(journal):
+            return
+        load_snapshot(file_path)
+        replay_journal(file_path)
+        write_snapshot(file_path)
+        os.remove(journal)
+
+
+def compact_in_background(file_path):
+    """启动独立进程执行 --compact"""
+    import subprocess
+    if getattr(sys, 'frozen', False):
+        cmd = [sys.executable]
+    else:
+        # 经启动脚本运行，使用字节码缓存
+        cmd = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ip_notes.py')]
+    cmd += ['--compact', '--data_file', file_path]
+    subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+# ipdb 数据文件格式（小端）
+# 文件头: 'IPDB' 版本号 段数
+# 段表: 每段 (段名, 偏移, 条目数)
+# DICT/HIST/TAGS/RANG 段: uint32 IP 数组（已排序）+ uint32 字符串编号数组
+# HTIM 段: uint32 时间戳数组，与 HIST 段逐条对应，为该历史版本被替换的时间
+# ADDK 段: ip_added 的 uint32 起始 IP 数组 + 字符串编号数组，单个 IP 的编号为 0xffffffff，网段/范围为 key 的编号
+# ATIM 段: uint32 时间戳数组，与 ADDK 段逐条对应，为该 key 第一个已知版本的导入时间
+# STRS 段: uint32 偏移数组（条目数+1）+ UTF-8 字符串内容，相同字符串只存一份
+# 字符串内容：DICT 为备注，TAGS 为标签，HIST/RANG 为 key 加备注，均以空格连接
+# HIST 段按 (起始IP, key, 时间) 排序，同一 key 的各版本相邻
+ipdb_magic = b'IPDB'
+ipdb_version = 1
+ipdb_header = struct.Struct('<4sII')
+ipdb_section = struct.Struct('<4sQI')
+
+# 当前映射的 ipdb 文件，由 load_ipdb 打开，materialize_data 关闭
+ipdb_file = None
+
+
+def is_ipdb(file_path):
+    """是否是 ipdb 格式数据文件"""
+    return file_path.endswith('.ipdb')
+
+
+def uint32_array(values):
+    """生成小端 uint32 数组"""
+    arr = array('I', values)
+    if sys.byteorder == 'big':
+        arr.byteswap()
+    return arr
+
+
+class IpdbFile:
+    """以 mmap 方式打开的 ipdb 文件，按段二分查找，不做整体反序列化"""
+
+    def __init__(self, file_path):
+        self.file = open(file_path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count = ipdb_header.unpack_from(self.map, 0)
+        if magic != ipdb_magic or version != ipdb_version:
+            raise ValueError(f'{file_path} is not a ipdb v{ipdb_version} file')
+        self.sections = dict()
+        for i in range(count):
+            name, offset, n = ipdb_section.unpack_from(self.map, ipdb_header.size + i * ipdb_section.size)
+            self.sections[name.decode('ascii')] = (offset, n)
+
+        offset, n = self.sections['STRS']
+        self.str_offsets = self.uint32_view(offset, n + 1)
+        self.str_base = offset + (n + 1) * 4
+
+    def uint32_view(self, offset, n):
+        view = memoryview(self.map)[offset:offset + n * 4]
+        if sys.byteorder == 'big':
+            arr = array('I', view)
+            arr.byteswap()
+            return arr
+        return view.cast('I')
+
+    def section(self, name):
+        """返回段的 (IP 数组, 字符串编号数组)"""
+        offset, n = self.sections[name]
+        return self.uint32_view(offset, n), self.uint32_view(offset + n * 4, n)
+
+    def column(self, name):
+        """返回只有一个 uint32 数组的段，文件中没有该段时返回 None"""
+        if name not in self.sections:
+            return None
+        offset, n = self.sections[name]
+        return self.uint32_view(offset, n)
+
+    def string(self, i):
+        start = self.str_base + self.str_offsets[i]
+        end = self.str_base + self.str_offsets[i + 1]
+        return self.map[start:end].decode('utf-8')
+
+    def close(self):
+        self.str_offsets = None
+        try:
+            self.map.close()
+        except BufferError:
+            # 仍有数据段引用映射内容，随对象回收时释放
+            pass
+        self.file.close()
+
+
+class MappedSection:
+    """ipdb 段的公共操作"""
+
+    def __init__(self, db, name):
+        self.db = db
+        self.keys, self.ids = db.section(name)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def find(self, ip):
+        """返回 IP 在段中的下标范围，IP 不规范时返回空范围"""
+        try:
+            n = ip_to_int(ip)
+        except (ValueError, AttributeError):
+            return 0, 0
+        lo = bisect.bisect_left(self.keys, n)
+        hi = bisect.bisect_right(self.keys, n, lo)
+        if lo < hi and int_to_ip(n) != ip:
+            return 0, 0
+        return lo, hi
+
+    def strings(self, lo, hi):
+        return [self.db.string(self.ids[i]) for i in range(lo, hi)]
+
+
+class MappedNotes(MappedSection, collections.abc.Mapping):
+    """只读的 ip_dict，IP 有序"""
+
+    def __init__(self, db):
+        super().__init__(db, 'DICT')
+
+    def __getitem__(self, ip):
+        lo, hi = self.find(ip)
+        if lo == hi:
+            raise KeyError(ip)
+        return tuple(self.db.string(self.ids[lo]).split(' '))
+
+    def __iter__(self):
+        for n in self.keys:
+            yield int_to_ip(n)
+
+
+class MappedHistory(MappedSection, collections.abc.Mapping):
+    """只读的 ip_history，按起始 IP 排序，key 对应按时间排列的历史版本"""
+
+    def __init__(self, db):
+        super().__init__(db, 'HIST')
+        self.times = db.column('HTIM')
+        # 旧版本的 ipdb 文件没有时间段，按文件的修改时间计
+        self.default_time = int(os.fstat(db.file.fileno()).st_mtime)
+        self.size = None
+
+    def version(self, i):
+        """第 i 条记录，返回 (key, 时间, 备注元组)"""
+        key, _, note = self.db.string(self.ids[i]).partition(' ')
+        return key, self.time(i), tuple(note.split(' '))
+
+    def rows(self):
+        """按存储顺序遍历全部历史版本"""
+        for i in range(len(self.keys)):
+            yield self.version(i)
+
+    def key(self, i):
+        return self.db.string(self.ids[i]).partition(' ')[0]
+
+    def span(self, key):
+        """key 的各版本在段中的下标范围
+        同一起始 IP 下按 key 排序、同一 key 的版本相邻，两次二分查找即可，不逐条读取
+        """
+        start = ip_sort_key(key)[0]
+        lo = bisect.bisect_left(self.keys, start)
+        hi = bisect.bisect_right(self.keys, start, lo)
+        end = hi
+        while lo < end:
+            mid = (lo + end) // 2
+            if self.key(mid) < key:
+                lo = mid + 1
+            else:
+                end = mid
+        end = lo
+        while end < hi:
+            mid = (end + hi) // 2
+            if self.key(mid) == key:
+                end = mid + 1
+            else:
+                hi = mid
+        return lo, end
+
+    def time(self, i):
+        return self.default_time if self.times is None else self.times[i]
+
+    def version_at(self, key, when):
+        """key 在时间戳 when 之后才被替换的第一个版本的备注，没有时返回 None"""
+        lo, hi = self.span(key)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.time(mid) > when:
+                hi = mid
+            else:
+                lo = mid + 1
+        if lo == self.span(key)[1]:
+            return None
+        return self.version(lo)[2]
+
+    def __getitem__(self, key):
+        lo, hi = self.span(key)
+        if lo == hi:
+            raise KeyError(key)
+        return [self.version(i)[1:] for i in range(lo, hi)]
+
+    def __iter__(self):
+        # 同一起始 IP 下可能有单个 IP 与网段等多个 key
+        start = None
+        seen = set()
+        for i, n in enumerate(self.keys):
+            if n != start:
+                start = n
+                seen.clear()
+            key = self.db.string(self.ids[i]).partition(' ')[0]
+            if key not in seen:
+                seen.add(key)
+                yield key
+
+    def __len__(self):
+        if self.size is None:
+            self.size = sum(1 for _ in self)
+        return self.size
+
+
+class MappedTags(MappedSection, collections.abc.Mapping):
+    """只读的 ip_tag，IP 有序"""
+
+    def __init__(self, db):
+        super().__init__(db, 'TAGS')
+
+    def __getitem__(self, ip):
+        lo, hi = self.find(ip)
+        if lo == hi:
+            raise KeyError(ip)
+        return set(self.db.string(self.ids[lo]).split(' '))
+
+    def __iter__(self):
+        for n in self.keys:
+            yield int_to_ip(n)
+
+
+class MappedAdded(MappedSection, collections.abc.Mapping):
+    """只读的 ip_added，按起始 IP 排序，单个 IP 的 key 不存字符串"""
+
+    def __init__(self, db):
+        super().__init__(db, 'ADDK')
+        self.times = db.column('ATIM')
+
+    def key(self, i):
+        j = self.ids[i]
+        return int_to_ip(self.keys[i]) if j == compact_deleted else self.db.string(j)
+
+    def __getitem__(self, key):
+        start = ip_sort_key(key)[0]
+        lo = bisect.bisect_left(self.keys, start)
+        hi = bisect.bisect_right(self.keys, start, lo)
+        # 同一起始 IP 下只有该 IP 本身及少数网段/范围
+        for i in range(lo, hi):
+            if self.key(i) == key:
+                return self.times[i]
+        raise KeyError(key)
+
+    def __iter__(self):
+        for i in range(len(self.keys)):
+            yield self.key(i)
+
+
+def load_ipdb_added(db):
+    """旧版本的 ipdb 文件没有导入时间段"""
+    return MappedAdded(db) if 'ADDK' in db.sections else dict()
+
+
+def load_ipdb(file_path, sections=tuple(data_sections)):
+    """以 mmap 方式装载 ipdb 数据文件，查询时二分查找"""
+    global ipdb_file
+    close_snapshot()
+    ipdb_file = IpdbFile(file_path)
+    loaders = {
+        'dict': functools.partial(MappedNotes, ipdb_file),
+        'history': functools.partial(MappedHistory, ipdb_file),
+        'tag': functools.partial(MappedTags, ipdb_file),
+        'range': functools.partial(load_ipdb_range, ipdb_file),
+        'added': functools.partial(load_ipdb_added, ipdb_file),
+    }
+    for name, loader in loaders.items():
+        section = LazySection(name, loader)
+        globals()[data_sections[name]] = section
+        if name in sections:
+            section.load()
+
+
+def load_ipdb_range(db):
+    """网段数量少，直接展开为字典"""
+    ranges = dict()
+    keys, ids = db.section('RANG')
+    for i in ids:
+        item = db.string(i).split(' ')
+        ranges[item[0]] = tuple(item[1:])
+    return ranges
+
+
+def save_ipdb(file_path):
+    """保存为 ipdb 格式，先写临时文件再替换"""
+    release_snapshot()
+    strings = dict()
+
+    def string_id(text):
+        if text not in strings:
+            strings[text] = len(strings)
+        return strings[text]
+
+    sections = []
+    rows = sorted((ip_to_int(k), string_id(' '.join(v))) for k, v in ip_dict.items())
+    sections.append(('DICT', rows))
+    # 同一 key 的版本保持原有的时间顺序
+    history = sorted((ip_sort_key(key)[0], key, i, when, ' '.join((key,) + notes))
+                     for key, versions in ip_history.items() for i, (when, notes) in enumerate(versions))
+    sections.append(('HIST', [(n, string_id(text)) for n, _, _, _, text in history]))
+    rows = sorted((ip_to_int(k), string_id(' '.join(sorted(v)))) for k, v in ip_tag.items())
+    sections.append(('TAGS', rows))
+    rows = sorted((range_bounds(k)[0], string_id(' '.join((k,) + tuple(v)))) for k, v in ip_range.items())
+    sections.append(('RANG', rows))
+    added = sorted((ip_sort_key(key)[0], key, when) for key, when in ip_added.items())
+    sections.append(('ADDK', [(n, compact_deleted if is_ipv4(key) else string_id(key)) for n, key, _ in added]))
+
+    blobs = [text.encode('utf-8') for text in strings]
+    offsets = [0]
+    for blob in blobs:
+        offsets.append(offsets[-1] + len(blob))
+
+    payloads = []
+    for name, rows in sections:
+        payloads.append((name, len(rows), [uint32_array(k for k, _ in rows).tobytes(),
+                                           uint32_array(i for _, i in rows).tobytes()]))
+    payloads.append(('HTIM', len(history), [uint32_array(when for _, _, _, when, _ in history).tobytes()]))
+    payloads.append(('ATIM', len(added), [uint32_array(when for _, _, when in added).tobytes()]))
+    payloads.append(('STRS', len(blobs), [uint32_array(offsets).tobytes(), b''.join(blobs)]))
+
+    tmp_path = file_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        table_size = ipdb_header.size + ipdb_section.size * len(payloads)
+        f.write(ipdb_header.pack(ipdb_magic, ipdb_version, len(payloads)))
+        offset = table_size
+        for name, n, parts in payloads:
+            offset += -offset % 8
+            f.write(ipdb_section.pack(name.encode('ascii'), offset, n))
+            offset += sum(len(part) for part in parts)
+        for name, n, parts in payloads:
+            f.write(b'\0' * (-f.tell() % 8))
+            for part in parts:
+                f.write(part)
+    replace_file(tmp_path, file_path)
+
+
+def migrate_data(file_path):
+    """将 pickle 数据文件转为同目录下的 ipdb 文件"""
+    base = os.path.splitext(file_path)[0]
+    source, target = base + '.pkl', base + '.ipdb'
+    if not os.path.exists(source):
+        print(f"The file at {source} does not exist.")
+        return
+    load_data(source)
+    save_ipdb(target)
+    print(f'{source} -> {target}')
+
+
+# ip_dict/ip_tag 的 IP 数不少于该值时，存盘前转为紧凑结构，以紧凑结构存入 pickle 数据文件
+compact_min_size = 1 << 16
+
+# 紧凑结构中已删除条目的值编号
+compact_deleted = (1 << 32) - 1
+
+
+class CompactItems(collections.abc.ItemsView):
+    """按 IP 顺序直接遍历数组，不逐个 key 二分查找"""
+
+    def __iter__(self):
+        return self._mapping.iter_items()
+
+
+class CompactValues(collections.abc.ValuesView):
+    def __iter__(self):
+        return (value for _, value in self._mapping.iter_items())
+
+
+class CompactSection(collections.abc.MutableMapping):
+    """IP 以 uint32 数组保存的数据段，值去重后存入值表，数组中只存值编号
+
+    keys 为升序的 IP 整数，ids 为对应的值编号；新增的 IP 先放在 added 中，
+    遍历或积累较多时再合并到数组；删除只把编号置为 compact_deleted，合并时去掉。
+    被替换的值仍留在值表中，同一值多半还被其他 IP 或历史版本引用
+    """
+
+    def __init__(self):
+        self.keys = array('I')
+        self.ids = array('I')
+        self.added = dict()
+        self.deleted = 0
+        self.table = []
+        self.table_ids = dict()
+
+    def intern(self, value):
+        """返回值的编号，新值加入值表"""
+        raise NotImplementedError
+
+    def decode(self, i):
+        """编号为 i 的值"""
+        raise NotImplementedError
+
+    def load_sorted(self, keys, ids, value):
+        """由升序的 IP 数组及外部值编号数组整体装载，value(外部编号) 返回对应的值，每个外部编号只调用一次"""
+        local = dict()
+        converted = array('I')
+        for i in ids:
+            j = local.get(i)
+            if j is None:
+                j = local[i] = self.intern(value(i))
+            converted.append(j)
+        self.keys = array('I', keys)
+        self.ids = converted
+        self.added.clear()
+        self.deleted = 0
+
+    def load_items(self, items):
+        """由 (IP, 值) 整体装载，IP 须为规范的 IPv4
+        IP 与值编号合成一个整数排序，比按元组排序快
+        """
+        keys = []
+        ids = array('I')
+        for key, value in items:
+            keys.append(key)
+            ids.append(self.intern(value))
+        rows = sorted([n << 32 | i for n, i in zip(ips_to_ints(keys), ids)])
+        self.keys = array('I', [row >> 32 for row in rows])
+        self.ids = array('I', [row & 0xffffffff for row in rows])
+        self.added.clear()
+        self.deleted = 0
+
+    def position(self, n):
+        """IP 整数在数组中的下标（含已删除的条目），不在数组中时返回 -1"""
+        i = bisect.bisect_left(self.keys, n)
+        if i < len(self.keys) and self.keys[i] == n:
+            return i
+        return -1
+
+    def value_id(self, key):
+        """key 的值编号，不存在时返回 None；只在找到时核对 key 是否为规范写法"""
+        try:
+            n = ip_to_int(key)
+        except (ValueError, AttributeError):
+            return None
+        i = self.added.get(n)
+        if i is None:
+            pos = bisect.bisect_left(self.keys, n)
+            if pos == len(self.keys) or self.keys[pos] != n or self.ids[pos] == compact_deleted:
+                return None
+            i = self.ids[pos]
+        return i if int_to_ip(n) == key else None
+
+    def __getitem__(self, key):
+        i = self.value_id(key)
+        if i is None:
+            raise KeyError(key)
+        return self.decode(i)
+
+    def __contains__(self, key):
+        return self.value_id(key) is not None
+
+    def __setitem__(self, key, value):
+        n = sqlite_ip(key)
+        if n is None:
+            raise ValueError(f'not a IPv4 address: {key!r}')
+        i = self.intern(value)
+        pos = self.position(n)
+        if pos < 0:
+            self.added[n] = i
+            if len(self.added) > max(4096, len(self.keys) >> 3):
+                self.merge()
+            return
+        if self.ids[pos] == compact_deleted:
+            self.deleted -= 1
+        self.ids[pos] = i
+
+    def __delitem__(self, key):
+        n = sqlite_ip(key)
+        if n in self.added:
+            del self.added[n]
+            return
+        pos = -1 if n is None else self.position(n)
+        if pos < 0 or self.ids[pos] == compact_deleted:
+            raise KeyError(key)
+        self.ids[pos] = compact_deleted
+        self.deleted += 1
+
+    def __len__(self):
+        return len(self.keys) - self.deleted + len(self.added)
+
+    def merge(self):
+        """把新增的 IP 合并到数组，并去掉已删除的条目"""
+        if self.deleted:
+            rows = [(n, i) for n, i in zip(self.keys, self.ids) if i != compact_deleted]
+            self.keys = array('I', (n for n, _ in rows))
+            self.ids = array('I', (i for _, i in rows))
+            self.deleted = 0
+        if not self.added:
+            return
+        keys, ids = array('I'), array('I')
+        start = 0
+        for n, i in sorted(self.added.items()):
+            j = bisect.bisect_left(self.keys, n, start)
+            keys.extend(self.keys[start:j])
+            ids.extend(self.ids[start:j])
+            keys.append(n)
+            ids.append(i)
+            start = j
+        keys.extend(self.keys[start:])
+        ids.extend(self.ids[start:])
+        self.keys, self.ids = keys, ids
+        self.added.clear()
+
+    def find_ints(self, ints):
+        """升序的 IP 整数各自的值编号，不存在时为 None，查找范围随之后移"""
+        self.merge()
+        keys, ids = self.keys, self.ids
+        lo = 0
+        for n in ints:
+            lo = bisect.bisect_left(keys, n, lo)
+            yield ids[lo] if lo < len(keys) and keys[lo] == n else None
+
+    def sorted_keys(self):
+        """升序的 IP 整数数组，即该数据段的排序索引"""
+        self.merge()
+        return self.keys
+
+    def rows(self, start=0, end=ip_max):
+        """按 IP 顺序遍历位于 [start, end] 的条目，返回 (IP整数, 值编号)"""
+        self.merge()
+        lo, hi = bisect.bisect_left(self.keys, start), bisect.bisect_right(self.keys, end)
+        return zip(self.keys[lo:hi], self.ids[lo:hi])
+
+    def iter_items(self):
+        decode = self.decode
+        keys = self.sorted_keys()
+        for start in range(0, len(keys), 1 << 16):
+            ids = self.ids[start:start + (1 << 16)]
+            yield from zip(ints_to_ips(keys[start:start + (1 << 16)]), map(decode, ids))
+
+    def __iter__(self):
+        keys = self.sorted_keys()
+        for start in range(0, len(keys), 1 << 16):
+            yield from ints_to_ips(keys[start:start + (1 << 16)])
+
+    def items(self):
+        return CompactItems(self)
+
+    def values(self):
+        return CompactValues(self)
+
+    def dump(self):
+        """转为只含内置类型与数组的状态，存入 pickle 数据文件
+        不直接 pickle 对象：脚本作为 __main__ 运行与作为模块导入时类的路径不同
+        """
+        self.merge()
+        return {'keys': self.keys, 'ids': self.ids, 'table': self.table}
+
+    def restore(self, state):
+        """由 dump 的状态恢复，值表的反向索引不存盘，装载时重建"""
+        self.keys, self.ids, self.table = state['keys'], state['ids'], state['table']
+        self.added.clear()
+        self.deleted = 0
+        self.table_ids = {value: i for i, value in enumerate(self.table)}
+        return self
+
+
+class CompactNotes(CompactSection):
+    """紧凑的 ip_dict，相同的备注元组只存一份，各备注片段的字符串也只存一份"""
+
+    def __init__(self, items=()):
+        super().__init__()
+        self.parts = dict()
+        self.load_items(items.items() if isinstance(items, collections.abc.Mapping) else items)
+
+    def intern(self, value):
+        value = tuple(value)
+        i = self.table_ids.get(value)
+        if i is None:
+            parts = self.parts
+            value = tuple([parts.setdefault(part, part) for part in value])
+            i = self.table_ids[value] = len(self.table)
+            self.table.append(value)
+        return i
+
+    def decode(self, i):
+        return self.table[i]
+
+    def part_counts(self):
+        """各备注片段的 IP 数
+        多数 IP 共用备注时按值编号计数后展开，不逐个 IP 遍历备注
+        """
+        self.merge()
+        table = self.table
+        if len(table) * 4 > len(self.ids):
+            return collections.Counter(part for value in map(table.__getitem__, self.ids) for part in value)
+        counts = collections.Counter()
+        for i, count in collections.Counter(self.ids).items():
+            for part in table[i]:
+                counts[part] += count
+        return counts
+
+    def restore(self, state):
+        super().restore(state)
+        # pickle 按对象去重，同一片段在值表中仍是同一个字符串
+        self.parts = {part: part for value in self.table for part in value}
+        return self
+
+
+class CompactTags(CompactSection):
+    """紧凑的 ip_tag，标签名编号后，相同的标签组合只存一份升序的标签编号元组
+
+    取值时返回新的集合，修改后需赋值回去
+    """
+
+    def __init__(self, items=()):
+        super().__init__()
+        self.names = []
+        self.name_ids = dict()
+        self.load_items(items.items() if isinstance(items, collections.abc.Mapping) else items)
+
+    def intern(self, value):
+        name_ids = self.name_ids
+        ids = []
+        for name in set(value):
+            j = name_ids.get(name)
+            if j is None:
+                j = name_ids[name] = len(self.names)
+                self.names.append(name)
+            ids.append(j)
+        ids = tuple(sorted(ids))
+        i = self.table_ids.get(ids)
+        if i is None:
+            i = self.table_ids[ids] = len(self.table)
+            self.table.append(ids)
+        return i
+
+    def decode(self, i):
+        names = self.names
+        return {names[j] for j in self.table[i]}
+
+    def dump(self):
+        state = super().dump()
+        state['names'] = self.names
+        return state
+
+    def restore(self, state):
+        super().restore(state)
+        self.names = state['names']
+        self.name_ids = {name: j for j, name in enumerate(self.names)}
+        return self
+
+
+class CompactTimes(CompactSection):
+    """紧凑的 ip_added，同一批导入的 IP 时间相同，每个时间只存一份；网段/范围的 key 另存在 others 中"""
+
+    def __init__(self, items=()):
+        super().__init__()
+        self.others = dict()
+        single = []
+        for key, value in (items.items() if isinstance(items, collections.abc.Mapping) else items):
+            if not is_ipv4(key):
+                self.others[key] = value
+            else:
+                single.append((key, value))
+        self.load_items(single)
+
+    def intern(self, value):
+        i = self.table_ids.get(value)
+        if i is None:
+            i = self.table_ids[value] = len(self.table)
+            self.table.append(value)
+        return i
+
+    def decode(self, i):
+        return self.table[i]
+
+    def __getitem__(self, key):
+        if key in self.others:
+            return self.others[key]
+        return super().__getitem__(key)
+
+    def __contains__(self, key):
+        return key in self.others or super().__contains__(key)
+
+    def __setitem__(self, key, value):
+        if not is_ipv4(key):
+            self.others[key] = value
+        else:
+            super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        if key in self.others:
+            del self.others[key]
+        else:
+            super().__delitem__(key)
+
+    def __len__(self):
+        return super().__len__() + len(self.others)
+
+    def __iter__(self):
+        yield from super().__iter__()
+        yield from self.others
+
+    def iter_items(self):
+        yield from super().iter_items()
+        yield from self.others.items()
+
+    def dump(self):
+        state = super().dump()
+        state['others'] = self.others
+        return state
+
+    def restore(self, state):
+        super().restore(state)
+        self.others = state['others']
+        return self
+
+
+def compact_section(value, cls):
+    """IP 较多的字典转为紧凑结构 cls，其他数据原样返回"""
+    if isinstance(value, dict) and len(value) >= compact_min_size:
+        return cls(value)
+    return value
+
+
+# pickle 数据文件中紧凑结构的类型名及对应的类
+compact_kinds = {'notes': CompactNotes, 'tags': CompactTags, 'times': CompactTimes}
+
+
+def dump_section(value):
+    """紧凑结构存为 ('compact', 类型名, 状态)，其他数据原样返回"""
+    for kind, cls in compact_kinds.items():
+        if isinstance(value, cls):
+            return 'compact', kind, value.dump()
+    return value
+
+
+def restore_section(value):
+    """dump_section 的逆操作"""
+    if isinstance(value, tuple) and value[0] == 'compact':
+        return compact_kinds[value[1]]().restore(value[2])
+    return value
+
+
+# SQLite 数据文件表结构
+# IP 均以整数存储并建索引，历史与标签中的 addr 为原始 key（历史中可能是网段/范围）
+# 历史中的 time 为该版本被替换的时间戳，同一 addr 按 time 排列即各版本的先后
+# ip_added 中的 time 为该 addr 第一个已知版本的导入时间
+# ip_history_count 为各 addr 的历史版本数，--prune-history 按版本数删除时只查出超出的 addr
+sqlite_schema = """
+CREATE TABLE IF NOT EXISTS ip_note (
+    ip INTEGER PRIMARY KEY,
+    addr TEXT NOT NULL,
+    note TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS ip_history (
+    ip INTEGER NOT NULL,
+    addr TEXT NOT NULL,
+    time INTEGER NOT NULL,
+    note TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ip_history_ip ON ip_history (ip);
+CREATE INDEX IF NOT EXISTS ip_history_addr ON ip_history (addr, time);
+CREATE INDEX IF NOT EXISTS ip_history_time ON ip_history (time);
+CREATE TABLE IF NOT EXISTS ip_tag (
+    ip INTEGER NOT NULL,
+    addr TEXT NOT NULL,
+    tag TEXT NOT NULL,
+    PRIMARY KEY (ip, tag)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ip_tag_tag ON ip_tag (tag);
+CREATE TABLE IF NOT EXISTS ip_range (
+    key TEXT PRIMARY KEY,
+    start INTEGER NOT NULL,
+    end INTEGER NOT NULL,
+    note TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS ip_added (
+    addr TEXT PRIMARY KEY,
+    time INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS ip_history_count (
+    addr TEXT PRIMARY KEY,
+    count INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ip_history_count_count ON ip_history_count (count);
+"""
+
+# 当前打开的 SQLite 连接及其文件路径，由 load_sqlite 打开
+db_conn = None
+db_path = None
+
+# 装载时的 ip_range，存盘时只写入有变化的网段
+db_range = dict()
+
+
+def is_sqlite(file_path):
+    """是否是 SQLite 数据文件"""
+    return file_path.endswith('.db')
+
+
+def sqlite_ip(key):
+    """key 转为 IP 整数，不是规范的 IPv4 时返回 None"""
+    try:
+        n = ip_to_int(key)
+    except (ValueError, AttributeError):
+        return None
+    if int_to_ip(n) != key:
+        return None
+    return n
+
+
+class SqliteNotes(collections.abc.MutableMapping):
+    """SQLite 中的 ip_dict，修改先记录在内存中，存盘时批量写入"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        # 查询缓存及未存盘的修改，值为 None 表示已删除
+        self.cache = dict()
+        self.dirty = set()
+
+    def __getitem__(self, key):
+        if key not in self.cache:
+            n = sqlite_ip(key)
+            row = None
+            if n is not None:
+                row = self.conn.execute('SELECT note FROM ip_note WHERE ip = ?', (n,)).fetchone()
+            self.cache[key] = tuple(row[0].split(' ')) if row else None
+        value = self.cache[key]
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def __setitem__(self, key, value):
+        self.cache[key] = tuple(value)
+        self.dirty.add(key)
+
+    def __delitem__(self, key):
+        self[key]
+        self.cache[key] = None
+        self.dirty.add(key)
+
+    def __iter__(self):
+        for (addr,) in self.conn.execute('SELECT addr FROM ip_note ORDER BY ip'):
+            if addr not in self.dirty:
+                yield addr
+        for key in sorted(self.dirty, key=ip_to_int):
+            if self.cache[key] is not None:
+                yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def flush(self):
+        """批量写入修改"""
+        upserts = [(ip_to_int(k), k, ' '.join(self.cache[k])) for k in self.dirty if self.cache[k] is not None]
+        deletes = [(ip_to_int(k),) for k in self.dirty if self.cache[k] is None]
+        self.conn.executemany('INSERT OR REPLACE INTO ip_note (ip, addr, note) VALUES (?, ?, ?)', upserts)
+        self.conn.executemany('DELETE FROM ip_note WHERE ip = ?', deletes)
+        self.dirty.clear()
+
+
+class SqliteHistory(collections.abc.MutableMapping):
+    """SQLite 中的 ip_history，新增的历史版本及删除的 key 存盘时批量写入"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        # 新增的历史版本 [(key, 时间, 备注元组), ...]
+        self.added = []
+        self.removed = set()
+
+    def __getitem__(self, key):
+        versions = []
+        if key not in self.removed:
+            rows = self.conn.execute('SELECT time, note FROM ip_history WHERE addr = ? ORDER BY time, rowid', (key,))
+            versions = [(when, tuple(note.split(' '))) for when, note in rows]
+        versions.extend((when, notes) for k, when, notes in self.added if k == key)
+        if not versions:
+            raise KeyError(key)
+        versions.sort(key=lambda version: version[0])
+        return versions
+
+    def __setitem__(self, key, value):
+        """整体替换 key 的历史版本：存盘时先删除原有的行，再写入新的版本"""
+        self.added = [item for item in self.added if item[0] != key]
+        self.removed.add(key)
+        self.added.extend((key, when, tuple(notes)) for when, notes in value)
+
+    def __delitem__(self, key):
+        self[key]
+        self.added = [item for item in self.added if item[0] != key]
+        self.removed.add(key)
+
+    def rows(self):
+        """遍历全部历史版本，返回 (key, 时间, 备注元组)"""
+        for addr, when, note in self.conn.execute('SELECT addr, time, note FROM ip_history '
+                                                  'ORDER BY ip, addr, time, rowid'):
+            if addr not in self.removed:
+                yield addr, when, tuple(note.split(' '))
+        yield from self.added
+
+    def __iter__(self):
+        seen = set()
+        for key, _, _ in self.rows():
+            if key not in seen:
+                seen.add(key)
+                yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def add(self, item):
+        self.added.append(item)
+
+    def version_at(self, key, when):
+        """key 在时间戳 when 之后才被替换的第一个版本的备注，没有时返回 None；按 (addr, time) 索引查找"""
+        if self.added or key in self.removed:
+            versions = self.get(key, ())
+            i = version_after(versions, when)
+            return versions[i][1] if i < len(versions) else None
+        row = self.conn.execute('SELECT note FROM ip_history WHERE addr = ? AND time > ? ORDER BY time, rowid LIMIT 1',
+                                (key, when)).fetchone()
+        return tuple(row[0].split(' ')) if row else None
+
+    def flush(self):
+        """批量写入修改"""
+        self.conn.executemany('DELETE FROM ip_history WHERE addr = ?', [(key,) for key in self.removed])
+        self.conn.executemany('DELETE FROM ip_history_count WHERE addr = ?', [(key,) for key in self.removed])
+        self.conn.executemany('INSERT INTO ip_history (ip, addr, time, note) VALUES (?, ?, ?, ?)',
+                              [(ip_sort_key(key)[0], key, when, ' '.join(notes)) for key, when, notes in self.added])
+        counts = collections.Counter(key for key, _, _ in self.added)
+        self.conn.executemany('INSERT INTO ip_history_count (addr, count) VALUES (?, ?) '
+                              'ON CONFLICT (addr) DO UPDATE SET count = count + excluded.count', counts.items())
+        self.added.clear()
+        self.removed.clear()
+
+
+class SqliteTags(collections.abc.MutableMapping):
+    """SQLite 中的 ip_tag，取出的标签集合可直接增加标签，存盘时批量写入"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        # 查询缓存及未存盘的修改，值为 None 表示不存在或已删除
+        self.cache = dict()
+        # 赋值、删除时去掉的标签 {(key, 标签), ...}，存盘时删除对应的行
+        self.removed = set()
+
+    def __getitem__(self, key):
+        if key not in self.cache:
+            n = sqlite_ip(key)
+            rows = []
+            if n is not None:
+                rows = self.conn.execute('SELECT tag FROM ip_tag WHERE ip = ?', (n,)).fetchall()
+            self.cache[key] = {tag for (tag,) in rows} if rows else None
+        value = self.cache[key]
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def __setitem__(self, key, value):
+        value = set(value)
+        old = self.get(key, ())
+        self.removed.update((key, tag) for tag in old if tag not in value)
+        self.removed.difference_update((key, tag) for tag in value)
+        self.cache[key] = value
+
+    def __delitem__(self, key):
+        self.removed.update((key, tag) for tag in self[key])
+        self.cache[key] = None
+
+    def __iter__(self):
+        seen = set()
+        for (addr,) in self.conn.execute('SELECT DISTINCT addr FROM ip_tag ORDER BY ip'):
+            seen.add(addr)
+            if self.cache.get(addr, ()) is not None:
+                yield addr
+        for key, value in self.cache.items():
+            if key not in seen and value is not None:
+                yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def flush(self):
+        """批量写入修改，已存在的标签不会重复写入"""
+        self.conn.executemany('DELETE FROM ip_tag WHERE ip = ? AND tag = ?',
+                              [(ip_to_int(k), tag) for k, tag in self.removed])
+        rows = [(ip_to_int(k), k, tag) for k, value in self.cache.items() if value is not None for tag in value]
+        self.conn.executemany('INSERT OR IGNORE INTO ip_tag (ip, addr, tag) VALUES (?, ?, ?)', rows)
+        self.removed.clear()
+
+
+class SqliteAdded(collections.abc.MutableMapping):
+    """SQLite 中的 ip_added，修改先记录在内存中，存盘时批量写入"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        # 查询缓存及未存盘的修改，值为 None 表示不存在或已删除
+        self.cache = dict()
+        self.dirty = set()
+
+    def __getitem__(self, key):
+        if key not in self.cache:
+            row = self.conn.execute('SELECT time FROM ip_added WHERE addr = ?', (key,)).fetchone()
+            self.cache[key] = row[0] if row else None
+        value = self.cache[key]
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def __setitem__(self, key, value):
+        self.cache[key] = value
+        self.dirty.add(key)
+
+    def __delitem__(self, key):
+        self[key]
+        self.cache[key] = None
+        self.dirty.add(key)
+
+    def __iter__(self):
+        for (addr,) in self.conn.execute('SELECT addr FROM ip_added'):
+            if addr not in self.dirty:
+                yield addr
+        for key in self.dirty:
+            if self.cache[key] is not None:
+                yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def flush(self):
+        """批量写入修改"""
+        self.conn.executemany('INSERT OR REPLACE INTO ip_added (addr, time) VALUES (?, ?)',
+                              [(k, self.cache[k]) for k in self.dirty if self.cache[k] is not None])
+        self.conn.executemany('DELETE FROM ip_added WHERE addr = ?',
+                              [(k,) for k in self.dirty if self.cache[k] is None])
+        self.dirty.clear()
+
+
+def load_sqlite(file_path):
+    """打开 SQLite 数据文件，查询按需执行，不整体装载"""
+    global ip_dict, ip_history, ip_tag, ip_range, ip_added, db_conn, db_path, db_range
+    import sqlite3
+    if db_conn:
+        db_conn.close()
+    exists = os.path.exists(file_path)
+    db_conn = sqlite3.connect(file_path)
+    db_path = os.path.abspath(file_path)
+    if exists:
+        upgrade_sqlite(db_conn, os.path.getmtime(file_path))
+    counted = db_conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'ip_history_count'").fetchone()
+    db_conn.executescript(sqlite_schema)
+    if not counted:
+        # 旧版本的数据文件没有版本数表，统计一次
+        with db_conn:
+            count_sqlite_history(db_conn)
+    ip_dict = SqliteNotes(db_conn)
+    ip_history = SqliteHistory(db_conn)
+    ip_tag = SqliteTags(db_conn)
+    ip_added = SqliteAdded(db_conn)
+    ip_range = dict()
+    for key, note in db_conn.execute('SELECT key, note FROM ip_range'):
+        ip_range[key] = tuple(note.split(' '))
+    db_range = dict(ip_range)
+
+
+def count_sqlite_history(conn):
+    """由 ip_history 整体重新统计各 addr 的历史版本数"""
+    conn.execute('DELETE FROM ip_history_count')
+    conn.execute('INSERT INTO ip_history_count (addr, count) SELECT addr, COUNT(*) FROM ip_history GROUP BY addr')
+
+
+def upgrade_sqlite(conn, when):
+    """旧版本的 ip_history 表没有 time 列且 (addr, note) 唯一，改为新表结构
+    旧记录没有时间，按数据文件的修改时间计
+    """
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(ip_history)')]
+    if not columns or 'time' in columns:
+        return
+    with conn:
+        conn.execute('BEGIN')
+        conn.execute('ALTER TABLE ip_history RENAME TO ip_history_old')
+        conn.execute('DROP INDEX IF EXISTS ip_history_ip')
+        for statement in sqlite_schema.split(';'):
+            if 'ip_history' in statement:
+                conn.execute(statement)
+        conn.execute('INSERT INTO ip_history (ip, addr, time, note) '
+                     'SELECT ip, addr, ?, note FROM ip_history_old ORDER BY ip, addr, note', (int(when),))
+        conn.execute('DROP TABLE ip_history_old')
+
+
+def save_sqlite(file_path):
+    """在一个事务中写入本次修改的数据
+
+    数据仍是 SqliteNotes 等对象时只写入修改过的行；
+    被替换为普通字典/集合时（如 -e 清空）整体重写
+    """
+    global ip_dict, ip_history, ip_tag, ip_range, ip_added, db_range
+    if not db_conn or db_path != os.path.abspath(file_path):
+        # 数据来自其他数据文件（如 pickle 转存为 SQLite），打开目标文件后整体写入
+        release_snapshot()
+        data = (dict(ip_dict.items()), {k: list(v) for k, v in ip_history.items()},
+                {k: set(v) for k, v in ip_tag.items()}, dict(ip_range), dict(ip_added.items()))
+        load_sqlite(file_path)
+        ip_dict, ip_history, ip_tag, ip_range, ip_added = data
+    with db_conn:
+        if isinstance(ip_dict, SqliteNotes):
+            ip_dict.flush()
+        else:
+            db_conn.execute('DELETE FROM ip_note')
+            db_conn.executemany('INSERT INTO ip_note (ip, addr, note) VALUES (?, ?, ?)',
+                                [(ip_to_int(k), k, ' '.join(v)) for k, v in ip_dict.items()])
+        if isinstance(ip_history, SqliteHistory):
+            ip_history.flush()
+        else:
+            db_conn.execute('DELETE FROM ip_history')
+            db_conn.executemany('INSERT INTO ip_history (ip, addr, time, note) VALUES (?, ?, ?, ?)',
+                                [(ip_sort_key(key)[0], key, when, ' '.join(notes))
+                                 for key, versions in ip_history.items() for when, notes in versions])
+            count_sqlite_history(db_conn)
+        if isinstance(ip_tag, SqliteTags):
+            ip_tag.flush()
+        else:
+            db_conn.execute('DELETE FROM ip_tag')
+            db_conn.executemany('INSERT OR IGNORE INTO ip_tag (ip, addr, tag) VALUES (?, ?, ?)',
+                                [(ip_to_int(k), k, tag) for k, v in ip_tag.items() for tag in v])
+        if isinstance(ip_added, SqliteAdded):
+            ip_added.flush()
+        else:
+            db_conn.execute('DELETE FROM ip_added')
+            db_conn.executemany('INSERT INTO ip_added (addr, time) VALUES (?, ?)', list(ip_added.items()))
+
+        db_conn.executemany('DELETE FROM ip_range WHERE key = ?',
+                            [(k,) for k in db_range if k not in ip_range])
+        changed = [(k, *range_bounds(k), ' '.join(v)) for k, v in ip_range.items() if db_range.get(k) != v]
+        db_conn.executemany('INSERT OR REPLACE INTO ip_range (key, start, end, note) VALUES (?, ?, ?, ?)', changed)
+    db_range = dict(ip_range)
+
+
+def expand_ip_files(patterns):
+    """展开 -i 参数，支持多个文件及通配符，'-' 表示标准输入"""
+    import glob
+    paths = []
+    for pattern in patterns:
+        if pattern == '-' or os.path.exists(pattern):
+            paths.append(pattern)
+            continue
+        matched = sorted(glob.glob(pattern))
+        if not matched:
+            print(f"The file at {pattern} does not exist.", file=sys.stderr)
+        paths.extend(matched)
+    return paths
+
+
+def insert_ip_note(file_path, enable_tag=False):
+    """装载原始数据文件"""
+    insert_ip_notes([file_path], enable_tag=enable_tag)
+
+
+def insert_ip_notes(paths, enable_tag=False):
+    """批量导入原始数据文件
+
+    先读完所有文件，同一 IP 的多行合并为一条（备注只保留连续变化的值，
+    标签取并集），再统一写入 ip_dict/ip_history/ip_tag，结果与逐行导入一致。
+    无效行只计数，最后输出一行汇总
+    """
+    start = time.perf_counter()
+    materialize_data()
+
+    # key : (op, [备注1, 备注2, ...]) ，按变化顺序保存
+    note_batch = dict()
+    # key : {标签, ...}
+    tag_batch = dict()
+    rows = 0
+    rejected = []
+    is_ip = pattern_ipv4_full.fullmatch
+
+    for path in paths:
+        if path == '-':
+            f = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8')
+        elif os.path.exists(path):
+            f = open(path, 'r', encoding='utf-8')
+        else:
+            print(f"The file at {path} does not exist.", file=sys.stderr)
+            continue
+        with f:
+            for line in f:
+                rows += 1
+                ip_line = line.split()
+
+                # 过滤空行及无备注的行
+                if len(ip_line) <= 1:
+                    continue
+                k, v = ip_line[0], tuple(ip_line[1:])
+
+                if is_ip(k):
+                    op = 'note'
+                else:
+                    parsed = None if enable_tag else parse_ip_range(k)
+                    if not parsed:
+                        rejected.append(k)
+                        continue
+                    op, k = 'range', parsed[0]
+
+                if enable_tag:
+                    if k in tag_batch:
+                        tag_batch[k].update(v)
+                    else:
+                        tag_batch[k] = set(v)
+                    continue
+
+                item = note_batch.get(k)
+                if item is None:
+                    note_batch[k] = (op, [v])
+                elif item[1][-1] != v:
+                    item[1].append(v)
+
+    now = int(time.time())
+    for k, value in tag_batch.items():
+        value = tuple(value)
+        apply_record('tag', k, value, now)
+        pending_records.append(('tag', k, value, now))
+    for k, (op, values) in note_batch.items():
+        for v in values:
+            apply_record(op, k, v, now)
+            pending_records.append((op, k, v, now))
+
+    if rejected:
+        sample = ', '.join(repr(k) for k in rejected[:5])
+        print(f"Warning: no ipv4: {len(rejected)} lines, e.g. {sample}", file=sys.stderr)
+    elapsed = time.perf_counter() - start
+    print(f"imported {rows} lines, {len(note_batch) + len(tag_batch)} ips, {len(rejected)} rejected, "
+          f"{elapsed:.2f}s ({rows / max(elapsed, 1e-9):.0f} rows/s)", file=sys.stderr)
+
+
+def clean_ip_history(key='192.168.1.1'):
+    """删除一个 key 的全部历史版本"""
+    materialize_data()
+    history = loaded(ip_history)
+    if key not in history:
+        return
+    versions = history.pop(key)
+    # 时间索引中的条目留待按时间删除时跳过
+    if history_index['total'] >= 0:
+        move_history_count(key, len(versions), 0)
+        history_index['total'] -= len(versions)
+    if is_ipv4(key):
+        ip_order['history'] = remove_sorted(ip_order['history'], (ip_to_int(key),))
+
+
+def format_time(when):
+    """时间戳转为本地时间文本"""
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(when))
+
+
+def parse_time(text):
+    """解析 --at 的时间，如 '2024-01-01'、'2024-01-01 08:30'，返回时间戳，不合法时抛出 ValueError"""
+    import datetime
+    return datetime.datetime.fromisoformat(text.strip()).timestamp()
+
+
+def version_after(versions, when):
+    """按被替换的时间排列的版本中，第一个在 when 之后才被替换的版本的下标，二分查找"""
+    lo, hi = 0, len(versions)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if versions[mid][0] > when:
+            hi = mid
+        else:
+            lo = mid + 1
+    return lo
+
+
+def notes_at(key, current, when):
+    """key 在时间戳 when 时的备注，current 为当前备注，when 早于 key 第一次导入时返回 None
+    各历史版本按被替换的时间排列，第一个在 when 之后才被替换的版本即当时的备注，没有则为当前备注
+    """
+    added = ip_added.get(key)
+    if added is not None and when < added:
+        return None
+    history = loaded(ip_history)
+    if isinstance(history, (MappedHistory, SqliteHistory)):
+        notes = history.version_at(key, when)
+    else:
+        versions = history.get(key, ())
+        i = version_after(versions, when)
+        notes = versions[i][1] if i < len(versions) else None
+    return current if notes is None else notes
+
+
+class NotesAt(collections.abc.Mapping):
+    """ip_dict 在某一时间点的只读视图，-a --at 使用，查到一个 IP 再查它的历史
+    日志中同一 IP 反复出现，查询结果缓存起来，不存在的 IP 缓存为 None
+    """
+
+    def __init__(self, notes, when):
+        self.notes = notes
+        self.when = when
+        self.cache = dict()
+
+    def __getitem__(self, key):
+        try:
+            value = self.cache[key]
+        except KeyError:
+            value = self.cache[key] = notes_at(key, self.notes[key], self.when) if key in self.notes else None
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __iter__(self):
+        return iter(self.notes)
+
+    def __len__(self):
+        return len(self.notes)
+
+
+def view_notes_at(when):
+    """将 ip_dict、ip_range 替换为时间戳 when 时的备注，用于按日志的时间替换旧日志中的 IP"""
+    global ip_dict, ip_range, range_index
+    if isinstance(ip_dict, NotesAt):
+        return
+    ip_dict = NotesAt(loaded(ip_dict), when)
+    ranges = dict()
+    for key, value in ip_range.items():
+        notes = notes_at(key, value, when)
+        if notes is not None:
+            ranges[key] = notes
+    ip_range = ranges
+    range_index = None
+
+
+def parse_prune_spec(text):
+    """解析 --prune-history 的条件
+    '90d' 删除 90 天前被替换的版本，'5' 每个 key 只保留最新的 5 个版本，可用逗号组合，如 '90d,5'；
+    返回 (最早保留的时间戳或 None, 保留的版本数或 None)，不合法时抛出 ValueError
+    """
+    cutoff = keep = None
+    for part in text.split(','):
+        part = part.strip().lower()
+        if part.endswith('d') and part[:-1].isdigit():
+            cutoff = int(time.time()) - int(part[:-1]) * 86400
+        elif part.isdigit():
+            keep = int(part)
+        else:
+            raise ValueError(text)
+    return cutoff, keep
+
+
+def prune_history(cutoff=None, keep=None):
+    """删除 cutoff 之前被替换的历史版本，每个 key 最多保留最新的 keep 个版本，返回删除的版本数
+    各 key 的版本按时间排列，要删除的总是开头的一段，整段切除即可；
+    要删除的版本由时间索引找出，只处理这些版本所在的 key，不遍历全部历史
+    """
+    if db_conn and isinstance(ip_history, SqliteHistory):
+        return prune_sqlite_history(cutoff, keep)
+    materialize_data()
+    history = loaded(ip_history)
+    index = history_index
+    if index['total'] < 0:
+        index = build_history_index(history)
+    removed = 0
+    emptied = []
+
+    def cut(key, versions, n):
+        # 剩下的第一个版本自被删除的最后一个版本被替换时起有效，更早的时间不再有备注
+        nonlocal removed
+        ip_added[key] = versions[n - 1][0]
+        move_history_count(key, len(versions), len(versions) - n)
+        del versions[:n]
+        removed += n
+        if not versions:
+            emptied.append(key)
+            del history[key]
+
+    if cutoff is not None:
+        times, keys = index['times'], index['keys']
+        end = bisect.bisect_left(times, cutoff)
+        # 同一 key 的过期版本一次切除，已删除的 key 及已被切除的版本（过时条目）跳过
+        for key in dict.fromkeys(keys[:end]):
+            versions = history.get(key)
+            n = 0
+            while versions and n < len(versions) and versions[n][0] < cutoff:
+                n += 1
+            if n:
+                cut(key, versions, n)
+        del times[:end], keys[:end]
+    if keep is not None:
+        counts = index['counts']
+        for count in [count for count in counts if count > keep]:
+            for key in list(counts[count]):
+                cut(key, history[key], count - keep)
+        if keep == 0:
+            # 只有一个版本的 key 不在 counts 中
+            for key in [key for key in history]:
+                cut(key, history[key], len(history[key]))
+    index['total'] -= removed
+    if len(index['times']) - index['total'] > max(index['total'], 4096):
+        build_history_index(history)
+    ints = [ip_to_int(key) for key in emptied if is_ipv4(key)]
+    if ints:
+        ip_order['history'] = remove_sorted(ip_order['history'], ints)
+    return removed
+
+
+def prune_sqlite_history(cutoff=None, keep=None):
+    """SQLite 中删除过旧的历史版本，返回删除的版本数
+    按时间删除走 time 索引，按版本数删除由 ip_history_count 查出超出的 addr，再按 (addr, time) 索引删除，
+    都只读取要删除的行
+    """
+    removed = 0
+    with db_conn:
+        ip_history.flush()
+        ip_added.flush()
+        if cutoff is not None:
+            # 分组会让 SQLite 改走 (addr, time) 索引整表扫描，指定 time 索引只读过期的行
+            rows = db_conn.execute('SELECT addr, COUNT(*), MAX(time) FROM ip_history INDEXED BY ip_history_time '
+                                   'WHERE time < ? GROUP BY addr', (cutoff,)).fetchall()
+            db_conn.executemany('INSERT OR REPLACE INTO ip_added (addr, time) VALUES (?, ?)',
+                                [(addr, when) for addr, _, when in rows])
+            db_conn.executemany('UPDATE ip_history_count SET count = count - ? WHERE addr = ?',
+                                [(n, addr) for addr, n, _ in rows])
+            removed += db_conn.execute('DELETE FROM ip_history WHERE time < ?', (cutoff,)).rowcount
+        if keep is not None:
+            # 只对版本数超出的 addr 按时间编号，编号不超过超出数的即要删除的版本
+            db_conn.execute('CREATE TEMP TABLE pruned AS SELECT rowid AS id, addr, time FROM (SELECT h.rowid, h.addr, '
+                            'h.time, c.count, ROW_NUMBER() OVER (PARTITION BY h.addr ORDER BY h.time, h.rowid) AS version '
+                            'FROM ip_history_count AS c JOIN ip_history AS h ON h.addr = c.addr WHERE c.count > ?) '
+                            'WHERE version <= count - ?', (keep, keep))
+            db_conn.execute('INSERT OR REPLACE INTO ip_added (addr, time) SELECT addr, MAX(time) FROM pruned GROUP BY addr')
+            removed += db_conn.execute('DELETE FROM ip_history WHERE rowid IN (SELECT id FROM pruned)').rowcount
+            db_conn.execute('UPDATE ip_history_count SET count = ? WHERE count > ?', (keep, keep))
+            db_conn.execute('DROP TABLE pruned')
+        db_conn.execute('DELETE FROM ip_history_count WHERE count <= 0')
+    # 导入时间已在 SQL 中更新，丢弃查询缓存
+    ip_added.cache.clear()
+    return removed
+
+
+def prune_data(file_path, cutoff=None, keep=None):
+    """--prune-history：删除过旧的历史版本并写回数据文件
+    pickle/ipdb 数据文件与 --compact 一样在持有锁期间装载、重放导入日志后整体写回
+    """
+    if is_sqlite(file_path):
+        load_sqlite(file_path)
+        removed = prune_history(cutoff, keep)
+    else:
+        with journal_lock(file_path):
+            load_snapshot(file_path, ('history',))
+            replay_journal(file_path)
+            removed = prune_history(cutoff, keep)
+            if removed:
+                write_snapshot(file_path)
+                if os.path.exists(file_path + '.journal'):
+                    os.remove(file_path + '.journal')
+    print(f"pruned {removed} history versions", file=sys.stderr)
+
+
+# IPv4 地址正则
+pattern_ip = re.compile(
+    r'((?:(?:25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)\.){3}(?:25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?))')
+
+# 字节版 IPv4 地址正则，--binary 模式使用
+pattern_ip_bytes = re.compile(pattern_ip.pattern.encode('ascii'))
+
+# 可能包含 IP 的片段：至少 7 个连续的数字或点
+# IP 只会出现在这样的片段内，先用它快速跳过无 IP 的内容
+pattern_ip_candidate_bytes = re.compile(rb'[0-9.]{7,}')
+
+# 块缓冲模式下每次最多读入的字节数，管道中已到达的数据不足时有多少读多少
+read_block_size = 1 << 16
+
+# --binary 模式下每次读入的字节数
+binary_block_size = 1 << 20
+
+# --jobs 模式下每个任务处理的字节数
+parallel_chunk_size = 8 << 20
+
+
+def build_range_index():
+    """生成网段/范围查找索引
+
+    将可能互相嵌套或重叠的网段拆分为互不重叠的区间，每个区间归属于
+    覆盖它的最小网段（最长前缀匹配），查找时对起始IP数组二分即可
+    """
+    items = []
+    for key, value in ip_range.items():
+        start, end = range_bounds(key)
+        items.append((start, end, ' '.join(value)))
+    items.sort()
+
+    starts, ends, notes = array('I'), array('I'), []
+    boundaries = sorted({start for start, _, _ in items} | {end + 1 for _, end, _ in items})
+    active = []
+    i = 0
+    for pos, boundary in enumerate(boundaries[:-1]):
+        while i < len(items) and items[i][0] == boundary:
+            start, end, note = items[i]
+            heapq.heappush(active, (end - start, i, end, note))
+            i += 1
+        while active and active[0][2] < boundary:
+            heapq.heappop(active)
+        if not active:
+            continue
+        note = active[0][3]
+        last = boundaries[pos + 1] - 1
+        if notes and notes[-1] is note and ends[-1] + 1 == boundary:
+            ends[-1] = last
+        else:
+            starts.append(boundary)
+            ends.append(last)
+            notes.append(note)
+    return starts, ends, notes
+
+
+def search_ip_range(s):
+    """在网段/范围中查找 IP，返回备注，没有则返回 None"""
+    global range_index
+    if not ip_range:
+        return None
+    if range_index is None:
+        range_index = build_range_index()
+    starts, ends, notes = range_index
+    n = ip_to_int(s)
+    pos = bisect.bisect_right(starts, n) - 1
+    if pos >= 0 and n <= ends[pos]:
+        return notes[pos]
+    return None
+
+
+def search_ip_dict(s):
+    if s in ip_dict:
+        return s + ' [' + ' '.join(ip_dict[s]) + ']'
+    note = search_ip_range(s)
+    if note is not None:
+        return s + ' [' + note + ']'
+    return s
+
+
+def replace_match(match):
+    """正则替换回调，返回带备注的 IP"""
+    return search_ip_dict(match.group())
+
+
+# -a 模式中不在查找表里的查找（网段、未命中、尚未出现过的 IP）使用的 LRU 缓存大小，--cache-size 指定
+annotate_cache_size = 1 << 16
+
+# --stats 打开时的查找计数：table 为查找表（预先生成或按需记入）命中，cache 为经 LRU 缓存的查找，
+# miss 为其中缓存未命中的次数，plain 为无网段时没有备注、原样返回的次数
+lookup_stats = None
+
+
+def new_lookup_stats():
+    return {'table': 0, 'cache': 0, 'miss': 0, 'plain': 0}
+
+
+def merge_lookup_stats(counts):
+    """合并子进程的查找计数"""
+    for key, value in counts.items():
+        lookup_stats[key] += value
+
+
+def print_lookup_stats():
+    """--stats：向标准错误输出查找的命中率，用于确定 --cache-size"""
+    total = lookup_stats['table'] + lookup_stats['cache'] + lookup_stats['plain']
+    hits = lookup_stats['cache'] - lookup_stats['miss']
+    rows = (('table hits', lookup_stats['table'], ''),
+            ('cache hits', hits, ''),
+            ('cache misses', lookup_stats['miss'], f'  (cache size {annotate_cache_size})'),
+            ('plain misses', lookup_stats['plain'], '  (not in table, no ranges)'))
+    print(f'{"ip lookups":<14}{total:>12}', file=sys.stderr)
+    for name, count, extra in rows:
+        rate = count / total * 100 if total else 0
+        print(f'  {name:<12}{count:>12} {rate:7.2f}%{extra}', file=sys.stderr)
+
+
+# --stats 或 --progress 打开时的运行统计：各阶段耗时，-a 处理的行数与输入、输出字节数
+run_stats = None
+
+# --progress 输出进度行的间隔（秒），0 表示不输出
+progress_interval = 0
+
+
+def new_run_stats():
+    now = time.perf_counter()
+    return {'start': now, 'phases': dict(), 'lines': 0, 'bytes_in': 0, 'bytes_out': 0,
+            'next_progress': now + progress_interval}
+
+
+@contextlib.contextmanager
+def stats_phase(name):
+    """--stats：累计 with 块内的耗时到 name 阶段"""
+    if run_stats is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        phases = run_stats['phases']
+        phases[name] = phases.get(name, 0) + time.perf_counter() - start
+
+
+def count_io(lines, size_in, size_out):
+    """-a 每处理一块调用一次，累计行数与字节数，到时间时输出进度行"""
+    run_stats['lines'] += lines
+    run_stats['bytes_in'] += size_in
+    run_stats['bytes_out'] += size_out
+    if progress_interval:
+        now = time.perf_counter()
+        if now >= run_stats['next_progress']:
+            run_stats['next_progress'] = now + progress_interval
+            print_progress(now)
+
+
+def throughput(now):
+    """已处理的行数与 MB 数、每秒行数与 MB/s 的文字描述"""
+    elapsed = max(now - run_stats['start'], 1e-9)
+    mb = run_stats['bytes_in'] / 1024 / 1024
+    return f"{run_stats['lines']} lines, {mb:.1f} MB, {run_stats['lines'] / elapsed:.0f} lines/s, {mb / elapsed:.2f} MB/s"
+
+
+def print_progress(now):
+    """--progress：标准错误是终端时在同一行刷新，否则每次输出一行"""
+    line = f'progress: {throughput(now)}'
+    if sys.stderr.isatty():
+        print(f'\r{line}\033[K', end='', file=sys.stderr, flush=True)
+    else:
+        print(line, file=sys.stderr, flush=True)
+
+
+def peak_rss():
+    """本进程与已结束子进程的峰值内存（MB），不支持的系统返回 None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    # Linux 下单位为 KB，macOS 下为字节
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return tuple(resource.getrusage(who).ru_maxrss * scale / 1024 / 1024
+                 for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN))
+
+
+def print_run_stats():
+    """--stats：退出时向标准错误输出各阶段耗时、吞吐量、查找命中率与峰值内存"""
+    now = time.perf_counter()
+    if progress_interval and sys.stderr.isatty():
+        print(file=sys.stderr)
+    print('phases:', file=sys.stderr)
+    for name, seconds in run_stats['phases'].items():
+        print(f'  {name:<12}{seconds:12.3f}s', file=sys.stderr)
+    print(f'  {"total":<12}{now - run_stats["start"]:12.3f}s', file=sys.stderr)
+    if 'annotate' in run_stats['phases']:
+        elapsed = max(run_stats['phases']['annotate'], 1e-9)
+        mb_in = run_stats['bytes_in'] / 1024 / 1024
+        print(f"annotate: {run_stats['lines']} lines, {mb_in:.1f} MB in, "
+              f"{run_stats['bytes_out'] / 1024 / 1024:.1f} MB out, "
+              f"{run_stats['lines'] / elapsed:.0f} lines/s, {mb_in / elapsed:.2f} MB/s", file=sys.stderr)
+        print_lookup_stats()
+    if 'analyze' in run_stats['phases']:
+        elapsed = max(run_stats['phases']['analyze'], 1e-9)
+        mb_in = run_stats['bytes_in'] / 1024 / 1024
+        print(f"analyze: {run_stats['lines']} lines, {mb_in:.1f} MB in, "
+              f"{run_stats['lines'] / elapsed:.0f} lines/s, {mb_in / elapsed:.2f} MB/s", file=sys.stderr)
+    rss = peak_rss()
+    if rss:
+        print(f'peak RSS: {rss[0]:.1f} MB' + (f' (children {rss[1]:.1f} MB)' if rss[1] else ''), file=sys.stderr)
+
+
+def save_profile(profiler, file_path):
+    """--profile：退出时保存 cProfile 结果，可用 python -m pstats 或 snakeviz 查看"""
+    profiler.disable()
+    profiler.dump_stats(file_path)
+    print(f'profile written to {file_path}', file=sys.stderr)
+
+
+def build_note_table(notes, encode=False):
+    """预先生成带备注的 IP
+    字典结构 '8.8.8.8' : '8.8.8.8 [GoogleDNS]'，encode 为 True 时 key 与值均为字节
+    紧凑结构中多个 IP 共用的备注只拼接一次
+    """
+    if isinstance(notes, CompactNotes):
+        keys = ints_to_ips(notes.sorted_keys(), encode)
+        suffixes = [' [' + ' '.join(value) + ']' for value in notes.table]
+        if encode:
+            suffixes = [suffix.encode('utf-8') for suffix in suffixes]
+        return {key: key + suffixes[i] for key, i in zip(keys, notes.ids)}
+    if encode:
+        return {key.encode('ascii'): (key + ' [' + ' '.join(value) + ']').encode('utf-8')
+                for key, value in notes.items()}
+    return {key: key + ' [' + ' '.join(value) + ']' for key, value in notes.items()}
+
+
+def make_ip_lookup(encode=False, prebuild=False):
+    """返回 IP -> 带备注 IP 的查找函数，encode 为 True 时参数与返回值均为字节
+
+    prebuild 为 True（多文件、--jobs、--follow 等批量或长时间运行的场景）时，
+    pickle 数据装载后一次生成全部带备注的 IP，之后每次命中只是一次查表；
+    否则带备注的 IP 第一次出现时才拼接并记入查找表，标准输入的 -a 启动时不必为全部 IP 生成备注。
+    ipdb/SQLite 数据、--at 视图不记入查找表，与网段、未命中一起经 LRU 缓存查找
+    """
+    notes = ip_dict.load() if isinstance(ip_dict, LazySection) else ip_dict
+    in_memory = isinstance(notes, (dict, CompactNotes))
+    prebuilt = prebuild and in_memory
+    memo = in_memory and not prebuilt
+    table = build_note_table(notes, encode) if prebuilt else dict()
+    get = table.get
+    stats = lookup_stats
+
+    if encode:
+        def render(ip):
+            if stats is not None:
+                stats['miss'] += 1
+            key = ip.decode('ascii')
+            note = search_ip_dict(key).encode('utf-8')
+            if memo and key in notes:
+                # 自身带备注的 IP 至多与数据中的 IP 一样多，直接记入查找表
+                table[ip] = note
+            return note
+    else:
+        def render(ip):
+            if stats is not None:
+                stats['miss'] += 1
+            note = search_ip_dict(ip)
+            if memo and ip in notes:
+                table[ip] = note
+            return note
+    resolve = functools.lru_cache(maxsize=annotate_cache_size)(render)
+
+    if prebuilt and not ip_range:
+        # 表中已包含全部带备注的 IP，其余 IP 原样返回
+        if stats is None:
+            def lookup(ip):
+                return get(ip, ip)
+        else:
+            def lookup(ip):
+                note = get(ip)
+                if note is None:
+                    stats['plain'] += 1
+                    return ip
+                stats['table'] += 1
+                return note
+        return lookup
+    if memo and not ip_range and isinstance(notes, dict):
+        # 不在表中的 IP 直接查字典，有备注时记入查找表，没有备注时原样返回，不经过 LRU 缓存
+        find = notes.get
+        if encode:
+            def lookup(ip):
+                note = get(ip)
+                if note is None:
+                    value = find(ip.decode('ascii'))
+                    if value is None:
+                        if stats is not None:
+                            stats['plain'] += 1
+                        return ip
+                    note = table[ip] = ip + (' [' + ' '.join(value) + ']').encode('utf-8')
+                if stats is not None:
+                    stats['table'] += 1
+                return note
+        else:
+            def lookup(ip):
+                note = get(ip)
+                if note is None:
+                    value = find(ip)
+                    if value is None:
+                        if stats is not None:
+                            stats['plain'] += 1
+                        return ip
+                    note = table[ip] = ip + ' [' + ' '.join(value) + ']'
+                if stats is not None:
+                    stats['table'] += 1
+                return note
+        return lookup
+
+    if stats is None:
+        def lookup(ip):
+            note = get(ip)
+            if note is None:
+                return resolve(ip)
+            return note
+    else:
+        def lookup(ip):
+            note = get(ip)
+            if note is None:
+                stats['cache'] += 1
+                return resolve(ip)
+            stats['table'] += 1
+            return note
+
+    return lookup
+
+
+def replace_ip(line_buffered=False):
+    """替换字符串中的IP为带备注的版本
+
+    每块文本只做一次正则替换；默认使用块缓冲输出，
+    标准输入/输出是终端或指定 --line_buffered 时逐行刷新
+    """
+    fin = sys.stdin
+    fout = sys.stdout
+    sub = pattern_ip.sub
+    lookup = make_ip_lookup()
+
+    counting = run_stats is not None
+
+    def replace(match):
+        return lookup(match.group())
+
+    def size(text):
+        return len(text.encode('utf-8', 'replace'))
+
+    if line_buffered or fout.isatty() or fin.isatty():
+        for line in fin:
+            out = sub(replace, line)
+            fout.write(out)
+            fout.flush()
+            if counting:
+                count_io(1, size(line), size(out))
+        return
+
+    # IP 不会跨行，按整行读入一批后统一替换
+    for text in read_text_blocks(fin):
+        out = sub(replace, text)
+        fout.write(out)
+        if counting:
+            count_io(text.count('\n') + (text[-1] != '\n'), size(text), size(out))
+    fout.flush()
+
+
+def read_text_blocks(fin):
+    """按块读取文本输入，每块以换行结尾（最后一块可能没有）
+
+    readlines(n) 要读满 n 字节才返回，管道中数据来得慢时一直等待；
+    这里用 read1 有多少读多少，再在最后一个换行处切分。没有底层字节流的输入（如 StringIO）按 readlines 读取
+    """
+    buffer = getattr(fin, 'buffer', None)
+    if not hasattr(buffer, 'read1'):
+        while True:
+            lines = fin.readlines(read_block_size)
+            if not lines:
+                return
+            yield ''.join(lines)
+
+    import codecs
+    # 与 sys.stdin 一致：Windows 下换行统一为 \n
+    decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder(fin.encoding)(fin.errors),
+                                           translate=os.name == 'nt')
+    rest = ''
+    while True:
+        data = buffer.read1(read_block_size)
+        text = rest + decoder.decode(data, final=not data)
+        if not data:
+            break
+        cut = text.rfind('\n') + 1
+        rest = text[cut:]
+        if cut:
+            yield text[:cut]
+    if text:
+        yield text
+
+
+def split_block(block):
+    """将数据块切分为可安全替换的部分与剩余部分
+    优先在最后一个换行处切分；没有换行时在最后一个不属于 IP 的字节处切分
+    """
+    cut = block.rfind(b'\n') + 1
+    if cut:
+        return block[:cut], block[cut:]
+    for pos in range(len(block) - 1, -1, -1):
+        if block[pos] not in b'0123456789.':
+            return block[:pos + 1], block[pos + 1:]
+    return b'', block
+
+
+def make_bytes_annotator(prebuild=False):
+    """返回按字节替换 IP 的函数，供 --binary、--jobs 与 --follow 模式使用，prebuild 见 make_ip_lookup
+
+    不含 '.' 的数据直接返回；其余内容先找出可能包含 IP 的片段，
+    只在这些片段上做 IP 正则替换
+    """
+    ip_sub = pattern_ip_bytes.sub
+    sub = pattern_ip_candidate_bytes.sub
+    lookup = make_ip_lookup(encode=True, prebuild=prebuild)
+
+    def replace_ip_bytes(match):
+        return lookup(match.group())
+
+    def replace(match):
+        return ip_sub(replace_ip_bytes, match.group())
+
+    def annotate(block):
+        if b'.' not in block:
+            return block
+        return sub(replace, block)
+
+    return annotate
+
+
+def replace_ip_binary(line_buffered=False):
+    """--binary 模式：按字节处理标准输入，不做编码转换
+    以大块读入并替换，非 UTF-8 或混合编码的内容原样输出
+    """
+    fin = sys.stdin.buffer
+    fout = sys.stdout.buffer
+    annotate = make_bytes_annotator()
+    counting = run_stats is not None
+
+    def write(block):
+        out = annotate(block)
+        fout.write(out)
+        if counting:
+            count_io(block.count(b'\n'), len(block), len(out))
+
+    if line_buffered or fout.isatty() or fin.isatty():
+        for line in fin:
+            write(line)
+            fout.flush()
+        return
+
+    # read1 有多少读多少，管道中数据来得慢时不必等满一块
+    rest = b''
+    while True:
+        block = fin.read1(binary_block_size)
+        if not block:
+            break
+        if rest:
+            block = rest + block
+        block, rest = split_block(block)
+        write(block)
+    if rest:
+        write(rest)
+    fout.flush()
+
+
+def split_file(file_path, chunk_size):
+    """将文件按行切分为约 chunk_size 字节的块，返回 (文件, 起始, 结束) 列表"""
+    size = os.path.getsize(file_path)
+    chunks = []
+    with open(file_path, 'rb') as f:
+        start = 0
+        while start < size:
+            f.seek(min(start + chunk_size, size))
+            f.readline()
+            end = min(f.tell(), size)
+            chunks.append((file_path, start, end))
+            start = end
+    return chunks
+
+
+# 子进程中的替换函数，由 init_worker 初始化
+worker_annotate = None
+
+
+def init_worker(data_file, at=None, cache_size=None, stats=False):
+    """子进程初始化：每个进程只装载一次数据，at 为 --at 指定的时间戳，
+    cache_size、stats 为主进程的 --cache-size 与 --stats
+    """
+    global worker_annotate, annotate_cache_size, lookup_stats
+    if cache_size is not None:
+        annotate_cache_size = cache_size
+    if stats:
+        lookup_stats = new_lookup_stats()
+    if not ip_dict:
+        load_data(data_file)
+    if at is not None:
+        view_notes_at(at)
+    worker_annotate = make_bytes_annotator(prebuild=True)
+
+
+def read_chunk(chunk):
+    """读取 split_file 切出的一块"""
+    file_path, start, end = chunk
+    with open(file_path, 'rb') as f:
+        f.seek(start)
+        return f.read(end - start)
+
+
+def annotate_chunk(chunk):
+    """子进程：读取文件中的一块并替换 IP"""
+    return worker_annotate(read_chunk(chunk))
+
+
+def annotate_chunk_stats(chunk):
+    """子进程：替换一块，同时返回处理这一块时的查找计数"""
+    block = annotate_chunk(chunk)
+    counts = dict(lookup_stats)
+    for key in lookup_stats:
+        lookup_stats[key] = 0
+    return block, counts
+
+
+def annotate_files(files, data_file, jobs=1, at=None):
+    """-a 模式处理日志文件：按行切块，多进程替换，按原顺序输出"""
+    fout = sys.stdout.buffer
+    chunks = []
+    for file_path in files:
+        if not os.path.isfile(file_path):
+            print(f"The file at {file_path} does not exist.", file=sys.stderr)
+            continue
+        chunks.extend(split_file(file_path, parallel_chunk_size))
+
+    counting = run_stats is not None
+    if jobs <= 1:
+        init_worker(data_file, at)
+        for chunk in chunks:
+            out = annotate_chunk(chunk)
+            fout.write(out)
+            if counting:
+                count_io(out.count(b'\n'), chunk[2] - chunk[1], len(out))
+        fout.flush()
+        return
+
+    import multiprocessing
+    # 限制同时在途的块数，避免输出慢时结果堆积在内存中
+    window = jobs * 4
+    pending = collections.deque()
+    stats = lookup_stats is not None
+    task = annotate_chunk_stats if stats else annotate_chunk
+
+    def write(chunk, result):
+        if stats:
+            result, counts = result
+            merge_lookup_stats(counts)
+        fout.write(result)
+        if counting:
+            count_io(result.count(b'\n'), chunk[2] - chunk[1], len(result))
+
+    with multiprocessing.Pool(jobs, initializer=init_worker,
+                              initargs=(data_file, at, annotate_cache_size, stats)) as pool:
+        for chunk in chunks:
+            pending.append((chunk, pool.apply_async(task, (chunk,))))
+            if len(pending) >= window:
+                chunk, result = pending.popleft()
+                write(chunk, result.get())
+        while pending:
+            chunk, result = pending.popleft()
+            write(chunk, result.get())
+    fout.flush()
+
+
+# --analyze 各部分默认输出的条数
+analyze_top = 10
+
+
+def find_ips(block):
+    """数据块中出现的全部 IP（字节），与 -a 替换的 IP 一致"""
+    findall = pattern_ip_bytes.findall
+    return [ip for fragment in pattern_ip_candidate_bytes.findall(block) for ip in findall(fragment)]
+
+
+class IpCounter:
+    """统计各 IP 出现的次数，结果为升序的 IP 整数数组与对应的次数数组
+
+    装有 NumPy 时每块中的 IP 向量化解析为 uint32，unique 计数后暂存，
+    暂存过多时用 bincount 归并；否则按字节串计数，结束时再转为整数
+    """
+
+    # 暂存的 (IP, 次数) 超过该条数时归并一次
+    merge_size = 1 << 20
+
+    def __init__(self, vectorized=True):
+        self.numpy = None
+        if vectorized:
+            try:
+                import numpy
+                self.numpy = numpy
+            except ImportError:
+                pass
+        self.counter = collections.Counter()
+        self.totals = collections.Counter()
+        self.parts = []
+        self.pending = 0
+        self.hits = 0
+
+    def add(self, block):
+        ips = find_ips(block)
+        self.hits += len(ips)
+        numpy = self.numpy
+        if numpy is None or not ips:
+            self.counter.update(ips)
+            return
+        self.append(*numpy.unique(parse_ips_numpy(numpy, ips), return_counts=True))
+
+    def append(self, ips, counts):
+        self.parts.append((ips, counts))
+        self.pending += len(ips)
+        if self.pending > self.merge_size:
+            self.reduce()
+
+    def reduce(self):
+        numpy = self.numpy
+        ips = numpy.concatenate([ips for ips, _ in self.parts])
+        counts = numpy.concatenate([counts for _, counts in self.parts])
+        ips, inverse = numpy.unique(ips, return_inverse=True)
+        counts = numpy.bincount(inverse, weights=counts, minlength=len(ips)).astype(numpy.uint64)
+        self.parts = [(ips, counts)]
+        self.pending = len(ips)
+
+    def merge(self, ips, counts, hits):
+        """合并子进程的结果"""
+        self.hits += hits
+        if self.numpy is None:
+            self.totals.update(dict(zip(ips, counts)))
+        else:
+            self.append(self.numpy.frombuffer(ips, dtype=self.numpy.uint32),
+                        self.numpy.frombuffer(counts, dtype=self.numpy.uint64))
+
+    def result(self):
+        """返回 (升序的 IP 整数数组, 次数数组)"""
+        totals = self.totals
+        for ip, count in self.counter.items():
+            totals[ip_to_int(ip.decode('ascii'))] += count
+        self.counter.clear()
+        numpy = self.numpy
+        if numpy is None:
+            ips = sorted(totals)
+            return array('I', ips), array('Q', [totals[n] for n in ips])
+        if totals:
+            self.append(numpy.array(list(totals), dtype=numpy.uint32),
+                        numpy.array(list(totals.values()), dtype=numpy.uint64))
+            totals.clear()
+        if not self.parts:
+            return array('I'), array('Q')
+        self.reduce()
+        ips, counts = self.parts[0]
+        return array('I', ips.astype(numpy.uint32).tobytes()), array('Q', counts.astype(numpy.uint64).tobytes())
+
+
+def count_ips(block):
+    """子进程：统计一块中的 IP，block 为数据或 split_file 切出的块
+    返回 (IP 数组字节, 次数数组字节, IP 总数, 行数, 字节数)
+    """
+    if isinstance(block, tuple):
+        block = read_chunk(block)
+    counter = IpCounter()
+    counter.add(block)
+    ips, counts = counter.result()
+    return ips.tobytes(), counts.tobytes(), counter.hits, block.count(b'\n'), len(block)
+
+
+def read_blocks(fin):
+    """按行边界分块读取，每块约 binary_block_size 字节"""
+    rest = b''
+    while True:
+        block = fin.read(binary_block_size)
+        if not block:
+            break
+        if rest:
+            block = rest + block
+        block, rest = split_block(block)
+        if block:
+            yield block
+    if rest:
+        yield rest
+
+
+def analyze(files=(), jobs=1, top=analyze_top):
+    """--analyze：一次扫描统计日志中各 IP 出现的次数，
+    再经 ip_dict/ip_range 与 ip_tag 按备注片段、标签汇总，输出各自的前 top 项及没有备注的 IP
+    files 为空时读取标准输入；jobs 大于 1 时分块交给进程池统计
+    """
+    if files:
+        blocks = []
+        for file_path in files:
+            if not os.path.isfile(file_path):
+                print(f"The file at {file_path} does not exist.", file=sys.stderr)
+                continue
+            size = parallel_chunk_size if jobs > 1 else binary_block_size
+            blocks.extend(split_file(file_path, size))
+    else:
+        blocks = read_blocks(sys.stdin.buffer)
+
+    counter = IpCounter()
+    counting = run_stats is not None
+    lines = 0
+    if jobs <= 1:
+        for block in blocks:
+            if isinstance(block, tuple):
+                block = read_chunk(block)
+            counter.add(block)
+            block_lines = block.count(b'\n')
+            lines += block_lines
+            if counting:
+                count_io(block_lines, len(block), 0)
+    else:
+        import multiprocessing
+        with multiprocessing.Pool(jobs) as pool:
+            for ips, counts, hits, block_lines, size in pool.imap(count_ips, blocks):
+                counter.merge(ips, counts, hits)
+                lines += block_lines
+                if counting:
+                    count_io(block_lines, size, 0)
+    ips, counts = counter.result()
+    print_analysis(ips, counts, counter.hits, lines, top)
+
+
+def print_analysis(ips, counts, hits, lines, top=analyze_top):
+    """按 IP、备注片段、标签汇总 IP 出现的次数并输出"""
+    note_counts = collections.Counter()
+    tag_counts = collections.Counter()
+    noted = []
+    unknown = []
+    for n, count, value, tags in zip(ips, counts, section_values(ip_dict, ips), section_values(ip_tag, ips)):
+        if value is None:
+            note = search_ip_range(int_to_ip(n))
+            value = None if note is None else note.split(' ')
+        if value is None:
+            unknown.append((n, count))
+        else:
+            noted.append((n, count, ' '.join(value)))
+            for part in value:
+                note_counts[part] += count
+        if tags:
+            for tag in tags:
+                tag_counts[tag] += count
+
+    unknown_hits = sum(count for _, count in unknown)
+    print(f'{hits} IPs in {lines} lines, {len(ips)} distinct, '
+          f'{len(unknown)} without notes ({unknown_hits} hits)')
+
+    # nlargest 对次数相同的项保持原有顺序，即 IP 升序
+    def count_key(row):
+        return row[1]
+
+    print()
+    print('Top IPs:')
+    print('-' * 30)
+    write_rows((int_to_ip(n), f'{count:<8}  {note}')
+               for n, count, note in heapq.nlargest(top, noted, key=count_key))
+    for title, totals in (('Top notes:', note_counts), ('Top tags:', tag_counts)):
+        print()
+        print(title)
+        print('-' * 30)
+        for key, count in totals.most_common(top):
+            print_summary_row(key, count)
+    print()
+    print('Unknown IPs:')
+    print('-' * 30)
+    write_rows((int_to_ip(n), count) for n, count in heapq.nlargest(top, unknown, key=count_key))
+
+
+# --follow 没有新内容时的轮询间隔（秒），从最小值起每次加倍，直到最大值
+follow_min_interval = 0.05
+follow_max_interval = 1.0
+
+# --follow 重新展开通配符以发现新文件、检查数据文件是否变化的间隔（秒）
+follow_rescan_interval = 5.0
+
+# --follow 一行超过该长度仍没有换行时直接输出
+follow_max_line = 1 << 20
+
+
+# --follow 记住每个文件已读位置之前的字节数，用于发现截断后又写到原位置之后的情况
+follow_mark_size = 64
+
+
+class FollowedFile:
+    """--follow 跟踪的一个日志文件
+
+    按 (设备, inode) 识别文件：路径指向新文件时（日志轮转）读完旧文件再从头读新文件；
+    已读位置之前的最后 follow_mark_size 字节变化时（copytruncate 等截断，包括截断后
+    又写到原位置之后）从头读。文件不经缓冲打开，每次比较的都是磁盘上的当前内容
+    """
+
+    def __init__(self, path, from_start):
+        self.path = path
+        self.file = None
+        self.ino = None
+        self.mark = b''
+        self.rest = b''
+        self.open(from_start)
+
+    def open(self, from_start):
+        try:
+            f = open(self.path, 'rb', buffering=0)
+        except OSError:
+            return False
+        st = os.fstat(f.fileno())
+        self.mark = b''
+        if not from_start:
+            f.seek(max(st.st_size - follow_mark_size, 0))
+            self.mark = f.read(follow_mark_size)
+        self.file = f
+        self.ino = (st.st_dev, st.st_ino)
+        return True
+
+    def truncated(self):
+        """已读位置之前的内容是否与读到时不同"""
+        pos = self.file.tell()
+        self.file.seek(pos - len(self.mark))
+        same = self.file.read(len(self.mark)) == self.mark
+        self.file.seek(pos)
+        return not same
+
+    def read(self, size):
+        """读取新内容，没有时返回 b''"""
+        if self.file is None and not self.open(True):
+            return b''
+        if self.mark and self.truncated():
+            self.file.seek(0)
+            self.mark = b''
+            if self.rest:
+                # 截断前末尾没有换行的内容单独成行
+                self.rest += b'\n'
+        data = self.file.read(size)
+        if data:
+            self.mark = (self.mark + data)[-follow_mark_size:]
+            return data
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            # 轮转时旧文件已移走、新文件尚未创建
+            return b''
+        if (st.st_dev, st.st_ino) != self.ino:
+            self.file.close()
+            self.file = None
+            if self.open(True):
+                data = self.file.read(size)
+                self.mark = data[-follow_mark_size:]
+                return data
+        return b''
+
+    def read_lines(self, size):
+        """返回新读到的完整行，不完整的行留到下次；过长的行及轮转前的最后一行直接返回"""
+        ino = self.ino
+        data = self.read(size)
+        if not data:
+            return b''
+        if ino != self.ino and self.rest:
+            # 读到了新文件，旧文件末尾没有换行的内容单独成行
+            self.rest += b'\n'
+        data = self.rest + data
+        cut = data.rfind(b'\n') + 1
+        if not cut and len(data) > follow_max_line:
+            cut = len(data)
+        self.rest = data[cut:]
+        return data[:cut]
+
+    def close(self):
+        if self.file:
+            self.file.close()
+
+
+def route_base(patterns):
+    """--route 输出文件的起始目录：各模式中通配符之前的目录的公共上级目录，位于不同盘符时为 None"""
+    directories = []
+    for pattern in patterns:
+        directory = os.path.dirname(pattern)
+        while any(c in directory for c in '*?['):
+            directory = os.path.dirname(directory)
+        directories.append(os.path.abspath(directory))
+    try:
+        return os.path.commonpath(directories)
+    except ValueError:
+        return None
+
+
+class LogFollower:
+    """-a --follow：在一个事件循环中同时跟踪多个日志文件，共用一份已装载的数据
+
+    每个文件一个协程，每次最多读取 read_block_size 字节，读完即让出，某个文件写入量大时不会拖住其他文件；
+    没有新内容时轮询间隔逐次加倍，空闲文件几乎不占 CPU
+    """
+
+    def __init__(self, patterns, data_file, prefix=True, route=None, at=None):
+        self.patterns = patterns
+        self.data_file = data_file
+        self.prefix = prefix
+        self.route = route
+        self.base = route_base(patterns) if route else None
+        self.at = at
+        unpin_snapshot()
+        self.annotate = make_bytes_annotator(prebuild=True)
+        self.signature = data_signature(data_file)
+        self.tasks = dict()
+        self.outputs = dict()
+        self.stopped = None
+
+    def expand(self):
+        """展开通配符，返回当前存在的文件"""
+        import glob
+        paths = []
+        for pattern in self.patterns:
+            for path in sorted(glob.glob(pattern)) or [pattern]:
+                if os.path.isfile(path):
+                    paths.append(path)
+        return paths
+
+    def route_path(self, path):
+        """--route 时 path 对应的输出文件：保留相对于 base 的子目录，
+        a/access.log 与 b/access.log 分别写入 route/a/access.log 与 route/b/access.log
+        """
+        path = os.path.abspath(path)
+        if self.base is None:
+            name = path.replace(':', '').lstrip('\\/')
+        else:
+            name = os.path.relpath(path, self.base)
+        return os.path.join(self.route, name)
+
+    def write(self, path, block):
+        """输出替换后的完整行：按来源文件写入 --route 目录，或在每行前加上文件名"""
+        if self.route:
+            out = self.outputs.get(path)
+            if out is None:
+                target = self.route_path(path)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                out = self.outputs[path] = open(target, 'ab')
+        else:
+            out = sys.stdout.buffer
+            if self.prefix:
+                label = path.encode('utf-8', 'surrogateescape') + b': '
+                block = label + block[:-1].replace(b'\n', b'\n' + label) + block[-1:]
+        out.write(block)
+        out.flush()
+
+    async def follow(self, path, from_start):
+        """跟踪一个文件"""
+        import asyncio
+        followed = FollowedFile(path, from_start)
+        interval = follow_min_interval
+        try:
+            while True:
+                block = followed.read_lines(read_block_size)
+                if block:
+                    out = self.annotate(block)
+                    self.write(path, out)
+                    if run_stats is not None:
+                        count_io(block.count(b'\n'), len(block), len(out))
+                    interval = follow_min_interval
+                    await asyncio.sleep(0)
+                else:
+                    await asyncio.sleep(interval)
+                    interval = min(interval * 2, follow_max_interval)
+        except BrokenPipeError:
+            # 输出管道已关闭（如 | head），结束跟踪
+            self.stopped.set()
+        finally:
+            followed.close()
+
+    async def run(self):
+        """启动时已有的文件从末尾开始跟踪，之后出现的新文件从头读取；数据文件变化时重新装载"""
+        import asyncio
+        self.stopped = asyncio.Event()
+        from_start = False
+        while not self.stopped.is_set():
+            for path in self.expand():
+                if path not in self.tasks:
+                    self.tasks[path] = asyncio.ensure_future(self.follow(path, from_start))
+            from_start = True
+            try:
+                await asyncio.wait_for(self.stopped.wait(), follow_rescan_interval)
+            except asyncio.TimeoutError:
+                pass
+            signature = data_signature(self.data_file)
+            if signature != self.signature:
+                load_data(self.data_file, ('dict', 'range'))
+                if self.at is not None:
+                    view_notes_at(self.at)
+                unpin_snapshot()
+                self.annotate = make_bytes_annotator(prebuild=True)
+                self.signature = signature
+
+    def close(self):
+        for out in self.outputs.values():
+            out.close()
+
+
+def follow_logs(patterns, data_file, route=None, at=None):
+    """-a --follow：持续替换多个日志文件中新写入的内容，直到 Ctrl-C
+    跟踪多个文件或使用通配符时每行前加上文件名；指定 route 目录时按来源文件分别写入该目录
+    """
+    import asyncio
+    prefix = len(patterns) > 1 or any(c in pattern for pattern in patterns for c in '*?[')
+    follower = LogFollower(patterns, data_file, prefix=prefix, route=route, at=at)
+    try:
+        asyncio.run(follower.run())
+    except (KeyboardInterrupt, BrokenPipeError):
+        pass
+    finally:
+        follower.close()
+
+
+# --serve 守护进程检查数据文件是否变化的间隔（秒）
+serve_check_interval = 1.0
+
+# --serve-status 列出的最近结束的客户端数量
+serve_finished_clients = 20
+
+
+def socket_path(data_file):
+    """守护进程默认的 Unix socket 路径，与数据文件放在一起"""
+    return data_file + '.sock'
+
+
+def data_signature(data_file):
+    """数据文件及导入日志的 (修改时间, 大小)，不同时说明数据有更新"""
+    signature = []
+    for path in (data_file, data_file + '.journal'):
+        try:
+            st = os.stat(path)
+        except OSError:
+            signature += [0, 0]
+        else:
+            signature += [st.st_mtime_ns, st.st_size]
+    return tuple(signature)
+
+
+def make_serve_annotator():
+    """--serve 使用的按字节替换函数
+
+    备注全部预先编码，网段索引也在此时取出，返回的函数不再引用全局数据，
+    重新装载时可在后台线程中生成新的函数后整体替换
+    """
+    note_bytes = build_note_table(ip_dict, encode=True)
+    starts, ends, notes = build_range_index() if ip_range else (array('I'), array('I'), [])
+    notes = [note.encode('utf-8') for note in notes]
+    ip_sub = pattern_ip_bytes.sub
+    sub = pattern_ip_candidate_bytes.sub
+
+    def replace_ip_bytes(match):
+        ip = match.group()
+        note = note_bytes.get(ip)
+        if note is not None:
+            return note
+        if starts:
+            n = ip_to_int(ip.decode('ascii'))
+            pos = bisect.bisect_right(starts, n) - 1
+            if pos >= 0 and n <= ends[pos]:
+                return ip + b' [' + notes[pos] + b']'
+        return ip
+
+    def replace(match):
+        return ip_sub(replace_ip_bytes, match.group())
+
+    def annotate(block):
+        if b'.' not in block:
+            return block
+        return sub(replace, block)
+
+    return annotate
+
+
+def load_private(file_path, sections):
+    """在本模块的一个独立副本中装载数据并返回该副本
+
+    装载过程会重新绑定数据段、索引、已打开的数据文件等全局变量，副本的全局变量与本模块互不相干，
+    后台线程中装载不会改动事件循环线程正在使用的数据；副本不再被引用时连同其数据一起释放
+    """
+    import importlib.util
+    spec = importlib.util.spec_from_file_location(__name__, __file__)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.load_data(file_path, sections)
+    module.unpin_snapshot()
+    return module
+
+
+class AnnotateServer:
+    """--serve 守护进程：只装载一次数据，用 asyncio 同时为多个客户端替换 IP
+
+    客户端连接后先发送一行命令：'annotate 数据文件签名' 之后是要替换的内容，
+    'status' 返回各客户端的统计。数据文件变化时在后台线程中把数据装载到模块的独立副本，
+    生成替换函数后回到事件循环线程替换 self.annotate 这一个引用，装载完成前继续使用旧数据
+    """
+
+    def __init__(self, data_file):
+        self.data_file = data_file
+        self.annotate = None
+        self.signature = None
+        self.loaded_at = None
+        self.reloads = 0
+        self.reloading = None
+        self.next_id = 1
+        # 各客户端的统计 {'id', 'start', 'end', 'lines', 'bytes_in', 'bytes_out'}
+        self.clients = dict()
+        self.finished = collections.deque(maxlen=serve_finished_clients)
+
+    def load(self):
+        """装载数据并生成替换函数，在后台线程中执行，不改动本模块的全局变量"""
+        signature = data_signature(self.data_file)
+        data = load_private(self.data_file, ('dict', 'range'))
+        return signature, data.make_serve_annotator()
+
+    async def reload(self):
+        """重新装载数据，多个客户端同时要求时只装载一次"""
+        import asyncio
+        if self.reloading is None:
+            self.reloading = asyncio.ensure_future(self.do_reload())
+        await asyncio.shield(self.reloading)
+
+    async def do_reload(self):
+        import asyncio
+        signature = data_signature(self.data_file)
+        try:
+            signature, annotate = await asyncio.get_running_loop().run_in_executor(None, self.load)
+        except Exception as e:
+            # 装载失败时保留旧数据，数据文件再次变化时重试
+            print(f"reload {self.data_file} failed: {e!r}", file=sys.stderr)
+        else:
+            self.annotate = annotate
+            self.loaded_at = time.time()
+            self.reloads += 1
+        finally:
+            self.signature = signature
+            self.reloading = None
+
+    async def watch(self):
+        """定期检查数据文件，变化时重新装载"""
+        import asyncio
+        while True:
+            await asyncio.sleep(serve_check_interval)
+            if data_signature(self.data_file) != self.signature:
+                await self.reload()
+
+    async def handle(self, reader, writer):
+        """处理一个客户端连接"""
+        try:
+            command = (await reader.readline()).split()
+            if command[:1] == [b'status']:
+                writer.write(self.status().encode('utf-8'))
+            elif command[:1] == [b'annotate']:
+                # 客户端看到的数据文件比已装载的新（如刚导入完），先重新装载，保证结果与本地替换一致
+                if tuple(int(i) for i in command[1:]) not in ((), self.signature):
+                    await self.reload()
+                await self.stream(reader, writer)
+            await writer.drain()
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def stream(self, reader, writer):
+        """按块读入客户端的内容，在最后一个换行处切分后替换并写回"""
+        stats = {'id': self.next_id, 'start': time.time(), 'end': None, 'lines': 0, 'bytes_in': 0, 'bytes_out': 0}
+        self.next_id += 1
+        self.clients[stats['id']] = stats
+        rest = b''
+        try:
+            while True:
+                block = await reader.read(read_block_size)
+                if not block:
+                    break
+                stats['bytes_in'] += len(block)
+                block, rest = split_block(rest + block)
+                if block:
+                    self.write(writer, stats, block)
+                    await writer.drain()
+            if rest:
+                self.write(writer, stats, rest)
+        finally:
+            stats['end'] = time.time()
+            del self.clients[stats['id']]
+            self.finished.append(stats)
+
+    def write(self, writer, stats, block):
+        out = self.annotate(block)
+        stats['lines'] += block.count(b'\n')
+        stats['bytes_out'] += len(out)
+        writer.write(out)
+
+    def status(self):
+        """守护进程及各客户端的统计"""
+        lines = [f"data file: {self.data_file}, loaded {format_time(self.loaded_at)}, {self.reloads} loads",
+                 f"clients: {len(self.clients)} active, {self.next_id - 1} total",
+                 f"{'id':>6}  {'state':<8} {'lines':>12} {'MB in':>10} {'MB out':>10} {'secs':>8} {'MB/s':>8}"]
+        now = time.time()
+        for stats, state in [(s, 'active') for s in self.clients.values()] + [(s, 'done') for s in self.finished]:
+            elapsed = (stats['end'] or now) - stats['start']
+            rate = stats['bytes_in'] / 1e6 / max(elapsed, 1e-9)
+            lines.append(f"{stats['id']:>6}  {state:<8} {stats['lines']:>12} {stats['bytes_in'] / 1e6:>10.2f} "
+                         f"{stats['bytes_out'] / 1e6:>10.2f} {elapsed:>8.1f} {rate:>8.2f}")
+        return '\n'.join(lines) + '\n'
+
+    async def run(self, path):
+        import asyncio
+        import signal
+        await self.reload()
+        if self.annotate is None:
+            return
+        server = await asyncio.start_unix_server(self.handle, path=path)
+        # 只允许当前用户连接
+        os.chmod(path, 0o600)
+        print(f"serving {self.data_file} on {path}", file=sys.stderr)
+        task = asyncio.current_task()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, task.cancel)
+        try:
+            async with server:
+                await self.watch()
+        except asyncio.CancelledError:
+            pass
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def connect_daemon(path):
+    """连接 --serve 守护进程，没有运行时返回 None"""
+    # 多数情况下守护进程没有运行，先检查 socket 文件，不必导入 socket 模块
+    if not os.path.exists(path):
+        return None
+    import socket
+    if not hasattr(socket, 'AF_UNIX'):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        return None
+    return sock
+
+
+def serve(data_file, path):
+    """--serve：启动守护进程，直到收到 SIGINT/SIGTERM"""
+    import asyncio
+    import socket
+    if not hasattr(socket, 'AF_UNIX'):
+        print("--serve requires Unix domain sockets", file=sys.stderr)
+        return
+    daemon = connect_daemon(path)
+    if daemon:
+        daemon.close()
+        print(f"already serving on {path}", file=sys.stderr)
+        return
+    if os.path.exists(path):
+        # 上次异常退出留下的 socket 文件
+        os.remove(path)
+    asyncio.run(AnnotateServer(data_file).run(path))
+
+
+def run_client(sock, data_file, line_buffered=False):
+    """-a 模式通过守护进程替换：把标准输入原样转发给守护进程，输出返回的内容
+    按字节处理，与 --binary 相同；标准输入有多少读多少，tail -f 等实时输入不会积压
+    """
+    import socket
+    import threading
+    sock.sendall(('annotate ' + ' '.join(map(str, data_signature(data_file))) + '\n').encode('ascii'))
+    fout = sys.stdout.buffer
+    flush = line_buffered or fout.isatty() or sys.stdin.isatty()
+
+    def receive():
+        while True:
+            data = sock.recv(binary_block_size)
+            if not data:
+                break
+            fout.write(data)
+            if flush:
+                fout.flush()
+        fout.flush()
+
+    receiver = threading.Thread(target=receive)
+    receiver.start()
+    fd = sys.stdin.fileno()
+    while True:
+        data = os.read(fd, read_block_size)
+        if not data:
+            break
+        sock.sendall(data)
+    sock.shutdown(socket.SHUT_WR)
+    receiver.join()
+    sock.close()
+
+
+def print_server_status(path):
+    """--serve-status：输出守护进程的统计"""
+    sock = connect_daemon(path)
+    if sock is None:
+        print(f"no daemon on {path}", file=sys.stderr)
+        return
+    with sock:
+        sock.sendall(b'status\n')
+        chunks = []
+        while True:
+            data = sock.recv(1 << 16)
+            if not data:
+                break
+            chunks.append(data)
+    sys.stdout.write(b''.join(chunks).decode('utf-8'))
+
+
+def show():
+    """显示 IP 字典内容"""
+
+    print('IP dict:')
+    print('-' * 30)
+
+    if not ip_dict:
+        print('(empty)')
+    else:
+        foreach_dict(ip_dict)
+
+    print()
+    print('IP range dict:')
+    print('-' * 30)
+
+    if not ip_range:
+        print('(empty)')
+    else:
+        foreach_dict(ip_range)
+
+    print()
+    print('IP history:')
+    print('=' * 30)
+
+    if not ip_history:
+        print('(empty)')
+    else:
+        for key, versions in ip_history.items():
+            for when, notes in versions:
+                print(f"{key}: {notes} (until {format_time(when)})")
+
+
+def loaded(section):
+    """返回已装载的数据段"""
+    return section.load() if isinstance(section, LazySection) else section
+
+
+def iter_sorted_notes(start=0, end=ip_max):
+    """按 IP 顺序遍历 ip_dict 中位于 [start, end] 的 IP，返回 (IP整数, IP, 备注)"""
+    notes = loaded(ip_dict)
+    if db_conn and isinstance(notes, SqliteNotes) and not notes.dirty:
+        yield from db_conn.execute('SELECT ip, addr, note FROM ip_note WHERE ip BETWEEN ? AND ? ORDER BY ip',
+                                   (start, end))
+        return
+    if isinstance(notes, CompactNotes):
+        for n, i in notes.rows(start, end):
+            yield n, int_to_ip(n), ' '.join(notes.table[i])
+        return
+    if isinstance(notes, MappedNotes):
+        # ipdb 中已按 IP 排序
+        keys, ids, string = notes.keys, notes.ids, notes.db.string
+        for i in range(bisect.bisect_left(keys, start), bisect.bisect_right(keys, end)):
+            yield keys[i], int_to_ip(keys[i]), string(ids[i])
+        return
+
+    order = sorted_order('dict', notes, len(notes))
+    for n in order[bisect.bisect_left(order, start):bisect.bisect_right(order, end)]:
+        ip = int_to_ip(n)
+        yield n, ip, ' '.join(notes[ip])
+
+
+def iter_sorted_history(start=0, end=ip_max, with_time=False):
+    """按 IP 顺序遍历 ip_history 中起始 IP 位于 [start, end] 的记录，返回 (起始IP整数, key, 备注)
+    with_time 为 True 时返回 (起始IP整数, key, 备注, 被替换的时间戳)
+    """
+    history = loaded(ip_history)
+    if db_conn and isinstance(history, SqliteHistory) and not history.added and not history.removed:
+        columns = 'ip, addr, note, time' if with_time else 'ip, addr, note'
+        yield from db_conn.execute(f'SELECT {columns} FROM ip_history WHERE ip BETWEEN ? AND ? '
+                                   'ORDER BY ip, addr, time, rowid', (start, end))
+        return
+    if isinstance(history, MappedHistory):
+        lo, hi = bisect.bisect_left(history.keys, start), bisect.bisect_right(history.keys, end)
+        if with_time:
+            for i in range(lo, hi):
+                key, when, notes = history.version(i)
+                yield history.keys[i], key, ' '.join(notes), when
+            return
+        for n, text in zip(history.keys[lo:hi], history.strings(lo, hi)):
+            key, _, note = text.partition(' ')
+            yield n, key, note
+        return
+
+    # 单个 IP 按排序索引查找，网段/范围较少，单独排序后按起始 IP 穿插输出；同一 key 的版本按时间先后输出
+    ips = []
+    ranges = []
+    for key in history:
+        if is_ipv4(key):
+            ips.append(key)
+        else:
+            bounds = ip_sort_key(key)
+            if start <= bounds[0] <= end:
+                ranges.append((bounds, key))
+    ranges.sort()
+    order = sorted_order('history', ips, len(ips))
+    ips = (((n, n), int_to_ip(n)) for n in order[bisect.bisect_left(order, start):bisect.bisect_right(order, end)])
+
+    for (n, _), key in heapq.merge(ips, ranges):
+        for when, notes in history[key]:
+            if with_time:
+                yield n, key, ' '.join(notes), when
+            else:
+                yield n, key, ' '.join(notes)
+
+
+def iter_sorted_tags(start=0, end=ip_max):
+    """按 IP 顺序遍历 ip_tag 中位于 [start, end] 的 IP，每个标签返回一条 (IP整数, IP, 标签)"""
+    tagged = loaded(ip_tag)
+    if db_conn and isinstance(tagged, SqliteTags) and not tagged.cache:
+        yield from db_conn.execute('SELECT ip, addr, tag FROM ip_tag WHERE ip BETWEEN ? AND ? ORDER BY ip, tag',
+                                   (start, end))
+        return
+    if isinstance(tagged, CompactTags):
+        for n, i in tagged.rows(start, end):
+            ip = int_to_ip(n)
+            for tag in sorted(tagged.decode(i)):
+                yield n, ip, tag
+        return
+    if isinstance(tagged, MappedTags):
+        keys, ids, string = tagged.keys, tagged.ids, tagged.db.string
+        for i in range(bisect.bisect_left(keys, start), bisect.bisect_right(keys, end)):
+            ip = int_to_ip(keys[i])
+            for tag in string(ids[i]).split(' '):
+                yield keys[i], ip, tag
+        return
+
+    order = sorted_order('tag', tagged, len(tagged))
+    for n in order[bisect.bisect_left(order, start):bisect.bisect_right(order, end)]:
+        ip = int_to_ip(n)
+        for tag in sorted(tagged[ip]):
+            yield n, ip, tag
+
+
+# -od/-oh/-ot 等输出时每次写出的行数
+write_block_rows = 4096
+
+
+def write_rows(rows, width=15):
+    """输出 (IP, 备注) 行，ipv4 最宽15个字符，IP 左对齐
+    按块拼接后写出，避免每行一次 print
+    """
+    write = sys.stdout.write
+    block = []
+    for ip, note in rows:
+        block.append(f'{ip:<{width}}    {note}\n')
+        if len(block) >= write_block_rows:
+            write(''.join(block))
+            block.clear()
+    write(''.join(block))
+    sys.stdout.flush()
+
+
+def sort_ip_dict():
+    """ ip 排序 """
+    write_rows((ip, note) for _, ip, note in iter_sorted_notes())
+
+
+def sort_ip_history():
+    """对历史IP数据排序并打印"""
+    write_rows((key, note) for _, key, note in iter_sorted_history())
+
+
+def sort_ip_range():
+    """网段/范围排序并打印，key 比单个 IP 长，单独输出（-or），列宽取最长的 key"""
+    keys = sorted(ip_range, key=ip_sort_key)
+    width = max(map(len, keys), default=15)
+    write_rows(((key, ' '.join(ip_range[key])) for key in keys), width)
+
+
+def sort_ip_tag():
+    """ ip 排序 """
+    write_rows((ip, tag) for _, ip, tag in iter_sorted_tags())
+
+
+def dump_ip_current():
+    """导出IP 备注信息"""
+    sort_ip_dict()
+    sort_ip_range()
+    sort_ip_history()
+
+
+# --export/--import-format 支持的格式
+export_formats = ('csv', 'jsonl', 'tsv')
+
+# --export 输出缓冲区的大小，按块拼接后整块写出
+export_buffer_size = 1 << 20
+
+# csv/tsv 的表头；备注与标签不含空白，以空格连接即可无损还原
+export_columns = ('type', 'key', 'time', 'values')
+
+
+def sorted_texts(name, section, text):
+    """按 IP 顺序返回字典或紧凑结构中的 (IP, text(值))
+    IP 整块转换；紧凑结构每种值只转换一次
+    """
+    section = loaded(section)
+    order = sorted_order(name, section, len(section))
+    ips = ints_to_ips(order)
+    if isinstance(section, CompactSection):
+        texts = [text(section.decode(i)) for i in range(len(section.table))]
+        return zip(ips, map(texts.__getitem__, section.ids))
+    return ((ip, text(section[ip])) for ip in ips)
+
+
+def export_rows(since=None):
+    """按 IP 顺序遍历全部数据，返回 (类型, key, 时间戳或 None, 以空格连接的值)
+    类型依次为 note、range、tag、history；note、range 的时间为第一次导入的时间，没有记录时为 None，
+    history 的时间为被替换的时间；since 为时间戳时只输出此后被替换的历史版本
+    """
+    notes = loaded(ip_dict)
+    added = loaded(ip_added)
+    if isinstance(notes, (dict, CompactNotes)):
+        rows = sorted_texts('dict', notes, ' '.join)
+    else:
+        rows = ((ip, note) for _, ip, note in iter_sorted_notes())
+    if isinstance(notes, (dict, CompactNotes)) and isinstance(added, CompactTimes):
+        # 两者都按 IP 顺序，导入时间按数组归并查找
+        times = section_values(added, sorted_order('dict', notes, len(notes)))
+        for (ip, note), when in zip(rows, times):
+            yield 'note', ip, when, note
+    else:
+        get = added.get
+        for ip, note in rows:
+            yield 'note', ip, get(ip), note
+    for key in sorted(ip_range, key=ip_sort_key):
+        yield 'range', key, added.get(key), ' '.join(ip_range[key])
+    tagged = loaded(ip_tag)
+    if isinstance(tagged, (dict, CompactTags)):
+        rows = sorted_texts('tag', tagged, lambda tags: ' '.join(sorted(tags)))
+    else:
+        rows = ((ip, ' '.join(tag for _, _, tag in group))
+                for ip, group in itertools.groupby(iter_sorted_tags(), key=lambda row: row[1]))
+    for ip, tags in rows:
+        yield 'tag', ip, None, tags
+    for _, key, note, when in iter_sorted_history(with_time=True):
+        if since is None or when >= since:
+            yield 'history', key, when, note
+
+
+def format_export_block(rows, fmt):
+    """将一块 export_rows 的结果格式化为文本"""
+    if fmt == 'jsonl':
+        # 类型、IP、时间无需转义，只转义备注与标签，输出与 json.dumps(ensure_ascii=False) 相同
+        from json.encoder import encode_basestring
+        return ''.join(f'{{"type": "{kind}", "key": "{key}", '
+                       + ('' if when is None else f'"time": {when}, ')
+                       + f'"values": [{", ".join(map(encode_basestring, values.split(" ")))}]}}\n'
+                       for kind, key, when, values in rows)
+    if fmt == 'tsv':
+        return ''.join(f"{kind}\t{key}\t{'' if when is None else when}\t{values}\n"
+                       for kind, key, when, values in rows)
+    import csv
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator='\n').writerows(rows)
+    return buffer.getvalue()
+
+
+def open_export_file(file_path, mode):
+    """打开导出文件，.gz 结尾时 gzip 压缩，'-' 或空为标准输入/输出（二进制）"""
+    if not file_path or file_path == '-':
+        return contextlib.nullcontext(sys.stdin.buffer if mode == 'rb' else sys.stdout.buffer)
+    if file_path.endswith('.gz'):
+        import gzip
+        return gzip.open(file_path, mode, compresslevel=6)
+    return open(file_path, mode, buffering=export_buffer_size)
+
+
+def export_data(fmt, file_path=None, since=None):
+    """--export：以 fmt 格式按 IP 顺序导出备注、网段、标签与历史，每攒满一块整块编码写出"""
+    block = []
+    size = 0
+    with open_export_file(file_path, 'wb') as f:
+        if fmt != 'jsonl':
+            f.write(('\t' if fmt == 'tsv' else ',').join(export_columns).encode('utf-8') + b'\n')
+        for row in export_rows(since):
+            block.append(row)
+            size += len(row[3]) + 24
+            if size >= export_buffer_size:
+                f.write(format_export_block(block, fmt).encode('utf-8'))
+                block.clear()
+                size = 0
+        f.write(format_export_block(block, fmt).encode('utf-8'))
+        f.flush()
+
+
+def read_export_rows(f, fmt):
+    """读取 --export 的输出，返回 (类型, key, 时间戳或 None, 值元组)，跳过表头，格式不对的行类型为 None"""
+    text = io.TextIOWrapper(f, encoding='utf-8', newline='')
+    try:
+        if fmt == 'jsonl':
+            import json
+            for line in text:
+                if not line.strip():
+                    continue
+                try:
+                    item = json.loads(line)
+                except ValueError:
+                    yield None, line.strip(), None, ()
+                    continue
+                yield item.get('type'), item.get('key'), item.get('time'), tuple(item.get('values') or ())
+            return
+        if fmt == 'tsv':
+            rows = (line.rstrip('\r\n').split('\t') for line in text)
+        else:
+            import csv
+            rows = csv.reader(text)
+        for row in rows:
+            if row == list(export_columns):
+                continue
+            if len(row) != len(export_columns):
+                yield None, ' '.join(row), None, ()
+                continue
+            kind, key, when, values = row
+            yield kind, key, int(when) if when.isdigit() else None, tuple(values.split(' ')) if values else ()
+    finally:
+        # 不随包装对象关闭标准输入
+        text.detach()
+
+
+def import_export(paths, fmt):
+    """--import-format：导入 --export 的输出
+
+    数据段为空时（如恢复到新数据文件）直接整体生成，IP 较多时生成紧凑结构；
+    否则按导入记录合并：备注替换当前备注（旧备注存为历史）、标签取并集、历史中已有的版本跳过
+    """
+    global ip_dict, ip_history, ip_tag, ip_added
+    start = time.perf_counter()
+    materialize_data()
+    notes, tags, ranges, history = dict(), dict(), dict(), []
+    # 备注与网段第一次导入的时间
+    added = dict()
+    rows = 0
+    rejected = []
+    for path in paths:
+        if path != '-' and not os.path.exists(path):
+            print(f"The file at {path} does not exist.", file=sys.stderr)
+            continue
+        with open_export_file(path, 'rb') as f:
+            for kind, key, when, values in read_export_rows(f, fmt):
+                rows += 1
+                if not values or not isinstance(key, str):
+                    rejected.append(key)
+                    continue
+                if kind in ('note', 'tag') and is_ipv4(key):
+                    (notes if kind == 'note' else tags)[key] = values
+                    if kind == 'note' and isinstance(when, int):
+                        added[key] = when
+                elif kind == 'range' and parse_ip_range(key):
+                    ranges[key] = values
+                    if isinstance(when, int):
+                        added[key] = when
+                elif kind == 'history' and isinstance(when, int) and (is_ipv4(key) or parse_ip_range(key)):
+                    history.append((key, when, values))
+                else:
+                    rejected.append(key)
+    if not loaded(ip_dict):
+        ip_dict = compact_section(notes, CompactNotes)
+        if not loaded(ip_added):
+            ip_added = compact_section({key: when for key, when in added.items() if key in notes}, CompactTimes)
+        reset_indexes()
+    else:
+        for key, values in notes.items():
+            new = key not in ip_dict
+            apply_record('note', key, values)
+            if new and key in added:
+                ip_added[key] = added[key]
+    if not loaded(ip_tag):
+        ip_tag = compact_section({key: set(values) for key, values in tags.items()}, CompactTags)
+    else:
+        for key, values in tags.items():
+            apply_record('tag', key, values)
+    for key, values in ranges.items():
+        new = key not in ip_range
+        apply_record('range', key, values)
+        if new and key in added:
+            ip_added[key] = added[key]
+    if isinstance(ip_history, dict) and not ip_history:
+        ip_history = dict()
+        for key, when, values in history:
+            if key in ip_history:
+                ip_history[key].append((when, values))
+            else:
+                ip_history[key] = [(when, values)]
+        for versions in ip_history.values():
+            versions.sort(key=lambda version: version[0])
+        build_history_index(ip_history)
+    else:
+        for key, when, values in history:
+            versions = ip_history.get(key) or ()
+            if (when, values) not in versions:
+                add_history(key, when, values)
+
+    if rejected:
+        sample = ', '.join(repr(k) for k in rejected[:5])
+        print(f"Warning: invalid rows: {len(rejected)}, e.g. {sample}", file=sys.stderr)
+    elapsed = time.perf_counter() - start
+    print(f"imported {rows} rows: {len(notes)} notes, {len(ranges)} ranges, {len(tags)} tags, "
+          f"{len(history)} history versions, {elapsed:.2f}s ({rows / max(elapsed, 1e-9):.0f} rows/s)",
+          file=sys.stderr)
+
+
+def erase(data_file_path):
+    """重置数据文件"""
+    global ip_dict, ip_history, ip_tag, ip_range, ip_added, range_index
+    materialize_data()
+    while True:
+        user_input = input("请确认操作 (yes/no): ").lower()  # 将输入转换为小写，以便不区分大小写
+        if user_input == 'yes':
+            ip_dict = dict()
+            ip_history = dict()
+            ip_tag = dict()
+            ip_range = dict()
+            ip_added = dict()
+            range_index = None
+            reset_indexes()
+            pending_records.clear()
+            save_data(data_file_path)
+            break
+        elif user_input == 'no':
+            print("取消操作。")
+            break
+        else:
+            print("无效的输入，请输入 'yes' 或 'no'。")
+
+
+def search_arg(query, include_all=False):
+    """按 IP 条件搜索并按 IP 顺序输出
+    条件见 parse_query，在排序索引上二分查找；include_all 时同时输出历史与标签中的命中。
+    无法解析为 IP 条件时按子串搜索
+    """
+    bounds = parse_query(query)
+    if bounds is None:
+        search_substring(query)
+        return
+    start, end = bounds
+    rows = iter_sorted_notes(start, end)
+    if include_all:
+        history = ((n, key, 'history: ' + note) for n, key, note in iter_sorted_history(start, end))
+        tagged = ((n, ip, 'tag: ' + tag) for n, ip, tag in iter_sorted_tags(start, end))
+        # IP 相同时按备注、历史、标签的顺序输出
+        rows = heapq.merge(rows, history, tagged, key=lambda row: row[0])
+    write_rows((ip, note) for _, ip, note in rows)
+
+
+def like_pattern(text):
+    """包含 text 的 SQL LIKE 模式，转义其中的通配符"""
+    return '%' + text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+def search_substring(text):
+    """在字典中搜索包含 text 的 IP 并打印"""
+    if db_conn and isinstance(ip_dict, SqliteNotes):
+        rows = db_conn.execute("SELECT addr, note FROM ip_note WHERE addr LIKE ? ESCAPE '\\' ORDER BY ip",
+                               (like_pattern(text),))
+        write_rows(rows)
+        return
+
+    write_rows((key, ' '.join(value)) for key, value in ip_dict.items() if text in key)
+
+
+def find_note(query):
+    """按备注内容反查 IP，按 IP 顺序输出
+    pickle 数据文件使用备注倒排索引求候选 IP 再逐个核对；ipdb/SQLite 数据文件按同样的条件逐条匹配，
+    SQLite 先用 LIKE 过滤
+    """
+    groups = parse_note_query(query)
+    if not groups:
+        return
+    notes = loaded(ip_dict)
+
+    if isinstance(notes, (dict, CompactNotes)):
+        index = update_note_index()
+        found = set()
+        for terms in groups:
+            ips = None
+            for term in terms:
+                ips = term_ips(index, term) if ips is None else ips & term_ips(index, term)
+                if not ips:
+                    break
+            found |= ips
+        write_rows((int_to_ip(n), ' '.join(notes[int_to_ip(n)])) for n in sorted(found))
+        return
+
+    if db_conn and isinstance(notes, SqliteNotes) and not notes.dirty:
+        where = []
+        params = []
+        for terms in groups:
+            where.append(' AND '.join("note LIKE ? ESCAPE '\\'" for _ in terms))
+            params.extend(like_pattern(term) for term in terms)
+        # LIKE 只做预筛选，结果仍由 note_matches 核对
+        rows = db_conn.execute('SELECT addr, note FROM ip_note WHERE (' + ') OR ('.join(where) + ') ORDER BY ip',
+                               params)
+    else:
+        rows = ((ip, note) for _, ip, note in iter_sorted_notes())
+    write_rows((ip, note) for ip, note in rows if note_matches(note, groups))
+
+
+def change_default_encoding():
+    """判断是否在 windows git-bash 下运行，是则使用 utf-8 编码"""
+    if os.name == 'nt':
+        terminal = os.environ.get('TERM')
+        if terminal and 'xterm' in terminal:
+            sys.stdin = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8')
+            sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+
+
+def summary(enable_tag=False):
+    """统计IP分类
+    标签统计直接使用标签倒排索引中各标签的 IP 数，不遍历 ip_tag
+    """
+    if db_conn and enable_tag and isinstance(ip_tag, SqliteTags) and not ip_tag.cache:
+        rows = db_conn.execute('SELECT tag, COUNT(*) FROM ip_tag GROUP BY tag ORDER BY COUNT(*) DESC')
+        for key, count in rows:
+            print_summary_row(key, count)
+        return
+
+    if enable_tag:
+        counts = [(tag, len(posting_ints(ints))) for tag, ints in update_tag_index()['tags'].items()]
+        counts.sort(key=lambda x: x[1], reverse=True)
+    elif isinstance(loaded(ip_dict), CompactNotes):
+        counts = loaded(ip_dict).part_counts().most_common()
+    else:
+        counts = collections.Counter(note for value in ip_dict.values() for note in value).most_common()
+
+    for key, count in counts:
+        print_summary_row(key, count)
+
+
+# --tags 表达式的词法单元：运算符或标签名
+pattern_tag_query = re.compile(r'\s*(?:([&|!()])|([^&|!()\s]+))')
+
+
+def parse_tag_query(text):
+    """解析 --tags 表达式：& 交集、| 并集、! 取反、括号分组，如 '电脑 & 通外网 & !中毒'
+
+    & 优先于 |，返回嵌套元组 ('or', [...])、('and', [...])、('not', 子表达式)、('tag', 标签)，
+    表达式不合法时抛出 ValueError
+    """
+    tokens = []
+    pos = 0
+    text = text.strip()
+    while pos < len(text):
+        match = pattern_tag_query.match(text, pos)
+        if not match:
+            raise ValueError(text)
+        tokens.append(match.group(1) or ('tag', match.group(2)))
+        pos = match.end()
+    tokens.append(None)
+    pos = 0
+
+    def parse(ops, operator, item):
+        nonlocal pos
+        items = [item()]
+        while tokens[pos] == operator:
+            pos += 1
+            items.append(item())
+        return items[0] if len(items) == 1 else (ops, items)
+
+    def parse_or():
+        return parse('or', '|', parse_and)
+
+    def parse_and():
+        return parse('and', '&', parse_not)
+
+    def parse_not():
+        nonlocal pos
+        token = tokens[pos]
+        pos += 1
+        if token == '!':
+            return 'not', parse_not()
+        if token == '(':
+            node = parse_or()
+            if tokens[pos] != ')':
+                raise ValueError(text)
+            pos += 1
+            return node
+        if isinstance(token, tuple):
+            return token
+        raise ValueError(text)
+
+    node = parse_or()
+    if tokens[pos] is not None:
+        raise ValueError(text)
+    return node
+
+
+def eval_tag_query(node, lookup, universe):
+    """计算 --tags 表达式，返回 IP 整数集合
+
+    lookup(标签) 返回该标签的升序 IP 整数序列，universe() 返回所有打过标签的 IP 整数集合。
+    交集从最短的倒排列表开始，较长的列表逐个二分查找；'a & !b' 直接做差集，不求补集
+    """
+    kind = node[0]
+    if kind == 'tag':
+        return set(lookup(node[1]))
+    if kind == 'not':
+        return universe() - eval_tag_query(node[1], lookup, universe)
+    if kind == 'or':
+        return set().union(*(eval_tag_query(item, lookup, universe) for item in node[1]))
+
+    lists = []
+    sets = []
+    exclude = []
+    for item in node[1]:
+        if item[0] == 'tag':
+            lists.append(lookup(item[1]))
+        elif item[0] == 'not':
+            exclude.append(item[1])
+        else:
+            sets.append(eval_tag_query(item, lookup, universe))
+    lists.sort(key=len)
+    sets.sort(key=len)
+    if sets:
+        result = sets[0].intersection(*sets[1:])
+    elif lists:
+        result = set(lists.pop(0))
+    else:
+        result = universe()
+    for ints in lists:
+        if not result:
+            break
+        if len(ints) > len(result) * 8:
+            result = {n for n in result if bisect_contains(ints, n)}
+        else:
+            result.intersection_update(ints)
+    for item in exclude:
+        if not result:
+            break
+        if item[0] == 'tag' and len(lookup(item[1])) > len(result) * 8:
+            ints = lookup(item[1])
+            result = {n for n in result if not bisect_contains(ints, n)}
+        else:
+            result -= eval_tag_query(item, lookup, universe)
+    return result
+
+
+def tag_query_ips(text):
+    """计算 --tags 表达式，返回命中的 IP 整数集合，表达式不合法时抛出 ValueError"""
+    node = parse_tag_query(text)
+    if db_conn and isinstance(ip_tag, SqliteTags) and not ip_tag.cache:
+        def lookup(tag):
+            rows = db_conn.execute('SELECT ip FROM ip_tag WHERE tag = ? ORDER BY ip', (tag,))
+            return array('I', (n for (n,) in rows))
+
+        def universe():
+            return {n for (n,) in db_conn.execute('SELECT DISTINCT ip FROM ip_tag')}
+    else:
+        tags = update_tag_index()['tags']
+
+        def lookup(tag):
+            return posting_ints(tags.get(tag))
+
+        def universe():
+            return set().union(*(posting_ints(ints) for ints in tags.values()))
+
+    return eval_tag_query(node, lookup, universe)
+
+
+def query_tags(text):
+    """按 --tags 表达式输出 IP，按 IP 顺序每行一个"""
+    try:
+        ips = tag_query_ips(text)
+    except ValueError:
+        print(f"Invalid tag expression: {text}", file=sys.stderr)
+        return
+
+    write = sys.stdout.write
+    for n in sorted(ips):
+        write(int_to_ip(n) + '\n')
+    sys.stdout.flush()
+
+
+def print_summary_row(key, count):
+    """打印一行分类统计"""
+    max_length = 15
+    if len(key) > max_length:
+        truncated_s = key[:max_length - 3] + "..."
+    else:
+        truncated_s = key
+    print("{}  {}".format(align_text(truncated_s, 30), count))
+
+
+def align_text(text, width):
+    """中文对齐"""
+    import wcwidth
+    text_width = wcwidth.wcswidth(text)
+    if text_width < width:
+        return text + ' ' * (width - text_width)
+    else:
+        return text
+
+
+def main():
+    """命令行入口"""
+    global annotate_cache_size, lookup_stats, run_stats, progress_interval
+
+    # pyinstaller 打包后在 windows 下使用多进程需要
+    if getattr(sys, 'frozen', False):
+        import multiprocessing
+        multiprocessing.freeze_support()
+
+    # 如果是在 win git-bash 下运行，则使用 utf-8 编码替换标准输出默认编码
+    change_default_encoding()
+
+    # 创建 ArgumentParser 对象
+    parser = argparse.ArgumentParser(description='IP 备注', formatter_class=argparse.RawTextHelpFormatter)
+
+    # 添加命令行参数
+    parser.add_argument('--ip_file', '-i', action='append', default=[],
+                        help='IP 文件路径，文件内容格式：IP 备注\n可多次指定，支持通配符，- 表示标准输入')
+    parser.add_argument('--data_file', '-d', type=str, default='IP.pkl',
+                        help='数据文件路径，.ipdb 为 mmap 格式，.db 为 SQLite 格式\n'
+                             '默认数据文件查找顺序: \n  ./IP.ipdb\n  ./IP.pkl\n  ~/.ip_notes/IP.ipdb\n  ~/.ip_notes/IP.pkl\n')
+    parser.add_argument('--interactive', '-a', action='store_true', help='读取管道中的内容，并进行IP替换')
+    parser.add_argument('--line_buffered', '--line-buffered', action='store_true',
+                        help='-a 模式下逐行刷新输出（默认块缓冲，终端下自动逐行）')
+    parser.add_argument('--binary', '-b', action='store_true', help='-a 模式下按字节处理，不做编码转换')
+    parser.add_argument('--jobs', '-j', type=int, default=1, help='-a 模式下处理日志文件、--analyze 分块统计的进程数')
+    parser.add_argument('--cache-size', '--cache_size', dest='cache_size', type=int, default=annotate_cache_size,
+                        help='-a 模式下网段、未命中等查找结果的 LRU 缓存条数')
+    parser.add_argument('--stats', action='store_true',
+                        help='退出时向标准错误输出各阶段耗时、处理的行数与字节数、吞吐量、查找命中率与峰值内存')
+    parser.add_argument('--progress', type=float, nargs='?', const=5.0, default=0,
+                        help='-a 模式下每隔若干秒（默认 5）向标准错误输出已处理的行数与速度')
+    parser.add_argument('--profile', type=str, default='', help='用 cProfile 记录本次运行，结果写入指定文件')
+    parser.add_argument('files', nargs='*', default=[], help='-a/--analyze 模式下要处理的日志文件，不指定则读取管道')
+    parser.add_argument('--analyze', action='store_true',
+                        help='统计日志中各 IP 出现的次数，按 IP、备注、标签输出最多的若干项及没有备注的 IP')
+    parser.add_argument('--top', type=int, default=analyze_top, help='--analyze 各部分输出的条数')
+    parser.add_argument('--follow', '-f', action='store_true',
+                        help='-a 模式下持续跟踪日志文件（支持通配符）中新写入的内容，处理日志轮转与截断')
+    parser.add_argument('--route', type=str, default='',
+                        help='--follow 时按来源文件把结果分别写入该目录，默认输出到标准输出并在行首加文件名')
+    parser.add_argument('--at', type=str, default='',
+                        help='-a 模式下使用指定时间点的备注，如 "2024-01-01" 或 "2024-01-01 08:30"')
+    parser.add_argument('--serve', action='store_true',
+                        help='启动守护进程，只装载一次数据，通过 Unix socket 为 -a 提供替换服务\n'
+                             '数据文件变化时自动重新装载')
+    parser.add_argument('--client', action='store_true',
+                        help='-a 模式下通过守护进程替换（socket 存在时 -a 会自动使用守护进程）')
+    parser.add_argument('--socket', type=str, default='', help='守护进程的 socket 路径，默认为数据文件路径加 .sock')
+    parser.add_argument('--serve-status', '--serve_status', dest='serve_status', action='store_true',
+                        help='显示守护进程各客户端的处理量与速度')
+    parser.add_argument('--list', '-l', action='store_true', help='显示IP字典中的内容')
+    parser.add_argument('--erase', '-e', action='store_true', help='清空数据文件内容')
+    parser.add_argument('--output_dict', '-od', action='store_true', help='输出IP字典信息')
+    parser.add_argument('--output_range', '-or', action='store_true', help='输出网段/范围备注')
+    parser.add_argument('--output_history', '-oh', action='store_true', help='输出IP历史数据')
+    parser.add_argument('--output_tag', '-ot', action='store_true', help='输出IP标签信息')
+    parser.add_argument('--search', '-s', type=str, default='',
+                        help='按 IP 搜索，支持 10.1.1.1、10.1.0.0/16、10.1.1.1-10.1.1.99、10.1.*.*')
+    parser.add_argument('--all', dest='search_all', action='store_true', help='-s 搜索时同时输出历史与标签')
+    parser.add_argument('--find-note', '--find_note', dest='find_note', type=str, default='',
+                        help='按备注反查 IP，空白分隔的词同时匹配，| 分隔任一匹配，如 "阿里云 dns | 腾讯云"')
+    parser.add_argument('--summary', '-m', action='store_true', help='统计 IP 分类')
+    parser.add_argument('--tag', '-t', action='store_true', help='将 IP文件 当作标签数据处理')
+    parser.add_argument('--tags', dest='tag_query', type=str, default='',
+                        help='按标签表达式查询 IP，& 交集、| 并集、! 取反，如 "电脑 & 通外网 & !中毒"')
+    parser.add_argument('--debug', '-G', action='store_true', help='通过交互模式进行调试')
+    parser.add_argument('--compact', action='store_true', help='将导入日志合并到数据文件')
+    parser.add_argument('--prune-history', '--prune_history', dest='prune_history', type=str, default='',
+                        help='删除旧的历史版本：90d 删除 90 天前被替换的版本，5 每个 IP 只保留最新 5 个版本，\n'
+                             '可组合为 90d,5')
+    parser.add_argument('--migrate', action='store_true', help='将 pickle 数据文件转为 ipdb 格式（同目录 .ipdb 文件）')
+    parser.add_argument('--export', type=str, default='', choices=export_formats,
+                        help='按 IP 顺序导出备注、网段、标签与历史')
+    parser.add_argument('--output', type=str, default='',
+                        help='--export 的输出文件，.gz 结尾时 gzip 压缩，默认为标准输出')
+    parser.add_argument('--since', type=str, default='',
+                        help='--export 只导出该时间之后的历史版本，格式同 --at')
+    parser.add_argument('--import-format', '--import_format', dest='import_format', type=str, default='',
+                        choices=export_formats, help='-i 指定的文件为 --export 的输出（.gz 可直接读取）')
+    parser.add_argument('--version', '-v', action='store_true', help='显示版本信息')
+
+    # 解析命令行参数
+    args = parser.parse_args()
+
+    # 检查是否有传递任何参数，同时检查是否使用了默认参数
+    if not any(vars(args).values()) or all(arg == parser.get_default(name) for name, arg in vars(args).items()):
+        # 如果没有传递参数或者使用了默认参数，打印帮助信息
+        parser.print_help()
+
+    ip_file = args.ip_file
+    data_file = args.data_file
+    interactive = args.interactive
+    show_ip = args.list
+    erase_data = args.erase
+    enable_output_dict = args.output_dict
+    enable_output_history = args.output_history
+    search_text = args.search
+    enable_summary = args.summary
+    enable_tag = args.tag
+    enable_output_tag = args.output_tag
+
+    if args.profile:
+        import cProfile
+        import atexit
+        profiler = cProfile.Profile()
+        atexit.register(save_profile, profiler, args.profile)
+        profiler.enable()
+
+    annotate_cache_size = args.cache_size
+    progress_interval = args.progress
+    if args.stats or args.progress:
+        run_stats = new_run_stats()
+    if args.stats:
+        import atexit
+        lookup_stats = new_lookup_stats()
+        atexit.register(print_run_stats)
+
+    at = None
+    if args.at:
+        try:
+            at = parse_time(args.at)
+        except ValueError:
+            parser.error(f'invalid --at time: {args.at}')
+    since = None
+    if args.since:
+        try:
+            since = parse_time(args.since)
+        except ValueError:
+            parser.error(f'invalid --since time: {args.since}')
+    prune = None
+    if args.prune_history:
+        try:
+            prune = parse_prune_spec(args.prune_history)
+        except ValueError:
+            parser.error(f'invalid --prune-history condition: {args.prune_history}')
+
+    if data_file == parser.get_default('data_file'):
+        data_file = default_ipdata()
+
+    if args.migrate:
+        migrate_data(data_file)
+        data_file = os.path.splitext(data_file)[0] + '.ipdb'
+
+    if args.compact:
+        with stats_phase('compact'):
+            compact_data(data_file)
+
+    if prune:
+        with stats_phase('prune'):
+            prune_data(data_file, *prune)
+
+    # 各命令需要的数据段，其余数据段在首次访问时才装载
+    action_sections = {
+        'interactive': ('dict', 'range'),
+        'analyze': ('dict', 'range', 'tag'),
+        'at': ('history', 'added'),
+        'list': ('dict', 'range', 'history'),
+        'output_dict': ('dict',),
+        'output_range': ('range',),
+        'output_history': ('history',),
+        'output_tag': ('tag',),
+        'search': ('dict',),
+        'search_all': ('history', 'tag'),
+        'find_note': ('dict', 'notes'),
+        'summary': ('tags',) if enable_tag else ('dict',),
+        'tag_query': ('tags',),
+        'export': ('dict', 'range', 'tag', 'history', 'added'),
+        'debug': tuple(data_sections),
+    }
+    sections = set()
+    for name, needed in action_sections.items():
+        if getattr(args, name):
+            sections.update(needed)
+
+    # 只替换标准输入中的 IP 时，守护进程在运行则交给守护进程，不必装载数据
+    sock_path = args.socket or socket_path(data_file)
+    daemon = None
+    if (interactive or args.client) and not args.files and at is None and not ip_file and run_stats is None \
+            and sections <= set(action_sections['interactive']):
+        daemon = connect_daemon(sock_path)
+    if args.client and daemon is None:
+        print(f"no daemon on {sock_path}", file=sys.stderr)
+        sys.exit(1)
+
+    # 只导入数据时不需要装载数据文件，修改记录直接追加到导入日志
+    import_only = ip_file and not is_sqlite(data_file) and not sections and not erase_data \
+        and not args.import_format
+
+    # 反序列化，加载数据到字典
+    if not import_only and not daemon:
+        with stats_phase('load'):
+            load_data(data_file, sections)
+
+    # 从文本文件中装载数据
+    if ip_file:
+        with stats_phase('import'):
+            if args.import_format:
+                import_export(expand_ip_files(ip_file), args.import_format)
+            else:
+                insert_ip_notes(expand_ip_files(ip_file), enable_tag=enable_tag)
+
+    # 从管道中读文件，替换IP为备注
+    if daemon:
+        run_client(daemon, data_file, line_buffered=args.line_buffered)
+    elif interactive:
+        with stats_phase('annotate'):
+            if at is not None:
+                view_notes_at(at)
+            if args.follow:
+                follow_logs(args.files, data_file, route=args.route or None, at=at)
+            elif args.files:
+                annotate_files(args.files, data_file, jobs=args.jobs, at=at)
+            elif args.binary:
+                replace_ip_binary(line_buffered=args.line_buffered)
+            else:
+                replace_ip(line_buffered=args.line_buffered)
+
+    if args.analyze:
+        with stats_phase('analyze'):
+            analyze(args.files, jobs=args.jobs, top=args.top)
+
+    if args.export:
+        with stats_phase('export'):
+            export_data(args.export, args.output, since=since)
+
+    # 显示IP字典
+    if show_ip:
+        show()
+
+    # 重置数据文件
+    if erase_data:
+        erase(data_file)
+
+    # 输出 IP 字典数据
+    if enable_output_dict:
+        sort_ip_dict()
+
+    # 输出网段/范围备注
+    if args.output_range:
+        sort_ip_range()
+
+    # 输出 IP 历史数据
+    if enable_output_history:
+        sort_ip_history()
+
+    if enable_output_tag:
+        sort_ip_tag()
+
+    if search_text:
+        search_arg(search_text, include_all=args.search_all)
+
+    if args.find_note:
+        find_note(args.find_note)
+
+    if args.tag_query:
+        query_tags(args.tag_query)
+
+    if enable_summary:
+        summary(enable_tag=enable_tag)
+
+    # 如果有文件输入，则存盘
+    if ip_file:
+        with stats_phase('save'):
+            if args.import_format:
+                # 整体生成的数据段没有对应的导入记录，整体写入数据文件
+                save_data(data_file)
+            else:
+                save_changes(data_file)
+
+    if args.serve_status:
+        print_server_status(sock_path)
+
+    if args.version:
+        print(f'ip_notes {version}')
+
+    if args.serve:
+        serve(data_file, sock_path)
+
+    if args.debug:
+        import code
+        code.interact(local={**globals(), **locals()})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+#!env python
+"""基准测试用的合成数据：IP 备注清单、标签与日志
+
+备注的词数、词长与中文比例，标签种类数，日志每行 IP 数与命中比例均可调整，
+同样的参数与随机种子生成同样的数据，供 bench_suite.py 等比较前后两次运行
+
+用法: python bench_data.py [IP数] [日志行数] [输出目录]
+"""
+
+import sys
+import os
+import random
+
+# 获取当前脚本所在目录的上一级目录
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+
+# 将上一级目录添加到sys.path中
+sys.path.insert(0, parent_dir)
+
+import ip_notes
+
+# 备注词数的分布：(词数, 权重)
+note_words = ((1, 40), (2, 30), (3, 20), (4, 7), (8, 3))
+
+cjk_common = '的一是不了人我在有他这中大来上国个到说们为子和你地出道也时年得就那要下以生会自着去之过家学对可她里后小么心多天而能好都然没日于起还发成事只作当想看文无开手十用主行方又如前所本见经头面公同三已老从动两长知民样现分将外但身些与高意进把法此实回二理美点月明其种声全工己话儿者向情部正名定女问力机给等几很业最间新什打便位因重被走电四第门相次东政海口使教西再平真听世气信北少关并内加化由却代军产入先山五太水万市眼体别处总才场师书比住员九笑性通目华报立马命张活难神数件安表原车白应路期叫死常提感金何更反合放做系计或司利受光王果亲界及今京务制解各任至清物台象记边共风战干接它许八特觉望直服毛林题建南度统色字请交爱让认算论百吃义科怎元社术结六功指思非流每青管夫连远资队跟带花快条院变联言权往展该领传近留红治决周保达办运武半候七必城父强步完革深区即求品士转量空甚众技轻程告江语英基派满式李息写呢识极令黄德收脸钱党倒未持取设始版双历越史商千片容研像找友孩站广改议形委早房音火际则首单据导影失拿网香似斯专石若兵弟谁校读志飞观争究包组造落视济喜离虽坐集编宝谈府拉黑且随格尽剑讲布杀微怕母调局根曾准团段终乐切级克精哪官示冷域'
+ascii_letters = 'abcdefghijklmnopqrstuvwxyz'
+
+
+def make_word(rng, cjk_ratio):
+    """随机生成一个词，cjk_ratio 的概率为 2~4 个汉字，否则为 3~8 个字母"""
+    if rng.random() < cjk_ratio:
+        return ''.join(rng.choice(cjk_common) for _ in range(rng.randint(2, 4)))
+    return ''.join(rng.choice(ascii_letters) for _ in range(rng.randint(3, 8)))
+
+
+def make_inventory(n, cjk_ratio=0.7, vocabulary=5000, seed=1):
+    """生成 n 个带备注的 IP，均在 10.0.0.0/8 内
+    备注从 vocabulary 个词中取词，词数按 note_words 分布，返回 {ip: (备注, ...)}
+    """
+    rng = random.Random(seed)
+    words = [make_word(rng, cjk_ratio) for _ in range(vocabulary)]
+    counts = [count for count, _ in note_words]
+    weights = [weight for _, weight in note_words]
+    keys = rng.sample(range(1 << 24), n)
+    inventory = dict()
+    for key in keys:
+        count = rng.choices(counts, weights)[0]
+        inventory[ip_notes.int_to_ip(0x0a000000 + key)] = tuple(rng.choice(words) for _ in range(count))
+    return inventory
+
+
+def make_tags(ips, tag_count=50, max_tags=3, cjk_ratio=0.7, seed=2):
+    """为每个 IP 打 1~max_tags 个标签，共 tag_count 种，标签的使用频率近似 Zipf 分布
+    返回 {ip: {标签, ...}}
+    """
+    rng = random.Random(seed)
+    names = []
+    while len(names) < tag_count:
+        name = make_word(rng, cjk_ratio)
+        if name not in names:
+            names.append(name)
+    weights = [1 / (i + 1) for i in range(tag_count)]
+    return {ip: set(rng.choices(names, weights, k=rng.randint(1, max_tags))) for ip in ips}
+
+
+def make_log(ips, lines, ips_per_line=2, hit_ratio=0.5, seed=3):
+    """生成 sshd 风格的日志文本
+    每个 IP 以 hit_ratio 的概率取自 ips，否则为 172.16.0.0/12 内不在清单中的 IP
+    """
+    rng = random.Random(seed)
+    ips = list(ips)
+    rows = []
+    for n in range(lines):
+        parts = ['Jan 15 10:46:{:02d} host sshd[{}]:'.format(n % 60, 1000 + n % 50000)]
+        for _ in range(ips_per_line):
+            if ips and rng.random() < hit_ratio:
+                ip = rng.choice(ips)
+            else:
+                ip = ip_notes.int_to_ip(0xac100000 + rng.getrandbits(20))
+            parts.append('Accepted publickey for root from {} port {}'.format(ip, rng.randrange(1024, 65536)))
+        rows.append(' '.join(parts) + '\n')
+    return ''.join(rows)
+
+
+def write_inventory(path, inventory):
+    """写成 -i 可导入的文本，每行 IP 与备注"""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.writelines(f'{ip} {" ".join(notes)}\n' for ip, notes in inventory.items())
+
+
+def write_tags(path, tags):
+    """写成 -t -i 可导入的文本，每行 IP 与它的全部标签"""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.writelines(f'{ip} {" ".join(sorted(names))}\n' for ip, names in tags.items())
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    lines = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+    out_dir = sys.argv[3] if len(sys.argv) > 3 else '.'
+
+    inventory = make_inventory(n)
+    write_inventory(os.path.join(out_dir, 'notes.txt'), inventory)
+    write_tags(os.path.join(out_dir, 'tags.txt'), make_tags(inventory))
+    with open(os.path.join(out_dir, 'access.log'), 'w', encoding='utf-8') as f:
+        f.write(make_log(inventory, lines))
+    print(f'wrote notes.txt, tags.txt ({n} ips) and access.log ({lines} lines) to {out_dir}')
@@ -0,0 +1,91 @@
+#!env python
+"""-od/-ot 导出耗时：旧的 ipaddress 排序 + 逐行 print vs 排序索引 + 块输出
+
+同时给出排序索引整体重建（旧数据文件首次导出时）与导入后增量合并的耗时
+
+用法: python bench_dump.py [IP数]
+"""
+
+import sys
+import os
+import io
+import random
+import time
+import tempfile
+import contextlib
+
+# 获取当前脚本所在目录的上一级目录
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+
+# 将上一级目录添加到sys.path中
+sys.path.insert(0, parent_dir)
+
+import ip_notes
+
+
+def legacy_sort_ip_dict():
+    """旧实现：每次转为 IPv4Address 排序，每行一次 print"""
+    import ipaddress
+    ip_obj = list()
+    for key, value in ip_notes.ip_dict.items():
+        ip_obj.append(ipaddress.IPv4Address(key))
+    for i in sorted(ip_obj):
+        ip = str(i)
+        note = ' '.join(ip_notes.ip_dict[ip])
+        print(f'{ip.ljust(15, " ")}    {note}')
+
+
+class NullWriter(io.StringIO):
+    """丢弃输出"""
+    def write(self, s):
+        return len(s)
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(NullWriter()):
+        func(*args)
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+
+    random.seed(1)
+    inventory = dict()
+    while len(inventory) < n:
+        inventory[ip_notes.int_to_ip(random.getrandbits(32))] = ('主机{}'.format(len(inventory)), '机房A')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_file = os.path.join(tmp, 'IP.pkl')
+        ip_notes.ip_dict = inventory
+        ip_notes.reset_indexes()
+        ip_notes.save_data(data_file)
+
+        ip_notes.load_data(data_file)
+        print(f'{n} ips')
+        print(f'legacy sort + print   {timed(legacy_sort_ip_dict):8.3f}s')
+
+        ip_notes.load_data(data_file)
+        print(f'-od persisted index   {timed(ip_notes.sort_ip_dict):8.3f}s')
+
+        keys = list(inventory)
+        start = time.perf_counter()
+        ip_notes.build_order(keys)
+        print(f'rebuild index         {time.perf_counter() - start:8.3f}s')
+        numpy = sys.modules.pop('numpy', None)
+        sys.modules['numpy'] = None
+        start = time.perf_counter()
+        ip_notes.build_order(keys)
+        print(f'rebuild index (no NumPy) {time.perf_counter() - start:5.3f}s')
+        sys.modules.pop('numpy')
+        if numpy:
+            sys.modules['numpy'] = numpy
+
+        # 导入 1% 新 IP 后的增量合并
+        ip_notes.load_data(data_file)
+        ip_notes.materialize_data()
+        for i in range(n // 100):
+            ip_notes.apply_record('note', ip_notes.int_to_ip(random.getrandbits(32)), ('新主机',))
+        print(f'-od after 1% import   {timed(ip_notes.sort_ip_dict):8.3f}s')
@@ -0,0 +1,69 @@
+#!env python
+"""--export/--import-format 耗时：各格式（及 gzip）的导出与导入新数据文件，对比 -l 与 -od/-ot/-oh 输出
+
+导入后逐项比较 -od/-ot/-oh 的输出，确认往返无损
+
+用法: python bench_export.py [IP数]
+"""
+
+import sys
+import os
+import random
+import time
+import tempfile
+import subprocess
+
+# 获取当前脚本所在目录的上一级目录
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+
+# 将上一级目录添加到sys.path中
+sys.path.insert(0, parent_dir)
+
+import ip_notes
+from bench_data import make_inventory, make_tags
+
+script = os.path.join(parent_dir, 'ip_notes.py')
+
+
+def run(args, stdout=subprocess.DEVNULL):
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, script] + args, stdout=stdout, stderr=subprocess.DEVNULL, check=True)
+    return time.perf_counter() - start, result.stdout
+
+
+def dumps(data_file):
+    return [run(['-d', data_file, option], subprocess.PIPE)[1] for option in ('-od', '-ot', '-oh')]
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+
+    inventory = make_inventory(n)
+    ips = list(inventory)
+    rng = random.Random(6)
+    history = {ip: [(1700000000 + i * 86400, ('旧备注', str(i))) for i in range(rng.randint(1, 3))]
+               for ip in rng.sample(ips, n // 20)}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_file = os.path.join(tmp, 'IP.pkl')
+        ip_notes.ip_dict = inventory
+        ip_notes.ip_tag = make_tags(ips)
+        ip_notes.ip_history = history
+        ip_notes.reset_indexes()
+        ip_notes.save_data(data_file)
+        expected = dumps(data_file)
+
+        print(f'{n} ips, {len(history)} with history')
+        print(f'{"-l":<20} {run(["-d", data_file, "-l"])[0]:8.3f}s')
+        print(f'{"-od -ot -oh":<20} {run(["-d", data_file, "-od", "-ot", "-oh"])[0]:8.3f}s')
+        print(f'{"":<20} {"export":>9} {"import":>9} {"size":>9}')
+        for fmt, suffix in (('csv', ''), ('tsv', ''), ('jsonl', ''), ('csv', '.gz')):
+            output = os.path.join(tmp, 'all.' + fmt + suffix)
+            exported, _ = run(['-d', data_file, '--export', fmt, '--output', output])
+            restored = os.path.join(tmp, 'restored.pkl')
+            imported, _ = run(['-d', restored, '-i', output, '--import-format', fmt])
+            same = dumps(restored) == expected
+            print(f'{fmt + suffix:<20} {exported:8.3f}s {imported:8.3f}s {os.path.getsize(output) / 1e6:7.1f}MB'
+                  f'{"" if same else "  MISMATCH"}')
+            os.remove(restored)
@@ -0,0 +1,82 @@
+#!env python
+"""-a --follow 的空闲 CPU 占用与突发写入时其他文件的延迟
+
+跟踪多个文件，先空闲一段时间统计 CPU，再向一个文件突发写入大量日志，
+同时向另一个文件写入一行，测量这一行出现在输出中的延迟
+
+用法: python bench_follow.py [文件数] [突发MB数]
+"""
+
+import sys
+import os
+import time
+import random
+import subprocess
+import tempfile
+import threading
+
+# 获取当前脚本所在目录的上一级目录
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+
+# 将上一级目录添加到sys.path中
+sys.path.insert(0, parent_dir)
+
+import ip_notes
+
+
+def cpu_seconds(pid):
+    """子进程已用的 CPU 时间"""
+    with open(f'/proc/{pid}/stat') as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+if __name__ == '__main__':
+    files = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    burst_mb = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+    random.seed(1)
+    with tempfile.TemporaryDirectory() as tmp:
+        data_file = os.path.join(tmp, 'IP.pkl')
+        ip_notes.ip_dict = {ip_notes.int_to_ip(0x0a000000 + i): ('主机{}'.format(i),) for i in range(100000)}
+        ip_notes.save_data(data_file)
+        logs = [os.path.join(tmp, f'{i}.log') for i in range(files)]
+        for path in logs:
+            open(path, 'w').close()
+
+        proc = subprocess.Popen([sys.executable, os.path.join(parent_dir, 'ip_notes.py'), '-d', data_file,
+                                 '-a', '--follow', os.path.join(tmp, '*.log')], stdout=subprocess.PIPE)
+        seen = dict()
+
+        def reader():
+            for line in proc.stdout:
+                if b'marker' in line:
+                    seen['marker'] = time.perf_counter()
+
+        thread = threading.Thread(target=reader, daemon=True)
+        thread.start()
+        time.sleep(2)
+
+        idle = 10
+        before = cpu_seconds(proc.pid)
+        time.sleep(idle)
+        print(f'{files} idle files: {(cpu_seconds(proc.pid) - before) / idle * 100:.2f}% CPU')
+
+        line = ''.join(f'GET / from 10.0.{random.randrange(256)}.{random.randrange(256)} 200\n' for _ in range(1000))
+        with open(logs[0], 'a') as f:
+            for _ in range(burst_mb * (1 << 20) // len(line)):
+                f.write(line)
+        start = time.perf_counter()
+        with open(logs[-1], 'a') as f:
+            f.write('marker 10.0.0.1\n')
+        while 'marker' not in seen and time.perf_counter() - start < 60:
+            time.sleep(0.01)
+        if 'marker' in seen:
+            # 空闲文件的轮询间隔已退避到 follow_max_interval，延迟应不超过该值加一次读块的时间
+            print(f'latency of a line in a quiet file during a {burst_mb}MB burst: '
+                  f'{(seen["marker"] - start) * 1000:.0f}ms (max poll interval {ip_notes.follow_max_interval * 1000:.0f}ms)')
+        else:
+            print('marker line not seen within 60s')
+        proc.terminate()
+        proc.wait()
@@ -0,0 +1,81 @@
+#!env python
+"""历史版本相关耗时：-oh 导出、-a --at 按时间点替换、--prune-history 删除旧版本
+
+用法: python bench_history.py [IP数] [每个IP的版本数]
+"""
+
+import sys
+import os
+import io
+import random
+import time
+import tempfile
+import contextlib
+
+# 获取当前脚本所在目录的上一级目录
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+
+# 将上一级目录添加到sys.path中
+sys.path.insert(0, parent_dir)
+
+import ip_notes
+
+
+def make_store(n, versions):
+    """n 个 IP，每个 IP 有 versions 个历史版本，第 i 个版本在 start + i 天被替换"""
+    random.seed(1)
+    ip_notes.ip_dict = dict()
+    ip_notes.ip_history = dict()
+    while len(ip_notes.ip_dict) < n:
+        ip = ip_notes.int_to_ip(random.getrandbits(32))
+        ip_notes.ip_dict[ip] = ('主机{}'.format(len(ip_notes.ip_dict)),)
+        ip_notes.ip_history[ip] = [(start + i * 86400, ('旧名{}'.format(i),)) for i in range(versions)]
+    ip_notes.reset_indexes()
+
+
+def make_log(lines):
+    ips = list(ip_notes.ip_dict)
+    return ''.join(f'GET / from {random.choice(ips)} 200\n' for _ in range(lines))
+
+
+def timed(func, *args, stdin=''):
+    sys.stdin = io.StringIO(stdin)
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        begin = time.perf_counter()
+        func(*args)
+        elapsed = time.perf_counter() - begin
+    sys.stdin = sys.__stdin__
+    return elapsed
+
+
+start = 1600000000
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    versions = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    log = None
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f'{n} ips, {versions} versions each')
+        for ext in ('pkl', 'ipdb', 'db'):
+            data_file = os.path.join(tmp, 'IP.' + ext)
+            make_store(n, versions)
+            ip_notes.save_data(data_file)
+            if log is None:
+                log = make_log(100000)
+
+            ip_notes.load_data(data_file)
+            print(f'{ext:<5} -oh                    {timed(ip_notes.sort_ip_history):8.3f}s')
+
+            ip_notes.load_data(data_file, ('dict', 'range'))
+            print(f'{ext:<5} -a (100k lines)        {timed(ip_notes.replace_ip, stdin=log):8.3f}s')
+            ip_notes.load_data(data_file, ('dict', 'range', 'history'))
+            ip_notes.view_notes_at(start + 86400 * versions // 2)
+            print(f'{ext:<5} -a --at (100k lines)   {timed(ip_notes.replace_ip, stdin=log):8.3f}s')
+
+            # 删除最早的一个版本，再只保留最新的一个版本
+            cutoff = start + 1
+            print(f'{ext:<5} prune oldest version   {timed(ip_notes.prune_data, data_file, cutoff, None):8.3f}s')
+            print(f'{ext:<5} prune keep 1           {timed(ip_notes.prune_data, data_file, None, 1):8.3f}s')
+            print(f'{ext:<5} prune nothing          {timed(ip_notes.prune_data, data_file, cutoff, None):8.3f}s')
@@ -0,0 +1,84 @@
+#!env python
+"""-a 模式单个 IP 的查找耗时：每次拼接备注 vs 预生成表 + LRU 缓存，以及不同 --cache-size 的命中率
+
+日志中少量 IP 反复出现，另有一部分落在网段中或没有备注
+
+用法: python bench_lookup.py [IP数] [查找次数]
+"""
+
+import sys
+import os
+import random
+import time
+import tempfile
+
+# 获取当前脚本所在目录的上一级目录
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+
+# 将上一级目录添加到sys.path中
+sys.path.insert(0, parent_dir)
+
+import ip_notes
+
+
+def make_queries(ips, count):
+    """70% 为常见的 2000 个已知 IP，20% 为网段中常见的 2000 个 IP，10% 为 5000 个没有备注的 IP"""
+    random.seed(2)
+    hot = random.sample(ips, 2000)
+    in_range = ['192.168.{}.{}'.format(random.randrange(256), random.randrange(256)) for _ in range(2000)]
+    unknown = [ip_notes.int_to_ip(random.getrandbits(32)) for _ in range(5000)]
+    queries = []
+    for _ in range(count):
+        r = random.random()
+        if r < 0.7:
+            queries.append(random.choice(hot))
+        elif r < 0.9:
+            queries.append(random.choice(in_range))
+        else:
+            queries.append(random.choice(unknown))
+    return queries
+
+
+def timed(func, queries):
+    start = time.perf_counter()
+    for ip in queries:
+        func(ip)
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 1000000
+
+    random.seed(1)
+    ips = [ip_notes.int_to_ip(0x0a000000 + random.getrandbits(24)) for _ in range(n)]
+    inventory = {ip: ('主机{}'.format(i), '机房A') for i, ip in enumerate(ips)}
+    ranges = {'192.168.{}.0/24'.format(i): '网段{}'.format(i) for i in range(256)}
+    queries = make_queries(list(inventory), count)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        ip_notes.ip_dict = inventory
+        ip_notes.ip_range = ranges
+        for ext in ('pkl', 'ipdb', 'db'):
+            ip_notes.save_data(os.path.join(tmp, 'IP.' + ext))
+
+        print(f'{n} ips, {count} lookups')
+        for ext in ('pkl', 'ipdb', 'db'):
+            ip_notes.load_data(os.path.join(tmp, 'IP.' + ext), ('dict', 'range'))
+            elapsed = timed(ip_notes.search_ip_dict, queries)
+            print(f'{ext:<5} search_ip_dict     {elapsed:8.3f}s  {count / elapsed:12.0f} lookups/s')
+            start = time.perf_counter()
+            lookup = ip_notes.make_ip_lookup()
+            built = time.perf_counter() - start
+            elapsed = timed(lookup, queries)
+            print(f'{ext:<5} make_ip_lookup     {elapsed:8.3f}s  {count / elapsed:12.0f} lookups/s  (build {built:.3f}s)')
+
+        ip_notes.load_data(os.path.join(tmp, 'IP.db'), ('dict', 'range'))
+        for size in (1024, 16384, 65536):
+            ip_notes.annotate_cache_size = size
+            ip_notes.lookup_stats = ip_notes.new_lookup_stats()
+            elapsed = timed(ip_notes.make_ip_lookup(), queries)
+            stats = ip_notes.lookup_stats
+            print(f'db    --cache-size {size:<6} {elapsed:8.3f}s  '
+                  f'hit rate {(stats["cache"] - stats["miss"]) / stats["cache"] * 100:6.2f}%')
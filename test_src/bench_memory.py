@@ -0,0 +1,74 @@
+#!env python
+"""ip_dict/ip_tag 的内存占用：字典（备注元组、标签集合）vs 紧凑结构（uint32 数组 + 去重值表）
+
+均为从 pickle 数据段装载后的结果。备注分两种：大量 IP 共用少数备注（GoogleDNS、电脑 等），
+以及 bench_data 中几乎各不相同的随机备注
+
+用法: python bench_memory.py [IP数]
+"""
+
+import sys
+import os
+import gc
+import pickle
+import random
+import time
+import tracemalloc
+
+# 获取当前脚本所在目录的上一级目录
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+
+# 将上一级目录添加到sys.path中
+sys.path.insert(0, parent_dir)
+
+import ip_notes
+from bench_data import make_inventory, make_tags
+
+
+def shared_notes(ips, distinct=2000, seed=4):
+    """每个 IP 从 distinct 种备注中取一种，使用频率近似 Zipf 分布"""
+    rng = random.Random(seed)
+    pool = list({notes: None for notes in make_inventory(distinct * 2, seed=seed).values()})[:distinct]
+    weights = [1 / (i + 1) for i in range(len(pool))]
+    return dict(zip(ips, rng.choices(pool, weights, k=len(ips))))
+
+
+def measure(value):
+    """pickle 存盘后重新装载，返回 (装载后占用的字节数, 装载耗时, 数据段字节数)"""
+    blob = pickle.dumps(ip_notes.dump_section(value))
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    loaded = ip_notes.restore_section(pickle.loads(blob))
+    elapsed = time.perf_counter() - start
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del loaded
+    return size, elapsed, len(blob)
+
+
+def lookup_time(value, keys):
+    start = time.perf_counter()
+    for key in keys:
+        value[key]
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+
+    random_notes = make_inventory(n)
+    ips = list(random_notes)
+    cases = (('notes, shared', shared_notes(ips), ip_notes.CompactNotes),
+             ('notes, random', random_notes, ip_notes.CompactNotes),
+             ('tags', make_tags(ips), ip_notes.CompactTags))
+    queries = random.Random(5).sample(ips, min(100000, n))
+
+    print(f'{n} ips, loaded from pickle; lookup = {len(queries)} random keys')
+    print(f'{"":<16}{"layout":<10}{"memory":>10}{"pickle":>10}{"load":>9}{"lookup":>9}')
+    for name, data, cls in cases:
+        for layout, value in (('dict', data), ('compact', cls(data))):
+            size, elapsed, blob = measure(value)
+            print(f'{name:<16}{layout:<10}{size / 1e6:8.1f}MB{blob / 1e6:8.1f}MB'
+                  f'{elapsed:8.2f}s{lookup_time(value, queries):8.2f}s')
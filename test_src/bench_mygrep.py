@@ -0,0 +1,70 @@
+#!env python
+"""tools/mygrep.py 耗时：旧的逐行 re.search vs 整块搜索，多个模式、--cidr 过滤与多文件多进程
+
+用法: python bench_mygrep.py [日志MB数] [文件数]
+"""
+
+import sys
+import os
+import re
+import time
+import tempfile
+import subprocess
+
+# 获取当前脚本所在目录的上一级目录
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+
+# 将上一级目录添加到sys.path中
+sys.path.insert(0, parent_dir)
+
+from bench_data import make_inventory, make_log
+
+script = os.path.join(parent_dir, 'tools', 'mygrep.py')
+
+
+def legacy_grep(pattern, file_path):
+    """旧实现：逐行调用 re.search，每次都要查找已编译的模式缓存"""
+    count = 0
+    with open(file_path, encoding='utf-8') as f:
+        for line in f:
+            if re.search(pattern, line):
+                count += 1
+    return count
+
+
+def timed(args):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, script] + args, stdout=subprocess.DEVNULL, check=True)
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    files = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+
+    inventory = make_inventory(10000)
+    block = make_log(inventory, 20000)
+    with tempfile.TemporaryDirectory() as tmp:
+        logs = [os.path.join(tmp, f'{i}.log') for i in range(files)]
+        for path in logs:
+            with open(path, 'w', encoding='utf-8') as f:
+                while f.tell() < size_mb * 1024 * 1024 // files:
+                    f.write(block)
+        patterns = os.path.join(tmp, 'patterns.txt')
+        with open(patterns, 'w', encoding='utf-8') as f:
+            f.writelines(ip + ' ' + '\n' for ip in list(inventory)[:100])
+
+        regex = r'port 2222\d'
+        cases = (('-e, 1 file, -j 1', ['-j', '1', '-e', regex, logs[0]]),
+                 ('-f 100 patterns, 1 file, -j 1', ['-j', '1', '-f', patterns, logs[0]]),
+                 ('--cidr, 1 file, -j 1', ['-j', '1', '--cidr', '10.1.0.0/16', logs[0]]),
+                 ('-e, all files, -j 1', ['-j', '1', '-e', regex] + logs),
+                 (f'-e, all files, -j {os.cpu_count()}', ['-e', regex] + logs))
+
+        print(f'{size_mb} MB in {files} files, {os.cpu_count()} cpus')
+        start = time.perf_counter()
+        legacy_grep(regex, logs[0])
+        print(f'{"legacy re.search, 1 file":<36} {time.perf_counter() - start:8.3f}s')
+        for name, args in cases:
+            print(f'{name:<36} {timed(args):8.3f}s')
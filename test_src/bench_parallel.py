@@ -0,0 +1,55 @@
+#!env python
+"""-a --jobs 多进程吞吐量随核数的变化
+
+用法: python bench_parallel.py [日志MB数]
+"""
+
+import sys
+import os
+import time
+import tempfile
+import subprocess
+
+# 获取当前脚本所在目录的上一级目录
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+
+# 将上一级目录添加到sys.path中
+sys.path.insert(0, parent_dir)
+
+import ip_notes
+from bench_replace_ip import make_inventory, make_log
+
+
+if __name__ == '__main__':
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_file = os.path.join(tmp, 'IP.pkl')
+        log_file = os.path.join(tmp, 'access.log')
+
+        ip_notes.ip_dict = make_inventory(10000)
+        ip_notes.save_data(data_file)
+
+        block = make_log(ip_notes.ip_dict, 20000, 3)
+        with open(log_file, 'w', encoding='utf-8') as f:
+            while f.tell() < size_mb * 1024 * 1024:
+                f.write(block)
+        real_mb = os.path.getsize(log_file) / 1024 / 1024
+
+        script = os.path.join(parent_dir, 'ip_notes.py')
+        jobs_list = [1]
+        while jobs_list[-1] * 2 <= os.cpu_count():
+            jobs_list.append(jobs_list[-1] * 2)
+        if jobs_list[-1] != os.cpu_count():
+            jobs_list.append(os.cpu_count())
+
+        base = None
+        print(f'{real_mb:.1f} MB log, {os.cpu_count()} cpus')
+        for jobs in jobs_list:
+            start = time.perf_counter()
+            subprocess.run([sys.executable, script, '-d', data_file, '-a', '-j', str(jobs), log_file],
+                           stdout=subprocess.DEVNULL, check=True)
+            elapsed = time.perf_counter() - start
+            base = base or elapsed
+            print(f'jobs={jobs:<3} {elapsed:8.3f}s  {real_mb / elapsed:8.2f} MB/s  speedup {base / elapsed:5.2f}x')
@@ -0,0 +1,119 @@
+#!env python
+"""-a 模式吞吐量对比：旧的逐个 IP 切片实现 vs 单次正则替换实现 vs --binary 字节模式
+
+用法: python bench_replace_ip.py [行数] [每行IP数]
+"""
+
+import sys
+import os
+import io
+import random
+import time
+
+# 获取当前脚本所在目录的上一级目录
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+
+# 将上一级目录添加到sys.path中
+sys.path.insert(0, parent_dir)
+
+import ip_notes
+
+
+def legacy_replace_ip():
+    """旧实现：每个 IP 重新搜索一次并切片，每行 flush 一次"""
+    pattern_ip = ip_notes.pattern_ip
+    f = sys.stdin
+    line = f.readline()
+    while line:
+        ret = pattern_ip.findall(line)
+        if ret:
+            line_list = []
+            for i in ret:
+                ip1 = ip_notes.search_ip_dict(i)
+                match = pattern_ip.search(line)
+                ip_end = match.end() if match else len(line)
+                line_changed = line[0:ip_end]
+                line_list.append(line_changed.replace(i, ip1))
+                line = line[ip_end:]
+            line_list.append(line)
+            print(''.join(line_list), end='', flush=True)
+        else:
+            print(line, end='', flush=True)
+        line = f.readline()
+
+
+def make_inventory(n):
+    """生成 n 个带备注的 IP"""
+    random.seed(1)
+    inventory = dict()
+    while len(inventory) < n:
+        ip = '10.{}.{}.{}'.format(random.randrange(256), random.randrange(256), random.randrange(256))
+        inventory[ip] = ('主机{}'.format(len(inventory)), '机房A')
+    return inventory
+
+
+def make_log(inventory, lines, ips_per_line):
+    """生成日志文本，一半 IP 命中字典"""
+    random.seed(2)
+    known = list(inventory)
+    rows = []
+    for n in range(lines):
+        parts = ['Jan 15 10:46:{:02d} sshd[{}]:'.format(n % 60, n)]
+        for _ in range(ips_per_line):
+            if random.random() < 0.5:
+                ip = random.choice(known)
+            else:
+                ip = '172.16.{}.{}'.format(random.randrange(256), random.randrange(256))
+            parts.append('from {} port 22'.format(ip))
+        rows.append(' '.join(parts) + '\n')
+    return ''.join(rows)
+
+
+class NullWriter(io.StringIO):
+    """丢弃输出，只统计字节数"""
+    def isatty(self):
+        return False
+
+    def write(self, s):
+        return len(s)
+
+
+class NullBuffer(io.BytesIO):
+    """丢弃字节输出"""
+    def isatty(self):
+        return False
+
+    def write(self, b):
+        return len(b)
+
+
+def run(func, text):
+    stdin, stdout = sys.stdin, sys.stdout
+    if func is ip_notes.replace_ip_binary:
+        sys.stdin = io.TextIOWrapper(io.BytesIO(text.encode('utf-8')))
+        sys.stdout = io.TextIOWrapper(NullBuffer())
+    else:
+        sys.stdin = io.StringIO(text)
+        sys.stdout = NullWriter()
+    try:
+        start = time.perf_counter()
+        func()
+        return time.perf_counter() - start
+    finally:
+        sys.stdin, sys.stdout = stdin, stdout
+
+
+if __name__ == '__main__':
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    ips_per_line = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    ip_notes.ip_dict = make_inventory(10000)
+    text = make_log(ip_notes.ip_dict, lines, ips_per_line)
+    size_mb = len(text.encode('utf-8')) / 1024 / 1024
+
+    for name, func in (('legacy', legacy_replace_ip),
+                       ('streaming', ip_notes.replace_ip),
+                       ('binary', ip_notes.replace_ip_binary)):
+        elapsed = run(func, text)
+        print(f'{name:<10} {elapsed:8.3f}s  {size_mb / elapsed:8.2f} MB/s  {lines / elapsed:12.0f} lines/s')
@@ -0,0 +1,84 @@
+#!env python
+"""-s 查询耗时：旧的逐个 key 子串匹配 vs 排序索引二分查找；--find-note 备注反查耗时
+
+用法: python bench_search.py [IP数]
+"""
+
+import sys
+import os
+import io
+import random
+import time
+import tempfile
+import contextlib
+
+# 获取当前脚本所在目录的上一级目录
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+
+# 将上一级目录添加到sys.path中
+sys.path.insert(0, parent_dir)
+
+import ip_notes
+
+
+def legacy_search(ip):
+    """旧实现：遍历所有 key 做子串匹配"""
+    for key, value in ip_notes.ip_dict.items():
+        if ip in key:
+            print(f'{key.ljust(15, " ")}    {" ".join(value)}')
+
+
+def legacy_find_note(text):
+    """旧做法：-od 排序输出全部备注后 grep"""
+    with contextlib.redirect_stdout(io.StringIO()) as out:
+        ip_notes.sort_ip_dict()
+    for line in out.getvalue().splitlines():
+        if text in line:
+            print(line)
+
+
+def timed(func, *args):
+    """返回 (耗时毫秒, 输出行数)"""
+    with contextlib.redirect_stdout(io.StringIO()) as out:
+        start = time.perf_counter()
+        func(*args)
+        elapsed = time.perf_counter() - start
+    return elapsed * 1000, out.getvalue().count('\n')
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+
+    random.seed(1)
+    inventory = dict()
+    while len(inventory) < n:
+        inventory[ip_notes.int_to_ip(random.getrandbits(32))] = ('主机{}'.format(len(inventory)),
+                                                                 random.choice(('北京电信', '阿里云', '腾讯云')), 'web')
+    sample = next(iter(inventory))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        ip_notes.ip_dict = dict(inventory)
+        for ext in ('pkl', 'ipdb', 'db'):
+            ip_notes.save_data(os.path.join(tmp, 'IP.' + ext))
+
+        ip_notes.load_data(os.path.join(tmp, 'IP.pkl'))
+        ip_notes.materialize_data()
+        elapsed, rows = timed(legacy_search, sample)
+        print(f'{"legacy substring":<24} {sample:<22} {elapsed:10.2f}ms {rows:8} rows')
+
+        for ext in ('pkl', 'ipdb', 'db'):
+            ip_notes.load_data(os.path.join(tmp, 'IP.' + ext))
+            for query in (sample, '10.1.*', '10.0.0.0/8', '10.0.0.0-10.0.255.255'):
+                elapsed, rows = timed(ip_notes.search_arg, query)
+                print(f'{"-s " + ext:<24} {query:<22} {elapsed:10.2f}ms {rows:8} rows')
+
+        ip_notes.load_data(os.path.join(tmp, 'IP.pkl'))
+        elapsed, rows = timed(legacy_find_note, '阿里云')
+        print(f'{"legacy -od | grep":<24} {"阿里云":<22} {elapsed:10.2f}ms {rows:8} rows')
+        for ext in ('pkl', 'ipdb', 'db'):
+            ip_notes.load_data(os.path.join(tmp, 'IP.' + ext))
+            # pickle 首次查询时建立备注倒排索引
+            for query in ('主机12', '主机12', '阿里云 web', '电信 | 腾讯'):
+                elapsed, rows = timed(ip_notes.find_note, query)
+                print(f'{"--find-note " + ext:<24} {query:<22} {elapsed:10.2f}ms {rows:8} rows')
@@ -0,0 +1,66 @@
+#!env python
+"""短 -a 调用的耗时：每次装载数据 vs 交给 --serve 守护进程
+
+对单行输入多次计时取中位数，并给出大日志经守护进程替换的吞吐量
+
+用法: python bench_serve.py [IP数] [运行次数]
+"""
+
+import sys
+import os
+import time
+import random
+import statistics
+import subprocess
+import tempfile
+
+# 获取当前脚本所在目录的上一级目录
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+
+# 将上一级目录添加到sys.path中
+sys.path.insert(0, parent_dir)
+
+import ip_notes
+
+
+def median_ms(cmd, runs, stdin):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(cmd, input=stdin, stdout=subprocess.DEVNULL, check=True)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    random.seed(1)
+    ips = [ip_notes.int_to_ip(random.getrandbits(32)) for _ in range(n)]
+    log = ''.join(f'GET / from {random.choice(ips)} 200\n' for _ in range(200000)).encode('utf-8')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_file = os.path.join(tmp, 'IP.pkl')
+        ip_notes.ip_dict = {ip: ('主机{}'.format(i), '机房A') for i, ip in enumerate(ips)}
+        ip_notes.save_data(data_file)
+
+        script = os.path.join(parent_dir, 'ip_notes.py')
+        cmd = [sys.executable, script, '-d', data_file, '-a']
+        line = f'{ips[0]} login\n'.encode('utf-8')
+        print(f'{n} ips')
+        print(f'-a one line, local load   {median_ms(cmd, runs, line):8.1f}ms')
+
+        daemon = subprocess.Popen([sys.executable, script, '-d', data_file, '--serve'], stderr=subprocess.PIPE)
+        try:
+            # 等待守护进程装载完成
+            daemon.stderr.readline()
+            print(f'-a one line, via --serve  {median_ms(cmd, runs, line):8.1f}ms')
+            start = time.perf_counter()
+            subprocess.run(cmd, input=log, stdout=subprocess.DEVNULL, check=True)
+            elapsed = time.perf_counter() - start
+            print(f'-a 200k lines, via --serve {elapsed:7.2f}s ({len(log) / 1e6 / elapsed:.1f} MB/s)')
+        finally:
+            daemon.terminate()
+            daemon.wait()
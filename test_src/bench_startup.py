@@ -0,0 +1,95 @@
+#!env python
+"""短命令的冷启动耗时
+
+对 -s / -a / -v 等短命令多次计时取中位数，减去空解释器启动时间得到 ip_notes 自身开销，
+超过预算时返回非 0，可放在 CI 中防止启动耗时回退；同时列出 -X importtime 中最慢的模块
+
+用法: python bench_startup.py [运行次数] [预算毫秒]
+"""
+
+import sys
+import os
+import re
+import statistics
+import subprocess
+import tempfile
+import time
+
+# 获取当前脚本所在目录的上一级目录
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+
+# 将上一级目录添加到sys.path中
+sys.path.insert(0, parent_dir)
+
+import ip_notes
+
+
+def bench_env():
+    """允许写入字节码缓存，与日常使用一致"""
+    env = dict(os.environ)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    env['PYTHONPATH'] = parent_dir
+    return env
+
+
+def median_ms(cmd, runs, stdin=b''):
+    env = bench_env()
+    # 预热一次，生成字节码缓存
+    subprocess.run(cmd, input=stdin, stdout=subprocess.DEVNULL, env=env, check=True)
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(cmd, input=stdin, stdout=subprocess.DEVNULL, env=env, check=True)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+
+def import_time_top(n=10):
+    """-X importtime 中累计耗时最多的模块"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ip_notes'],
+                            stderr=subprocess.PIPE, stdout=subprocess.DEVNULL, env=bench_env(), text=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        match = re.match(r'import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)', line)
+        if match:
+            rows.append((int(match.group(2)), len(match.group(3)), match.group(4)))
+    return sorted(rows, reverse=True)[:n]
+
+
+if __name__ == '__main__':
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    budget = float(sys.argv[2]) if len(sys.argv) > 2 else 60
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_file = os.path.join(tmp, 'IP.pkl')
+        ip_notes.ip_dict = {ip_notes.int_to_ip(0x0a000000 + i): ('主机{}'.format(i),) for i in range(10000)}
+        ip_notes.save_data(data_file)
+
+        script = os.path.join(parent_dir, 'ip_notes.py')
+        base = median_ms([sys.executable, '-c', 'pass'], runs)
+        print(f'python -c pass                 {base:8.1f}ms')
+
+        failed = False
+        cases = (
+            ('-s 10.0.0.1', ['-d', data_file, '-s', '10.0.0.1'], b''),
+            ('-a', ['-d', data_file, '-a'], b'10.0.0.1\n'),
+            ('-v', ['-v'], b''),
+        )
+        for mode, prefix in (('script', [sys.executable, script]), ('module', [sys.executable, '-m', 'ip_notes'])):
+            for name, args, stdin in cases:
+                elapsed = median_ms(prefix + args, runs, stdin)
+                overhead = elapsed - base
+                # ip_notes.py 只是启动脚本，实现按字节码缓存导入，两种方式都检查预算
+                over = overhead > budget
+                failed = failed or over
+                print(f'{mode:<7} {name:<22} {elapsed:8.1f}ms  +{overhead:6.1f}ms{"  OVER BUDGET" if over else ""}')
+
+    print()
+    print('slowest imports (cumulative us):')
+    for cumulative, depth, module in import_time_top():
+        print(f'{cumulative:>10}  {module}')
+
+    if failed:
+        print(f'\nstartup overhead exceeds budget of {budget:.0f}ms')
+        sys.exit(1)
@@ -0,0 +1,69 @@
+#!env python
+"""-a 启动耗时随历史记录数量的变化
+
+对比旧的整体 pickle 格式与按数据段装载的 pickle/ipdb 格式，
+-a 只需要 ip_dict，历史记录再多启动耗时也应基本不变
+
+用法: python bench_startup_sections.py [IP数] [重复次数]
+"""
+
+import sys
+import os
+import time
+import pickle
+import tempfile
+import subprocess
+
+# 获取当前脚本所在目录的上一级目录
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+
+# 将上一级目录添加到sys.path中
+sys.path.insert(0, parent_dir)
+
+import ip_notes
+
+
+def make_store(ips, history):
+    """生成 ips 个 IP、history 条历史记录"""
+    ip_notes.ip_dict = {ip_notes.int_to_ip(0x0a000000 + i): ('主机{}'.format(i),) for i in range(ips)}
+    ip_notes.ip_history = dict()
+    for i in range(history):
+        key = ip_notes.int_to_ip(0x0a000000 + i % ips)
+        ip_notes.ip_history.setdefault(key, []).append((1700000000 + i, ('旧备注{}'.format(i),)))
+    ip_notes.ip_tag = dict()
+    ip_notes.ip_range = dict()
+
+
+def time_annotate(data_file, runs):
+    """多次运行 -a 取最小耗时"""
+    script = os.path.join(parent_dir, 'ip_notes.py')
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, script, '-d', data_file, '-a'], input=b'10.0.0.1\n',
+                       stdout=subprocess.DEVNULL, check=True)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+if __name__ == '__main__':
+    ips = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    print(f'{"history":>10} {"legacy pkl":>12} {"section pkl":>12} {"ipdb":>12}')
+    with tempfile.TemporaryDirectory() as tmp:
+        for history in (0, 100000, 1000000, 3000000):
+            make_store(ips, history)
+
+            legacy = os.path.join(tmp, f'legacy_{history}.pkl')
+            with open(legacy, 'wb') as f:
+                pickle.dump([ip_notes.ip_dict, ip_notes.ip_history, ip_notes.ip_tag, ip_notes.ip_range], f)
+            sectioned = os.path.join(tmp, f'section_{history}.pkl')
+            ip_notes.save_data(sectioned)
+            ipdb = os.path.join(tmp, f'ipdb_{history}.ipdb')
+            ip_notes.save_data(ipdb)
+
+            row = [time_annotate(path, runs) for path in (legacy, sectioned, ipdb)]
+            print(f'{history:>10} ' + ' '.join(f'{t * 1000:>10.0f}ms' for t in row))
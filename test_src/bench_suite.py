@@ -0,0 +1,220 @@
+#!env python
+"""热点路径基准测试套件
+
+在几种数据量下对导入、存盘、装载、-a 替换、-od 排序输出、-s 搜索、-m 统计与 --analyze 日志统计计时，
+每项重复多次取最小值。--save 把结果写入 JSON 基线；之后的运行与基线比较，
+某项耗时超过基线 (1 + 阈值) 倍时列出并返回非 0，可放在 CI 中防止性能回退
+
+基线与机器相关，应在同一台机器上生成与比较
+
+用法: python bench_suite.py [--sizes 1000,10000,100000] [--save] [--threshold 0.25] [--only 名称子串]
+"""
+
+import sys
+import os
+import io
+import json
+import time
+import argparse
+import platform
+import tempfile
+import contextlib
+
+# 获取当前脚本所在目录的上一级目录
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+
+# 将上一级目录添加到sys.path中
+sys.path.insert(0, parent_dir)
+
+import ip_notes
+from bench_data import make_inventory, make_tags, make_log, write_inventory, write_tags
+
+# 默认基线文件
+baseline_file = os.path.join(current_dir, 'bench_baseline.json')
+
+# 耗时低于该值（秒）的差异视为噪声，不算回退
+noise_floor = 0.01
+
+
+class NullWriter(io.StringIO):
+    """丢弃输出"""
+    def isatty(self):
+        return False
+
+    def write(self, s):
+        return len(s)
+
+
+class NullBuffer(io.BytesIO):
+    """丢弃字节输出"""
+    def isatty(self):
+        return False
+
+    def write(self, b):
+        return len(b)
+
+
+def reset_store():
+    """清空内存中的数据，相当于装载一个空的数据文件"""
+    if ip_notes.db_conn is not None:
+        ip_notes.db_conn.close()
+        ip_notes.db_conn = None
+    ip_notes.close_snapshot()
+    ip_notes.ip_dict = dict()
+    ip_notes.ip_history = dict()
+    ip_notes.ip_tag = dict()
+    ip_notes.ip_range = dict()
+    ip_notes.range_index = None
+    ip_notes.pending_records.clear()
+    ip_notes.reset_indexes()
+
+
+def run_quiet(func, *args, stdin=None, binary=False):
+    """运行 func，丢弃标准输出与标准错误，返回耗时（秒）"""
+    saved = sys.stdin
+    if binary:
+        sys.stdin = io.TextIOWrapper(io.BytesIO(stdin.encode('utf-8')))
+        out = io.TextIOWrapper(NullBuffer())
+    else:
+        sys.stdin = io.StringIO(stdin or '')
+        out = NullWriter()
+    try:
+        with contextlib.redirect_stdout(out), contextlib.redirect_stderr(NullWriter()):
+            start = time.perf_counter()
+            func(*args)
+            return time.perf_counter() - start
+    finally:
+        sys.stdin = saved
+
+
+def best_of(repeat, setup, func, *args, **kwargs):
+    """重复 repeat 次，每次先调用 setup，取最小耗时"""
+    times = []
+    for _ in range(repeat):
+        setup()
+        times.append(run_quiet(func, *args, **kwargs))
+    return min(times)
+
+
+def bench_size(n, tmp, args):
+    """一种数据量下的全部测试项，返回 {名称: 秒}"""
+    inventory = make_inventory(n, cjk_ratio=args.cjk_ratio)
+    notes_path = os.path.join(tmp, f'notes_{n}.txt')
+    tags_path = os.path.join(tmp, f'tags_{n}.txt')
+    write_inventory(notes_path, inventory)
+    write_tags(tags_path, make_tags(inventory, tag_count=args.tag_count))
+    log = make_log(inventory, args.lines, args.ips_per_line, args.hit_ratio)
+    results = dict()
+
+    def measure(name, setup, func, *func_args, **kwargs):
+        key = f'{name}/{n}'
+        if args.only not in key:
+            return
+        results[key] = best_of(args.repeat, setup, func, *func_args, **kwargs)
+        print(f'{key:<32} {results[key] * 1000:10.1f}ms', flush=True)
+
+    def fill():
+        reset_store()
+        with contextlib.redirect_stderr(NullWriter()):
+            ip_notes.insert_ip_note(notes_path)
+            ip_notes.insert_ip_note(tags_path, enable_tag=True)
+
+    measure('insert_ip_note', reset_store, ip_notes.insert_ip_note, notes_path)
+    measure('insert_ip_note -t', reset_store, ip_notes.insert_ip_note, tags_path, True)
+
+    paths = {ext: os.path.join(tmp, f'IP_{n}.{ext}') for ext in ('pkl', 'ipdb', 'db')}
+    for ext, path in paths.items():
+        def setup():
+            fill()
+            if os.path.exists(path):
+                os.remove(path)
+        measure(f'save_data {ext}', setup, ip_notes.save_data, path)
+        if not os.path.exists(path):
+            setup()
+            ip_notes.save_data(path)
+    for ext, path in paths.items():
+        measure(f'load_data {ext}', reset_store, ip_notes.load_data, path)
+        reset_store()
+
+    ip_notes.load_data(paths['pkl'])
+    ip_notes.materialize_data()
+    measure('replace_ip', lambda: None, ip_notes.replace_ip, stdin=log)
+    measure('replace_ip -b', lambda: None, ip_notes.replace_ip_binary, stdin=log, binary=True)
+    # 排序、搜索与统计每次都重建索引，测量的是首次运行的耗时
+    measure('sort_ip_dict', ip_notes.reset_indexes, ip_notes.sort_ip_dict)
+    sample = next(iter(inventory))
+    for name, query in (('ip', sample), ('wildcard', '10.1.*'), ('cidr', '10.0.0.0/12')):
+        measure(f'search_arg {name}', ip_notes.reset_indexes, ip_notes.search_arg, query)
+    measure('summary', ip_notes.reset_indexes, ip_notes.summary)
+    measure('summary -t', ip_notes.reset_indexes, ip_notes.summary, True)
+    measure('analyze', lambda: None, ip_notes.analyze, stdin=log, binary=True)
+    reset_store()
+    return results
+
+
+def compare(results, baseline, threshold):
+    """与基线比较，返回回退的项"""
+    regressions = []
+    print(f'\n{"benchmark":<32} {"baseline":>10} {"now":>10} {"change":>8}')
+    for name, seconds in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f'{name:<32} {"-":>10} {seconds * 1000:8.1f}ms {"new":>8}')
+            continue
+        change = seconds / base - 1 if base else 0
+        regressed = change > threshold and seconds - base > noise_floor
+        flag = '  REGRESSION' if regressed else ''
+        print(f'{name:<32} {base * 1000:8.1f}ms {seconds * 1000:8.1f}ms {change * 100:+7.1f}%{flag}')
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ip_notes 基准测试套件')
+    parser.add_argument('--sizes', default='1000,10000,100000', help='IP 数，逗号分隔')
+    parser.add_argument('--lines', type=int, default=50000, help='-a 测试的日志行数')
+    parser.add_argument('--ips-per-line', type=int, default=2, help='日志每行 IP 数')
+    parser.add_argument('--hit-ratio', type=float, default=0.5, help='日志中 IP 有备注的比例')
+    parser.add_argument('--cjk-ratio', type=float, default=0.7, help='备注中中文词的比例')
+    parser.add_argument('--tag-count', type=int, default=50, help='标签种类数')
+    parser.add_argument('--repeat', type=int, default=5, help='每项重复次数，取最小值')
+    parser.add_argument('--only', default='', help='只运行名称包含该子串的项')
+    parser.add_argument('--baseline', default=baseline_file, help='JSON 基线文件')
+    parser.add_argument('--save', action='store_true', help='把本次结果写入基线文件')
+    parser.add_argument('--threshold', type=float, default=0.25, help='超过基线的比例，超过即视为回退')
+    args = parser.parse_args()
+
+    results = dict()
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in (int(size) for size in args.sizes.split(',')):
+            results.update(bench_size(n, tmp, args))
+    if args.save:
+        baseline = dict()
+        if os.path.exists(args.baseline):
+            with open(args.baseline, encoding='utf-8') as f:
+                baseline = json.load(f)['results']
+        baseline.update(results)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump({'python': platform.python_version(), 'machine': platform.machine(),
+                       'saved': time.strftime('%Y-%m-%d %H:%M:%S'), 'results': baseline},
+                      f, ensure_ascii=False, indent=1, sort_keys=True)
+        print(f'\nsaved {len(results)} results to {args.baseline}')
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f'\nno baseline at {args.baseline}, run with --save first')
+        return 0
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)['results']
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print(f'\n{len(regressions)} regressions over {args.threshold * 100:.0f}%: {", ".join(regressions)}')
+        return 1
+    print('\nno regressions')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,413 @@
+#!env python
+"""ip_notes_core 的数据结构与索引：导入日志、网段索引、标签与备注索引、紧凑结构、历史版本、导出导入
+
+数据都在模块全局变量中，每个用例使用模块的独立副本，数据文件放在临时目录
+"""
+
+import sys
+import os
+import random
+import threading
+import time
+import types
+import importlib.util
+
+import pytest
+
+# 获取当前脚本所在目录的上一级目录
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+
+# 将上一级目录添加到sys.path中
+sys.path.insert(0, parent_dir)
+
+
+def fresh_core():
+    """ip_notes_core 的独立副本，相当于一个新启动的进程"""
+    spec = importlib.util.spec_from_file_location('ip_notes_core', os.path.join(parent_dir, 'ip_notes_core.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def core(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return fresh_core()
+
+
+def at_time(core, when):
+    """让 core 中的 time.time() 返回 when，导入记录使用该时间"""
+    core.time = types.SimpleNamespace(**{**vars(time), 'time': lambda: when})
+
+
+def run_import(data_file, lines, when, tag=False, text_file='input.txt'):
+    """与一次 ./ip_notes.py -i 相同：新进程装载数据、导入文本、保存修改"""
+    core = fresh_core()
+    at_time(core, when)
+    with open(text_file, 'w', encoding='utf-8') as f:
+        f.write(''.join(line + '\n' for line in lines))
+    core.load_data(data_file)
+    core.insert_ip_notes([text_file], enable_tag=tag)
+    core.save_changes(data_file)
+    return core
+
+
+def load(data_file, sections=()):
+    core = fresh_core()
+    core.load_data(data_file, sections)
+    return core
+
+
+def notes_of(core):
+    return {key: tuple(value) for key, value in core.loaded(core.ip_dict).items()}
+
+
+def history_of(core):
+    history = core.loaded(core.ip_history)
+    return {key: [(when, tuple(notes)) for when, notes in history[key]] for key in history}
+
+
+# 导入日志
+
+def test_journal_replay(core):
+    run_import('IP.pkl', ['10.0.0.1 打印机', '10.0.0.2 服务器', '10.8.0.0/16 机房'], 1000)
+    run_import('IP.pkl', ['10.0.0.1 新打印机', '10.0.0.3 交换机'], 2000)
+    assert not os.path.exists('IP.pkl')
+    assert os.path.exists('IP.pkl.journal')
+
+    data = load('IP.pkl')
+    assert notes_of(data) == {'10.0.0.1': ('新打印机',), '10.0.0.2': ('服务器',), '10.0.0.3': ('交换机',)}
+    assert dict(data.ip_range) == {'10.8.0.0/16': ('机房',)}
+    assert history_of(data) == {'10.0.0.1': [(2000, ('打印机',))]}
+    assert data.ip_added['10.0.0.1'] == 1000 and data.ip_added['10.0.0.3'] == 2000
+    assert data.journal_records == 5
+
+    # 写入中断留下的不完整行不重放，合并后与合并前相同
+    with open('IP.pkl.journal', 'a', encoding='utf-8') as f:
+        f.write('note 10.0.0.9 半')
+    data.compact_data('IP.pkl')
+    assert not os.path.exists('IP.pkl.journal')
+    merged = load('IP.pkl')
+    assert notes_of(merged) == notes_of(data)
+    assert history_of(merged) == history_of(data)
+    assert merged.ip_added['10.0.0.1'] == 1000
+
+
+def test_journal_replay_ipdb(core):
+    run_import('IP.pkl', ['10.0.0.1 打印机', '10.0.0.2 服务器'], 1000)
+    load('IP.pkl').compact_data('IP.pkl')
+    load('IP.pkl').migrate_data('IP.pkl')
+    run_import('IP.ipdb', ['10.0.0.1 新打印机', '10.0.0.3 交换机'], 2000)
+
+    data = load('IP.ipdb', ('dict',))
+    assert notes_of(data) == {'10.0.0.1': ('新打印机',), '10.0.0.2': ('服务器',), '10.0.0.3': ('交换机',)}
+    assert history_of(data) == {'10.0.0.1': [(2000, ('打印机',))]}
+    # 只读数据段不复制到内存，修改记在覆盖层中
+    assert isinstance(data.ip_dict, data.JournalOverlay)
+
+
+def test_journal_lock_blocks_readers(core):
+    run_import('IP.pkl', ['10.0.0.1 打印机'], 1000)
+    loaded_at = []
+
+    def reader():
+        load('IP.pkl', ('dict',))
+        loaded_at.append(time.monotonic())
+
+    with core.journal_lock('IP.pkl'):
+        thread = threading.Thread(target=reader)
+        thread.start()
+        time.sleep(0.2)
+        assert not loaded_at
+        released = time.monotonic()
+    thread.join(5)
+    assert loaded_at and loaded_at[0] >= released
+
+
+# 网段/范围的最长前缀匹配
+
+def smallest_range(ranges, n):
+    """逐个比较：覆盖 n 的最小网段/范围的备注"""
+    found = [(end - start, note) for start, end, note in ranges if start <= n <= end]
+    return min(found)[1] if found else None
+
+
+def test_range_longest_prefix(core):
+    core.ip_range = {'10.0.0.0/8': ('A',), '10.1.0.0/16': ('B',), '10.1.2.0-10.1.2.255': ('C',),
+                     '10.1.2.128/25': ('D',), '10.2.0.0-10.2.0.100': ('E',), '10.2.0.50-10.2.0.200': ('F',)}
+    core.ip_dict = {'10.1.2.200': ('单个',)}
+    expected = {'9.255.255.255': None, '10.0.0.1': 'A', '10.1.0.1': 'B', '10.1.2.1': 'C', '10.1.2.129': 'D',
+                '10.2.0.60': 'E', '10.2.0.150': 'F', '10.2.0.201': 'A', '11.0.0.0': None}
+    for ip, note in expected.items():
+        assert core.search_ip_range(ip) == note, ip
+    # 单个 IP 的备注优先
+    assert core.search_ip_dict('10.1.2.200') == '10.1.2.200 [单个]'
+    assert core.search_ip_dict('10.1.2.201') == '10.1.2.201 [D]'
+
+
+def test_range_index_random(core):
+    rng = random.Random(1)
+    ranges = dict()
+    while len(ranges) < 300:
+        prefix = rng.randint(8, 30)
+        n = rng.getrandbits(32) & ~((1 << (32 - prefix)) - 1)
+        key = core.parse_ip_range(f'{core.int_to_ip(n)}/{prefix}')[0]
+        ranges[key] = (f'net{len(ranges)}',)
+    core.ip_range = ranges
+    bounds = [core.range_bounds(key) + (value[0],) for key, value in ranges.items()]
+
+    starts, ends, notes = core.build_range_index()
+    assert list(starts) == sorted(starts)
+    assert all(ends[i] < starts[i + 1] for i in range(len(starts) - 1))
+    probes = [start for start, _, _ in bounds] + [end for _, end, _ in bounds] + \
+             [end + 1 for _, end, _ in bounds] + [rng.getrandbits(32) for _ in range(2000)]
+    for n in probes:
+        n &= 0xffffffff
+        assert core.search_ip_range(core.int_to_ip(n)) == smallest_range(bounds, n), core.int_to_ip(n)
+
+
+# 标签索引与 --tags 表达式
+
+def test_parse_tag_query(core):
+    parse = core.parse_tag_query
+    assert parse('电脑') == ('tag', '电脑')
+    assert parse('a & b | c') == ('or', [('and', [('tag', 'a'), ('tag', 'b')]), ('tag', 'c')])
+    assert parse('a & (b | !c)') == ('and', [('tag', 'a'), ('or', [('tag', 'b'), ('not', ('tag', 'c'))])])
+    assert parse(' !!a ') == ('not', ('not', ('tag', 'a')))
+    for text in ('', 'a &', '(a', 'a)', 'a b', '& a', '!'):
+        with pytest.raises(ValueError):
+            parse(text)
+
+
+def test_tag_query_index(core):
+    rng = random.Random(2)
+    names = ['电脑', '通外网', '中毒', 'server', 'dns']
+    tags = dict()
+    for _ in range(500):
+        ip = core.int_to_ip(rng.randrange(1 << 16) | 0x0a000000)
+        tags.setdefault(ip, set()).update(rng.sample(names, rng.randint(1, 3)))
+    run_import('IP.pkl', [f'{ip} {" ".join(sorted(value))}' for ip, value in tags.items()], 1000, tag=True)
+    # 增量合并的标签与整体重建的索引一致
+    extra = {'10.0.0.1': {'dns'}, '10.0.0.2': {'中毒', '电脑'}}
+    run_import('IP.pkl', [f'{ip} {" ".join(value)}' for ip, value in extra.items()], 2000, tag=True)
+    for ip, value in extra.items():
+        tags.setdefault(ip, set()).update(value)
+
+    data = load('IP.pkl')
+    index = data.update_tag_index()
+    rebuilt = data.build_tag_index()
+    assert {tag: list(data.posting_ints(ints)) for tag, ints in index['tags'].items()} == \
+           {tag: list(data.posting_ints(ints)) for tag, ints in rebuilt['tags'].items()}
+
+    def brute(test):
+        return {data.ip_to_int(ip) for ip, value in tags.items() if test(value)}
+
+    cases = {
+        '电脑': lambda t: '电脑' in t,
+        '电脑 & 通外网 & !中毒': lambda t: '电脑' in t and '通外网' in t and '中毒' not in t,
+        'server | dns & !电脑': lambda t: 'server' in t or ('dns' in t and '电脑' not in t),
+        '!(dns | server)': lambda t: not ('dns' in t or 'server' in t),
+        '(电脑 | dns) & (中毒 | server)': lambda t: ('电脑' in t or 'dns' in t) and ('中毒' in t or 'server' in t),
+        '没有 | dns': lambda t: 'dns' in t,
+    }
+    for text, test in cases.items():
+        assert data.tag_query_ips(text) == brute(test), text
+
+
+# 备注倒排索引
+
+def test_note_index(core):
+    rng = random.Random(3)
+    words = ['GoogleDNS', 'googledns2', '阿里云DNS', '北京电信DNS', '腾讯云', 'printer', 'Printer-01', '打印机', 'x1']
+    notes = dict()
+    for i in range(400):
+        notes[core.int_to_ip(0x0a000000 + i)] = tuple(rng.sample(words, rng.randint(1, 2)))
+    run_import('IP.pkl', [f'{ip} {" ".join(value)}' for ip, value in notes.items()], 1000)
+    load('IP.pkl').compact_data('IP.pkl')
+    # 修改、新增的备注合并到已保存的索引
+    changed = {'10.0.0.1': ('新设备',), '10.0.0.2': ('GoogleDNS', 'backup'), '10.9.9.9': ('dnsmasq',)}
+    run_import('IP.pkl', [f'{ip} {" ".join(value)}' for ip, value in changed.items()], 2000)
+    notes.update(changed)
+
+    data = load('IP.pkl', ('dict', 'notes'))
+    index = data.update_note_index()
+    rebuilt = data.build_note_index()
+    assert index['tokens'] == rebuilt['tokens']
+    assert index['grams'] == rebuilt['grams']
+    assert {part: list(data.posting_ints(ints)) for part, ints in index['parts'].items()} == \
+           {part: list(data.posting_ints(ints)) for part, ints in rebuilt['parts'].items()}
+
+    for term in ('dns', 'DNS', 'gle', 'g', 'x1', 'printer-0', '-', '云', '阿里', '京电', '京电信dns', 'dnsm',
+                 '新设', 'backup', 'nothing', '打印机'):
+        expected = {data.ip_to_int(ip) for ip, value in notes.items() if any(term.lower() in p.lower() for p in value)}
+        assert data.term_ips(index, term.lower()) == expected, term
+
+
+def test_note_index_without_grams(core):
+    """旧版本数据文件保存的备注索引没有三字片段索引，用到时重建"""
+    core.ip_dict = {'10.0.0.1': ('GoogleDNS',), '10.0.0.2': ('printer',)}
+    index = core.build_note_index()
+    del index['grams']
+    core.note_index = index
+    index = core.update_note_index()
+    assert core.term_ips(index, 'dns') == {core.ip_to_int('10.0.0.1')}
+    assert core.term_ips(index, 'nt') == {core.ip_to_int('10.0.0.2')}
+
+
+# 紧凑结构
+
+def test_compact_notes(core):
+    rng = random.Random(4)
+    compact = core.CompactNotes()
+    plain = dict()
+    values = [('GoogleDNS',), ('阿里云DNS', '主'), ('打印机',), ('电脑', '三楼')]
+    for step in range(5000):
+        key = core.int_to_ip(rng.randrange(300) + 0x0a000000)
+        if rng.random() < 0.2 and key in plain:
+            del plain[key]
+            del compact[key]
+        else:
+            plain[key] = rng.choice(values)
+            compact[key] = plain[key]
+        if step % 500 == 0:
+            assert len(compact) == len(plain)
+    assert len(compact) == len(plain)
+    assert list(compact) == sorted(plain, key=core.ip_to_int)
+    assert dict(compact.items()) == plain
+    assert all(compact[key] == value for key, value in plain.items())
+    assert '10.0.1.255' not in compact and '010.0.0.1' not in compact
+    with pytest.raises(KeyError):
+        compact['10.0.1.255']
+    with pytest.raises(ValueError):
+        compact['10.0.0.0/8'] = ('网段',)
+    # 相同的备注只存一份
+    assert len(compact.table) <= len(values)
+    assert compact.part_counts() == core.collections.Counter(p for value in plain.values() for p in value)
+
+    restored = core.CompactNotes().restore(compact.dump())
+    assert dict(restored.items()) == plain
+    ints = sorted(core.ip_to_int(key) for key in plain)[::3] + [0xffffffff]
+    assert [restored.decode(i) if i is not None else None for i in restored.find_ints(ints)] == \
+           [plain.get(core.int_to_ip(n)) for n in ints]
+
+
+def test_compact_tags(core):
+    compact = core.CompactTags({'10.0.0.2': {'b', 'a'}, '10.0.0.1': {'a'}})
+    assert compact['10.0.0.2'] == {'a', 'b'}
+    # 取出的是新集合，修改后需赋值回去
+    tags = compact['10.0.0.1']
+    tags.add('c')
+    assert compact['10.0.0.1'] == {'a'}
+    compact['10.0.0.1'] = tags
+    compact['10.0.0.3'] = {'b', 'a'}
+    assert compact['10.0.0.1'] == {'a', 'c'}
+    assert list(compact) == ['10.0.0.1', '10.0.0.2', '10.0.0.3']
+    # 相同的标签组合只存一份
+    assert compact.value_id('10.0.0.2') == compact.value_id('10.0.0.3')
+    del compact['10.0.0.2']
+    restored = core.CompactTags().restore(compact.dump())
+    assert dict(restored.items()) == {'10.0.0.1': {'a', 'c'}, '10.0.0.3': {'a', 'b'}}
+
+
+def test_compact_sections_saved(core):
+    """IP 较多时以紧凑结构存入 pickle 数据文件，装载后与字典相同"""
+    run_import('IP.pkl', ['10.0.0.1 打印机', '10.0.0.2 打印机', '10.0.0.3 服务器'], 1000)
+    run_import('IP.pkl', ['10.0.0.1 电脑 三楼', '10.0.0.3 办公'], 1000, tag=True)
+    data = load('IP.pkl')
+    data.compact_min_size = 1
+    data.compact_data('IP.pkl')
+    merged = load('IP.pkl', ('dict', 'tag', 'added'))
+    assert isinstance(merged.ip_dict, merged.CompactNotes)
+    assert isinstance(merged.ip_tag, merged.CompactTags)
+    assert isinstance(merged.ip_added, merged.CompactTimes)
+    assert notes_of(merged) == notes_of(data)
+    assert dict(merged.ip_tag.items()) == {'10.0.0.1': {'电脑', '三楼'}, '10.0.0.3': {'办公'}}
+
+
+# 历史版本：--at 与 --prune-history
+
+def import_versions(data_file):
+    """10.0.0.1 在 1000、2000、3000 三次导入不同备注，10.0.0.2 在 2000 第一次导入，网段在 1000、3000 导入"""
+    run_import(data_file, ['10.0.0.1 a', '10.9.0.0/16 旧网段'], 1000)
+    run_import(data_file, ['10.0.0.1 b', '10.0.0.2 x'], 2000)
+    run_import(data_file, ['10.0.0.1 c', '10.9.0.0/16 新网段'], 3000)
+
+
+@pytest.mark.parametrize('data_file', ['IP.pkl', 'IP.db'])
+def test_notes_at(core, data_file):
+    import_versions(data_file)
+    expected = {
+        999: ('10.0.0.1', '10.0.0.2', '10.9.1.1'),
+        1000: ('10.0.0.1 [a]', '10.0.0.2', '10.9.1.1 [旧网段]'),
+        2500: ('10.0.0.1 [b]', '10.0.0.2 [x]', '10.9.1.1 [旧网段]'),
+        3000: ('10.0.0.1 [c]', '10.0.0.2 [x]', '10.9.1.1 [新网段]'),
+    }
+    for when, results in expected.items():
+        data = load(data_file, ('dict', 'range', 'history', 'added'))
+        data.view_notes_at(when)
+        assert tuple(data.search_ip_dict(ip) for ip in ('10.0.0.1', '10.0.0.2', '10.9.1.1')) == results, when
+
+
+@pytest.mark.parametrize('data_file', ['IP.pkl', 'IP.db'])
+def test_prune_history(core, data_file):
+    import_versions(data_file)
+    data = fresh_core()
+    data.prune_data(data_file, cutoff=2500)
+    data = load(data_file, ('history', 'added'))
+    # 1000 时的备注被删除，最早只能查到 2000 时的备注
+    assert history_of(data) == {'10.0.0.1': [(3000, ('b',))], '10.9.0.0/16': [(3000, ('旧网段',))]}
+    assert data.ip_added['10.0.0.1'] == 2000
+    assert data.notes_at('10.0.0.1', ('c',), 1500) is None
+    assert data.notes_at('10.0.0.1', ('c',), 2500) == ('b',)
+
+    fresh_core().prune_data(data_file, keep=0)
+    data = load(data_file, ('history', 'added'))
+    assert history_of(data) == {}
+    assert data.ip_added['10.0.0.1'] == 3000
+
+
+def test_prune_history_index(core):
+    """按时间索引删除的结果与逐个 key 比较相同"""
+    rng = random.Random(5)
+    history = dict()
+    for i in range(300):
+        key = core.int_to_ip(0x0a000000 + i)
+        history[key] = sorted((rng.randrange(10000), (f'v{j}',)) for j in range(rng.randint(1, 6)))
+    core.ip_history = {key: list(versions) for key, versions in history.items()}
+    core.build_history_index(core.ip_history)
+
+    removed = core.prune_history(cutoff=4000, keep=2)
+    expected = dict()
+    for key, versions in history.items():
+        kept = [version for version in versions if version[0] >= 4000][-2:]
+        if kept:
+            expected[key] = kept
+    assert core.ip_history == expected
+    assert removed == sum(map(len, history.values())) - sum(map(len, expected.values()))
+    assert core.history_index['total'] == sum(map(len, expected.values()))
+
+
+# 导出与导入
+
+@pytest.mark.parametrize('fmt', ['csv', 'tsv', 'jsonl'])
+def test_export_round_trip(core, fmt):
+    import_versions('IP.pkl')
+    run_import('IP.pkl', ['10.0.0.1 电脑 "引号",逗号', '10.0.0.5 服务器'], 4000, tag=True)
+    run_import('IP.pkl', ['10.0.0.5 备注\t含制表符'], 4000)
+    source = load('IP.pkl')
+    source.export_data(fmt, 'export.' + fmt)
+
+    target = fresh_core()
+    target.load_data('restored.pkl')
+    target.import_export(['export.' + fmt], fmt)
+    target.save_data('restored.pkl')
+    restored = load('restored.pkl')
+    restored.export_data(fmt, 'again.' + fmt)
+
+    with open('export.' + fmt, 'rb') as f, open('again.' + fmt, 'rb') as g:
+        assert f.read() == g.read()
+    assert notes_of(restored) == notes_of(source)
+    assert history_of(restored) == history_of(source)
+    assert dict(restored.ip_tag) == dict(source.ip_tag)
+    assert restored.ip_added['10.0.0.2'] == 2000
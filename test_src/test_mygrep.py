@@ -0,0 +1,83 @@
+#!env python
+"""tools/mygrep.py 的匹配结果应与旧版逐行 re.search / 子串查找相同"""
+
+import sys
+import os
+import re
+
+# 获取当前脚本所在目录的上一级目录
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+
+# 将 tools 目录添加到sys.path中
+sys.path.insert(0, os.path.join(parent_dir, 'tools'))
+
+import mygrep
+
+text = 'foo bar\nxx foo\n阿里云DNS 1.1.1.1\nGoogleDNS 8.8.8.8\n\nfoo  \nlast foo'
+
+
+def grep(pattern, data, use_regex=True, encoding='utf-8'):
+    """用 Searcher 按 chunk_size 切块搜索，返回解码后的匹配行"""
+    searcher = mygrep.Searcher(mygrep.compile_patterns([pattern], use_regex, encoding), encoding=encoding)
+    found = []
+    pos = 0
+    while pos < len(data):
+        end = data.find(b'\n', min(pos + mygrep.chunk_size, len(data)))
+        end = len(data) if end < 0 else end + 1
+        found.extend(searcher.search(data, pos, end))
+        pos = end
+    return [line.decode(encoding) for line in found]
+
+
+def legacy(pattern, source):
+    """旧实现：按文本逐行 re.search"""
+    return [line for line in source.replace('\r\n', '\n').splitlines(True) if re.search(pattern, line)]
+
+
+def test_anchors_match_every_line():
+    for pattern in ('^foo', 'foo$', '^$', '^', '$', r'\s$', r'foo\s*$', r'\Afoo', r'foo\Z'):
+        assert grep(pattern, text.encode('utf-8')) == legacy(pattern, text), pattern
+
+
+def test_anchors_across_chunks(monkeypatch):
+    monkeypatch.setattr(mygrep, 'chunk_size', 16)
+    for pattern in ('^foo', 'foo$', r'o\n^', r'foo\s+foo'):
+        assert grep(pattern, text.encode('utf-8')) == legacy(pattern, text), pattern
+
+
+def test_cjk_regex():
+    data = text.encode('utf-8')
+    assert grep('阿.云', data) == ['阿里云DNS 1.1.1.1\n']
+    assert grep(r'^\w+DNS', data) == ['阿里云DNS 1.1.1.1\n', 'GoogleDNS 8.8.8.8\n']
+    assert grep('里云', data, use_regex=False) == ['阿里云DNS 1.1.1.1\n']
+
+
+def test_locale_encoding():
+    source = '阿里云DNS\nabc\n竑x\n'
+    data = source.encode('gbk')
+    assert grep('阿.云', data, encoding='gbk') == ['阿里云DNS\n']
+    assert grep('里云', data, use_regex=False, encoding='gbk') == ['阿里云DNS\n']
+    # 竑 的 GBK 编码第二个字节是 f，按字符匹配时不应命中
+    assert grep('f', data, use_regex=False, encoding='gbk') == []
+
+
+def test_zero_width_at_line_end():
+    # 逐行匹配时换行符之后即字符串末尾，\B、(?!...) 可以在那里成立
+    cases = [(r'\B', 'b\n\t'), (r'\B$', '\nab\na'), (r'\B', 'ab\ncd\n'), (r'b\B', 'ab\n\n'),
+             (r'(?!c)$', 'ab\ncd'), (r'\B\Z', 'x\ny\n'), (r'(?=\B)', 'x\n\ny')]
+    for pattern, source in cases:
+        assert grep(pattern, source.encode('utf-8')) == legacy(pattern, source), (pattern, source)
+        # 含中文时为字符串正则
+        assert grep(pattern + '|中', ('文' + source).encode('utf-8')) == legacy(pattern + '|中', '文' + source), pattern
+
+
+def test_crlf():
+    source = 'a foo\r\nfoo b\r\n'
+    found = grep('foo$', source.encode('utf-8'))
+    assert [line.replace('\r\n', '\n') for line in found] == legacy('foo$', source)
+    # 输出保留原来的换行符，单独的 \r 也作为换行
+    assert found == ['a foo\r\n']
+    source = 'x 中\r\nfoo\ry 中\r\nlast 中'
+    assert grep('中$', source.encode('utf-8')) == ['x 中\r\n', 'y 中\r\n', 'last 中']
+    assert grep(r'\B', 'b\r\n\t'.encode('utf-8')) == ['b\r\n', '\t']
@@ -1,72 +1,174 @@
-import chardet
-import argparse
-import glob
-import os
-import platform
-import sys
-
-
-def change_default_encoding():
-    """判断是否在 windows git-bash 下运行，是则使用 utf-8 编码"""
-    if platform.system() == 'Windows':
-        terminal = os.environ.get('TERM')
-        if terminal and 'xterm' in terminal:
-            sys.stdin.reconfigure(encoding='utf-8')
-            sys.stdout.reconfigure(encoding='utf-8')
-
-
-def is_file(file_path):
-    return os.path.isfile(file_path)
-
-
-def detect_file_encoding(file_path):
-    with open(file_path, 'rb') as file:
-        detector = chardet.universaldetector.UniversalDetector()
-        for line in file:
-            detector.feed(line)
-            if detector.done:
-                break
-        detector.close()
-    return detector.result['encoding']
-
-
-def check_crlf_ending(file_path):
-    with open(file_path, 'rb') as file:
-        line = file.read(1000)
-        # print(repr(line))
-        if b'\r\n' in line or b'\r\x00\n' in line:
-            return 'CRLF'
-
-        if b'\r' in line:
-            return 'CR'
-
-        return 'LF'
-
-
-def check_file_encodings(files):
-    for file_path in files:
-        if is_file(file_path):
-            encoding = detect_file_encoding(file_path)
-            ending = check_crlf_ending(file_path)
-            formatted_file_path = "{:<20}".format(file_path)
-            print(
-                f"{formatted_file_path}\t编码: {encoding if encoding else '无法确定'}\t换行: {ending if ending else '无法确定'}")
-
-
-def main():
-    parser = argparse.ArgumentParser(description='Check file encodings')
-    parser.add_argument(
-        'files', nargs='+', help='File paths to check. You can use * for wildcard expansion.')
-
-    args = parser.parse_args()
-
-    # 使用 glob 模块进行通配符扩展
-    expanded_files = [file_path for pattern in args.files for file_path in glob.glob(
-        pattern) if is_file(file_path)]
-
-    check_file_encodings(expanded_files)
-
-
-if __name__ == "__main__":
-    change_default_encoding()
-    main()
+import chardet
+import argparse
+import codecs
+import glob
+import os
+import platform
+import sys
+
+# 编码检测时从文件中取样的次数与每次的字节数，取样位置均匀分布在整个文件中
+sample_count = 4
+sample_size = 64 << 10
+
+# chardet 的置信度低于该值时视为无法确定
+min_confidence = 0.5
+
+# 样本中的非 ASCII 字节少于该值时 chardet 的结果视为无法确定：只有几个字节时置信度并不可靠，
+# 如大段 ASCII 之后 GBK 编码的“中文”4 个字节会被判为置信度 0.77 的 ISO-8859-9
+min_non_ascii = 8
+
+# 删除后剩下的即非 ASCII 字节
+ascii_bytes = bytes(range(0x80))
+
+# 文件开头的 BOM 与对应的编码
+boms = ((codecs.BOM_UTF8, 'UTF-8-SIG'), (codecs.BOM_UTF32_LE, 'UTF-32'), (codecs.BOM_UTF32_BE, 'UTF-32'),
+        (codecs.BOM_UTF16_LE, 'UTF-16'), (codecs.BOM_UTF16_BE, 'UTF-16'))
+
+
+def change_default_encoding():
+    """判断是否在 windows git-bash 下运行，是则使用 utf-8 编码"""
+    if platform.system() == 'Windows':
+        terminal = os.environ.get('TERM')
+        if terminal and 'xterm' in terminal:
+            sys.stdin.reconfigure(encoding='utf-8')
+            sys.stdout.reconfigure(encoding='utf-8')
+
+
+def is_file(file_path):
+    return os.path.isfile(file_path)
+
+
+def read_samples(file):
+    """从文件中均匀取 sample_count 段，每段 sample_size 字节
+    除第一段外都从下一个换行处开始，避免从多字节字符中间切开
+    """
+    size = os.fstat(file.fileno()).st_size
+    if size <= sample_count * sample_size:
+        return [file.read()]
+    samples = []
+    step = (size - sample_size) // (sample_count - 1)
+    for i in range(sample_count):
+        file.seek(i * step)
+        block = file.read(sample_size)
+        if i:
+            block = block[block.find(b'\n') + 1:]
+        samples.append(block)
+    return samples
+
+
+def is_utf8(samples):
+    """各段样本是否都是合法的 UTF-8，段尾被截断的字符不算错误"""
+    for block in samples:
+        try:
+            codecs.getincrementaldecoder('utf-8')().decode(block)
+        except UnicodeDecodeError:
+            return False
+    return True
+
+
+def detect_encoding(samples):
+    """根据样本判断编码，返回 (编码, 置信度)，无法确定时编码为 None
+
+    BOM 与纯 ASCII、UTF-8 直接判断；其余交给 chardet，置信度低于 min_confidence
+    或非 ASCII 字节少于 min_non_ascii 时视为无法确定
+    """
+    head = samples[0] if samples else b''
+    for bom, encoding in boms:
+        if head.startswith(bom):
+            return encoding, 1.0
+    if all(block.isascii() for block in samples):
+        return 'ascii', 1.0
+    if is_utf8(samples):
+        return 'utf-8', 0.99
+    detector = chardet.universaldetector.UniversalDetector()
+    for block in samples:
+        detector.feed(block)
+        if detector.done:
+            break
+    detector.close()
+    encoding = detector.result['encoding']
+    confidence = detector.result['confidence'] or 0
+    if confidence < min_confidence or sum(len(block.translate(None, ascii_bytes)) for block in samples) < min_non_ascii:
+        return None, confidence
+    return encoding, confidence
+
+
+def detect_file_encoding(file_path):
+    """只读取文件中的若干段样本判断编码，返回 (编码, 置信度)"""
+    with open(file_path, 'rb') as file:
+        return detect_encoding(read_samples(file))
+
+
+def check_crlf_ending(file_path):
+    with open(file_path, 'rb') as file:
+        line = file.read(1000)
+        # print(repr(line))
+        if b'\r\n' in line or b'\r\x00\n' in line:
+            return 'CRLF'
+
+        if b'\r' in line:
+            return 'CR'
+
+        return 'LF'
+
+
+def init_worker(confidence):
+    """子进程初始化：使用主进程的 --min-confidence"""
+    global min_confidence
+    min_confidence = confidence
+
+
+def check_file(file_path):
+    """检查一个文件，返回 (文件, 编码, 置信度, 换行)，供进程池调用"""
+    encoding, confidence = detect_file_encoding(file_path)
+    return file_path, encoding, confidence, check_crlf_ending(file_path)
+
+
+def check_file_encodings(files, jobs=1):
+    """检查多个文件，多于一个文件时交给进程池，按文件顺序输出"""
+    if jobs <= 1 or len(files) <= 1:
+        results = map(check_file, files)
+        pool = None
+    else:
+        import multiprocessing
+        pool = multiprocessing.Pool(min(jobs, len(files)), initializer=init_worker, initargs=(min_confidence,))
+        results = pool.imap(check_file, files)
+    try:
+        for file_path, encoding, confidence, ending in results:
+            formatted_file_path = "{:<20}".format(file_path)
+            print(
+                f"{formatted_file_path}\t编码: {encoding if encoding else '无法确定'}\t置信度: {confidence:.2f}"
+                f"\t换行: {ending if ending else '无法确定'}", flush=True)
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+
+def main():
+    global min_confidence
+    parser = argparse.ArgumentParser(description='Check file encodings')
+    parser.add_argument(
+        'files', nargs='+', help='File paths to check. You can use * for wildcard expansion.')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help='Number of worker processes, defaults to the number of CPUs.')
+    parser.add_argument('--min-confidence', type=float, default=min_confidence,
+                        help='Report the encoding as unknown below this chardet confidence.')
+
+    args = parser.parse_args()
+    min_confidence = args.min_confidence
+
+    # 使用 glob 模块进行通配符扩展
+    expanded_files = [file_path for pattern in args.files for file_path in glob.glob(
+        pattern) if is_file(file_path)]
+
+    check_file_encodings(expanded_files, jobs=args.jobs)
+
+
+if __name__ == "__main__":
+    # pyinstaller 打包后在 windows 下使用多进程需要
+    if getattr(sys, 'frozen', False):
+        import multiprocessing
+        multiprocessing.freeze_support()
+    change_default_encoding()
+    main()
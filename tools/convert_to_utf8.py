@@ -1,73 +1,288 @@
-import argparse
-import chardet
-import sys
-import os
-import platform
-
-
-def change_default_encoding():
-    """判断是否在 windows git-bash 下运行，是则使用 utf-8 编码"""
-    if platform.system() == 'Windows':
-        terminal = os.environ.get('TERM')
-        if terminal and 'xterm' in terminal:
-            sys.stdin.reconfigure(encoding='utf-8')
-            sys.stdout.reconfigure(encoding='utf-8')
-
-
-def detect_file_encoding(file_path):
-    with open(file_path, 'rb') as file:
-        detector = chardet.universaldetector.UniversalDetector()
-        for line in file:
-            detector.feed(line)
-            if detector.done:
-                break
-        detector.close()
-    return detector.result['encoding']
-
-
-def convert_file_encoding(input_file_path, output_file_path):
-    # 检测输入文件的编码
-    input_encoding = detect_file_encoding(input_file_path)
-
-    if not input_encoding:
-        print("无法确定输入文件编码")
-        return
-
-    # 打开输入文件，并以检测到的编码读取内容
-    with open(input_file_path, 'r', encoding=input_encoding) as input_file:
-        content = input_file.read()
-
-        # 打开输出文件或使用标准输出
-        if output_file_path:
-            with open(output_file_path, 'w', encoding='utf-8') as output_file:
-                output_file.write(content)
-        else:
-            sys.stdout.write(content)
-
-
-def main():
-    change_default_encoding()
-    parser = argparse.ArgumentParser(description='Convert file encoding to UTF-8')
-    parser.add_argument('-i', '--input', help='Input file path. If not provided, read from standard input.')
-    parser.add_argument('-o', '--output', help='Output file path. If not provided, write to standard output.')
-
-    args = parser.parse_args()
-
-    if args.input:
-        convert_file_encoding(args.input, args.output)
-        print(f"文件已转换: {args.input} -> {args.output if args.output else '标准输出'}")
-    else:
-        # 从标准输入读取内容
-        input_content = sys.stdin.read()
-
-        # 如果提供了输出文件路径，则写入文件，否则写入标准输出
-        if args.output:
-            with open(args.output, 'w', encoding='utf-8') as output_file:
-                output_file.write(input_content)
-            print(f"文件已转换: 标准输入 -> {args.output}")
-        else:
-            sys.stdout.write(input_content)
-
-
-if __name__ == "__main__":
-    main()
+import argparse
+import codecs
+import contextlib
+import glob
+import sys
+import os
+import platform
+import shutil
+import tempfile
+
+import check_file_encoding
+from check_file_encoding import detect_encoding, detect_file_encoding
+
+# 转换时每次读入的字节数，内存占用与文件大小无关
+chunk_size = 1 << 20
+
+# chardet 常报告为 GB2312/GBK 的中文 Windows 文件中常混有超出其范围的字符，按超集 GB18030 解码
+superset_encodings = {'gb2312': 'gb18030', 'gbk': 'gb18030', 'ascii': 'utf-8'}
+
+
+class UndeterminedEncoding(UnicodeError):
+    """样本之外出现无法按 UTF-8 解码的字节，重新检测也无法确定编码"""
+
+
+def change_default_encoding():
+    """判断是否在 windows git-bash 下运行，是则使用 utf-8 编码"""
+    if platform.system() == 'Windows':
+        terminal = os.environ.get('TERM')
+        if terminal and 'xterm' in terminal:
+            sys.stdin.reconfigure(encoding='utf-8')
+            sys.stdout.reconfigure(encoding='utf-8')
+
+
+def decode_as(encoding):
+    """检测到的编码实际用于解码的编码"""
+    return superset_encodings.get(encoding.lower(), encoding)
+
+
+def is_utf8_encoding(encoding):
+    """不带 BOM 的 UTF-8 或 ASCII 无需转换"""
+    return codecs.lookup(decode_as(encoding)).name == 'utf-8'
+
+
+def convert_stream(fin, fout, encoding, errors='strict', head=b'', redetect=False):
+    """以 chunk_size 为单位流式转换，增量解码器会保留块尾被切开的多字节字符
+    head 为已从 fin 读出、用于检测编码的内容
+    redetect 为 True 时（样本全为 ASCII，按 UTF-8 解码），遇到第一个无法解码的字节时
+    只用从该处开始的内容重新检测编码，之前的内容只含 ASCII 或合法的 UTF-8，照常按 UTF-8 写出，
+    其后的内容按新编码解码；与检测整个文件时一样，置信度低于 --min-confidence 或非 ASCII 字节过少时
+    视为无法确定，抛出 UndeterminedEncoding
+    返回最终使用的编码
+    """
+    decoder = codecs.getincrementaldecoder(decode_as(encoding))(errors)
+    encoder = codecs.getincrementalencoder('utf-8')()
+    block = head or fin.read(chunk_size)
+    while True:
+        final = not block
+        try:
+            text = decoder.decode(block, final)
+        except UnicodeDecodeError as e:
+            if not redetect:
+                raise
+            redetect = False
+            # 解码失败时增量解码器的状态不变，缓冲中是上一块末尾未解码的字节，e.start 相对于两者拼接后的内容
+            data = decoder.getstate()[0] + block
+            rest = data[e.start:]
+            if len(rest) < check_file_encoding.sample_size and not final:
+                # 出错位置靠近块尾时多读一些，样本足够再检测
+                rest += fin.read(check_file_encoding.sample_size - len(rest))
+            sample = rest[:check_file_encoding.sample_size]
+            detected, confidence = detect_encoding([sample])
+            if not detected or is_utf8_encoding(detected):
+                raise UndeterminedEncoding(f'{e.reason} at byte {e.start}, redetected {detected} '
+                                           f'(confidence {confidence:.2f})') from e
+            # 出错位置之前是完整的 UTF-8，直接写出，只有其后的内容按新编码解码
+            fout.write(encoder.encode(data[:e.start].decode('utf-8')))
+            encoding = detected
+            decoder = codecs.getincrementaldecoder(decode_as(encoding))(errors)
+            block = rest
+            continue
+        fout.write(encoder.encode(text, final))
+        if final:
+            return encoding
+        block = fin.read(chunk_size)
+
+
+def is_utf8_file(file):
+    """从当前位置读到文件末尾，判断内容是否都是合法的 UTF-8"""
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    try:
+        for block in iter(lambda: file.read(chunk_size), b''):
+            decoder.decode(block)
+        decoder.decode(b'', final=True)
+    except UnicodeDecodeError:
+        return False
+    return True
+
+
+@contextlib.contextmanager
+def atomic_output(file_path, mode_from=None):
+    """写入同目录下的临时文件，成功后整体替换 file_path，中途出错时 file_path 不变
+    mode_from 为复制权限位的来源文件，未指定时与直接写入 file_path 相同：
+    沿用已有文件的权限，新文件为 0666 去掉 umask 的位
+    """
+    if not mode_from and os.path.exists(file_path):
+        mode_from = file_path
+    directory = os.path.dirname(os.path.abspath(file_path))
+    fd, temp_path = tempfile.mkstemp(prefix='.' + os.path.basename(file_path) + '.', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as output_file:
+            yield output_file
+        if mode_from:
+            shutil.copymode(mode_from, temp_path)
+        else:
+            # mkstemp 创建的文件权限为 0600
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(temp_path, 0o666 & ~umask)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def convert_file_encoding(input_file_path, output_file_path, encoding=None, errors='strict'):
+    """转换一个文件，output_file_path 为 None 时写入标准输出
+    返回检测到的编码，无法确定时返回 None
+    """
+    # 样本全为 ASCII 时样本之外仍可能有其他编码的字节，遇到时重新检测
+    redetect = False
+    if not encoding:
+        # 检测输入文件的编码
+        encoding, _ = detect_file_encoding(input_file_path)
+        if not encoding:
+            return None
+        redetect = encoding == 'ascii'
+
+    with open(input_file_path, 'rb') as input_file:
+        try:
+            if output_file_path:
+                with atomic_output(output_file_path) as output_file:
+                    encoding = convert_stream(input_file, output_file, encoding, errors, redetect=redetect)
+            else:
+                encoding = convert_stream(input_file, sys.stdout.buffer, encoding, errors, redetect=redetect)
+        except UndeterminedEncoding:
+            return None
+        finally:
+            sys.stdout.buffer.flush()
+    return encoding
+
+
+def convert_in_place(file_path, encoding=None, errors='strict'):
+    """原地转换：写入同目录下的临时文件后整体替换原文件，中途出错时原文件不变
+    返回 (文件, 检测到的编码, 说明)，供进程池调用
+    """
+    try:
+        redetect = False
+        if not encoding:
+            encoding, _ = detect_file_encoding(file_path)
+            if not encoding:
+                return file_path, None, '无法确定输入文件编码'
+            if encoding == 'ascii':
+                # 样本全为 ASCII 时检查整个文件，样本之外有非 UTF-8 的字节时重新检测后转换
+                with open(file_path, 'rb') as input_file:
+                    redetect = not is_utf8_file(input_file)
+        if is_utf8_encoding(encoding) and not redetect:
+            return file_path, encoding, '已是 UTF-8，未改动'
+        with open(file_path, 'rb') as input_file, atomic_output(file_path, file_path) as output_file:
+            encoding = convert_stream(input_file, output_file, encoding, errors, redetect=redetect)
+        return file_path, encoding, '已转换'
+    except UndeterminedEncoding:
+        # 临时文件已删除，原文件不变
+        return file_path, None, '无法确定输入文件编码'
+    except (OSError, UnicodeError, LookupError) as e:
+        return file_path, encoding, f'转换失败: {e}'
+
+
+def init_worker(confidence):
+    """子进程初始化：使用主进程的 --min-confidence"""
+    check_file_encoding.min_confidence = confidence
+
+
+def convert_in_place_args(args):
+    return convert_in_place(*args)
+
+
+def convert_files_in_place(files, encoding=None, errors='strict', jobs=1):
+    """原地转换多个文件，多于一个文件时交给进程池，按文件顺序输出结果，有失败时返回 False"""
+    tasks = [(file_path, encoding, errors) for file_path in files]
+    if jobs <= 1 or len(files) <= 1:
+        results = map(convert_in_place_args, tasks)
+        pool = None
+    else:
+        import multiprocessing
+        pool = multiprocessing.Pool(min(jobs, len(files)), initializer=init_worker,
+                                    initargs=(check_file_encoding.min_confidence,))
+        results = pool.imap(convert_in_place_args, tasks)
+    ok = True
+    try:
+        for file_path, detected, message in results:
+            ok = ok and not message.startswith(('转换失败', '无法确定'))
+            print(f"{file_path}\t{detected or '-'}\t{message}", file=sys.stderr, flush=True)
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+    return ok
+
+
+def convert_stdin(output_file_path, encoding=None, errors='strict'):
+    """转换标准输入：先读入一段用于检测编码，再连同其余内容流式转换"""
+    fin = sys.stdin.buffer
+    head = fin.read(check_file_encoding.sample_size)
+    redetect = False
+    if not encoding:
+        encoding, _ = detect_encoding([head])
+        if not encoding:
+            return None
+        redetect = encoding == 'ascii'
+    try:
+        if output_file_path:
+            with atomic_output(output_file_path) as output_file:
+                encoding = convert_stream(fin, output_file, encoding, errors, head, redetect)
+        else:
+            encoding = convert_stream(fin, sys.stdout.buffer, encoding, errors, head, redetect)
+    except UndeterminedEncoding:
+        return None
+    finally:
+        sys.stdout.buffer.flush()
+    return encoding
+
+
+def main():
+    change_default_encoding()
+    parser = argparse.ArgumentParser(description='Convert file encoding to UTF-8')
+    parser.add_argument('files', nargs='*', help='Input files, * wildcards are expanded. Requires --in-place when more than one.')
+    parser.add_argument('-i', '--input', help='Input file path. If not provided, read from standard input.')
+    parser.add_argument('-o', '--output', help='Output file path. If not provided, write to standard output.')
+    parser.add_argument('--in-place', action='store_true',
+                        help='Convert the files in place, replacing each one atomically.')
+    parser.add_argument('-e', '--encoding', help='Input encoding, skips detection.')
+    parser.add_argument('--errors', default='strict', choices=('strict', 'replace', 'ignore'),
+                        help='How to handle bytes that cannot be decoded.')
+    parser.add_argument('--min-confidence', type=float, default=check_file_encoding.min_confidence,
+                        help='Refuse to convert below this chardet confidence.')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help='Number of worker processes for --in-place, defaults to the number of CPUs.')
+
+    args = parser.parse_args()
+    check_file_encoding.min_confidence = args.min_confidence
+
+    patterns = args.files + ([args.input] if args.input else [])
+    files = [file_path for pattern in patterns for file_path in (glob.glob(pattern) or [pattern])]
+    missing = [file_path for file_path in files if not os.path.isfile(file_path)]
+    if missing:
+        parser.error(f"文件不存在: {', '.join(missing)}")
+
+    if args.in_place:
+        if not files:
+            parser.error('--in-place 需要指定文件')
+        if not convert_files_in_place(files, args.encoding, args.errors, args.jobs):
+            sys.exit(1)
+        return
+    if len(files) > 1:
+        parser.error('多个文件需使用 --in-place')
+
+    try:
+        if files:
+            encoding = convert_file_encoding(files[0], args.output, args.encoding, args.errors)
+            source = files[0]
+        else:
+            encoding = convert_stdin(args.output, args.encoding, args.errors)
+            source = '标准输入'
+    except (UnicodeError, LookupError) as e:
+        print(f"转换失败: {e}", file=sys.stderr)
+        sys.exit(1)
+    if not encoding:
+        print("无法确定输入文件编码", file=sys.stderr)
+        sys.exit(1)
+    print(f"文件已转换: {source} -> {args.output if args.output else '标准输出'} ({encoding})", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    # pyinstaller 打包后在 windows 下使用多进程需要
+    if getattr(sys, 'frozen', False):
+        import multiprocessing
+        multiprocessing.freeze_support()
+    main()
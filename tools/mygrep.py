@@ -1,66 +1,500 @@
-import argparse
-import re
-import sys
-import platform
-import os
-
-
-def change_default_encoding():
-    """判断是否在 windows git-bash 下运行，是则使用 utf-8 编码"""
-    if platform.system() == 'Windows':
-        terminal = os.environ.get('TERM')
-        if terminal and 'xterm' in terminal:
-            sys.stdin.reconfigure(encoding='utf-8')
-            sys.stdout.reconfigure(encoding='utf-8')
-
-
-def grep(pattern, file, use_regex):
-    """
-    类似于grep的函数，对每一行文本进行匹配，如果匹配则打印相应行，否则跳过。
-
-    参数：
-    pattern (str): 搜索模式，可以是正则表达式或子串
-    file: 文件对象或标准输入
-    use_regex (bool): 是否使用正则表达式匹配
-
-    返回：
-    None
-    """
-    for line in file:
-        if use_regex:
-            # 如果使用正则表达式匹配，使用re.search
-            match = re.search(pattern, line)
-        else:
-            # 否则，使用普通的字符串查找
-            match = pattern in line
-
-        # 如果匹配成功，打印相应行
-        if match:
-            print(line, end='')
-
-
-def main():
-    change_default_encoding()
-    # 创建命令行解析器
-    parser = argparse.ArgumentParser(description="类似于grep的命令行工具，按行进行匹配。")
-
-    # 添加命令行参数
-    parser.add_argument("-e", "--regex", action="store_true",
-                        help="使用正则表达式进行匹配")
-    parser.add_argument("pattern", help="搜索模式，可以是正则表达式或子串")
-    parser.add_argument("file", nargs='?', type=argparse.FileType('r'), default=sys.stdin,
-                        help="要搜索的文件，如果未提供则从标准输入读取")
-
-    # 解析命令行参数
-    args = parser.parse_args()
-
-    try:
-        # 调用grep函数，逐行处理文本
-        grep(args.pattern, args.file, args.regex)
-    except Exception as e:
-        print(f"发生错误: {e}")
-        sys.exit(1)
-
-
-if __name__ == "__main__":
-    main()
+import argparse
+import bisect
+import codecs
+import functools
+import locale
+import mmap
+import re
+import sys
+import platform
+import os
+
+# 大文件切块的大小，每块交给一个进程搜索
+chunk_size = 8 << 20
+
+# 读取标准输入时每次读入的字节数
+stdin_block_size = 1 << 20
+
+# 匹配 IPv4 地址，与 ip_notes.py 相同
+pattern_ip = re.compile(
+    rb'((?:(?:25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)\.){3}(?:25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?))')
+
+# 子进程中的搜索条件，由 init_worker 初始化
+searcher = None
+
+# 切分正则表达式：转义序列、取反字符类的开头、内联标志、向前与向后查找及其余单个字符
+pattern_regex_token = re.compile(r'\\.|\[\^|\(\?[a-zA-Z]+[:)]|\(\?<?[=!]|.', re.S)
+
+# 行尾的换行符，\r\n、\r 与按文本读取时一样都作为换行
+pattern_line_end = re.compile(rb'\r\n?|\n')
+pattern_line_end_text = re.compile(r'\r\n?|\n')
+
+
+def change_default_encoding():
+    """判断是否在 windows git-bash 下运行，是则使用 utf-8 编码"""
+    if platform.system() == 'Windows':
+        terminal = os.environ.get('TERM')
+        if terminal and 'xterm' in terminal:
+            sys.stdin.reconfigure(encoding='utf-8')
+            sys.stdout.reconfigure(encoding='utf-8')
+
+
+def is_utf8(encoding):
+    """UTF-8 或 ASCII 的数据可以直接按字节搜索"""
+    return codecs.lookup(encoding).name in ('utf-8', 'ascii')
+
+
+def matches_bytes(pattern):
+    """正则按 UTF-8 字节匹配与按字符匹配的结果是否相同
+
+    只含 ASCII，且不含 . [^...] \\w \\s \\d \\b 等以及忽略大小写时相同；
+    这些写法在字节正则中只针对单个字节或 ASCII 字符，如 . 只匹配中文的一个字节
+    """
+    if not pattern.isascii():
+        return False
+    for token in pattern_regex_token.findall(pattern):
+        if token in ('.', '[^') or (token[0] == '\\' and token[1:] in 'wWsSdDbB') \
+                or (token.startswith('(?') and 'i' in token):
+            return False
+    return True
+
+
+def needs_line_mode(pattern):
+    """整块搜索会漏掉逐行匹配能找到的行时返回 True，这类正则需逐行匹配
+
+    有 \\A、\\Z、\\B 或向前、向后查找时：逐行匹配时换行符之后就是字符串末尾，\\B、(?!...) 等
+    零宽断言可以在那里成立（如 \\B$ 匹配 'ab\\n' 的末尾），整块搜索时那里是下一行的行首，结果取决于下一行；
+    或者正则能匹配换行符（\\s、\\n、[^...] 等），同时又有依赖其后内容的 $、\\b 时
+    （如 \\s$ 在逐行读取时可以匹配行尾的换行符）
+    """
+    if isinstance(pattern, bytes):
+        pattern = pattern.decode('utf-8')
+    tokens = pattern_regex_token.findall(pattern)
+    if any(token in ('\\A', '\\Z', '\\B', '(?=', '(?!', '(?<=', '(?<!') for token in tokens):
+        return True
+    newline = any(token in ('[^', '\n') or (token[0] == '\\' and token[1:].isalnum() and token[1:] not in 'wSdbBtrfva')
+                  or (token.startswith('(?') and 's' in token) for token in tokens)
+    return newline and any(token in ('$', '\\b') for token in tokens)
+
+
+def compile_patterns(patterns, use_regex, encoding='utf-8'):
+    """把多个搜索模式编译为一个正则表达式，没有模式时返回 None
+
+    参数：
+    patterns (list): 搜索模式，可以是正则表达式或子串
+    use_regex (bool): 是否按正则表达式处理，否则按子串转义
+    encoding (str): 被搜索数据的编码
+
+    返回：
+    编译好的正则表达式（re.MULTILINE），^ 与 $ 匹配每一行的行首、行尾。
+    数据为 UTF-8 且按字节匹配结果不变时（子串，或只含 ASCII 的简单正则）为字节正则，直接搜索原始数据；
+    否则为字符串正则，数据解码后再搜索
+    """
+    if not patterns:
+        return None
+    if use_regex:
+        parts = list(patterns)
+        as_bytes = is_utf8(encoding) and all(matches_bytes(p) for p in parts)
+    else:
+        parts = [re.escape(p) for p in patterns]
+        as_bytes = is_utf8(encoding)
+    pattern = parts[0] if len(parts) == 1 else '|'.join('(?:' + part + ')' for part in parts)
+    return re.compile(pattern.encode('utf-8') if as_bytes else pattern, re.MULTILINE)
+
+
+def ip_to_int(ip):
+    """点分十进制 IPv4（字节）转整数"""
+    a, b, c, d = ip.split(b'.')
+    return (int(a) << 24) | (int(b) << 16) | (int(c) << 8) | int(d)
+
+
+def load_ip_filter(data_file, tag, cidrs):
+    """装载 ip_notes 数据，展开 --tag 与 --cidr 条件
+
+    返回 (标签命中的 IP 字节串集合或 None, 区间起点列表, 区间终点列表)，
+    只在主进程中装载一次，子进程直接使用展开后的结果；条件不合法时抛出 ValueError
+    """
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import ip_notes
+
+    tagged = None
+    if tag:
+        ip_notes.load_data(data_file or ip_notes.default_ipdata(), ('tag', 'tags'))
+        try:
+            ips = ip_notes.tag_query_ips(tag)
+        except ValueError:
+            raise ValueError(f"无效的标签表达式: {tag}")
+        tagged = {ip_notes.int_to_ip(n).encode('ascii') for n in ips}
+
+    bounds = []
+    for text in cidrs:
+        parsed = ip_notes.parse_query(text)
+        if parsed is None:
+            raise ValueError(f"无效的网段: {text}")
+        bounds.append(parsed)
+    starts = []
+    ends = []
+    for lo, hi in sorted(bounds):
+        if ends and lo <= ends[-1] + 1:
+            ends[-1] = max(ends[-1], hi)
+        else:
+            starts.append(lo)
+            ends.append(hi)
+    return tagged, starts, ends
+
+
+def make_ip_filter(tagged, starts, ends):
+    """返回判断 IP（字节）是否满足条件的函数
+    标签用集合判断，网段在升序区间上二分查找，两者同时指定时同一个 IP 需同时满足；
+    日志中的 IP 大量重复，网段判断的结果用 LRU 缓存
+    """
+    @functools.lru_cache(maxsize=1 << 16)
+    def in_cidr(ip):
+        n = ip_to_int(ip)
+        pos = bisect.bisect_right(starts, n) - 1
+        return pos >= 0 and n <= ends[pos]
+
+    if tagged is not None and starts:
+        return lambda ip: ip in tagged and in_cidr(ip)
+    if tagged is not None:
+        return tagged.__contains__
+    return in_cidr
+
+
+def ip_prefix_regex(tagged, starts, ends):
+    """满足 IP 条件的 IP 共有的点分十进制前缀组成的正则，如 10.0.13.0/24 为 10.0.13.
+
+    只有 IP 条件时先用它在整块中找出候选位置，比逐个匹配所有 IP 快得多；
+    同时指定网段时只用网段的前缀，前缀过多时返回 None
+    """
+    prefixes = set()
+    if starts:
+        for lo, hi in zip(starts, ends):
+            k = 0
+            while k < 3 and lo >> (24 - 8 * k) == hi >> (24 - 8 * k):
+                k += 1
+            if k:
+                prefixes.add(b'.'.join(b'%d' % (lo >> (24 - 8 * i) & 255) for i in range(k)) + b'.')
+            else:
+                prefixes.update(b'%d.' % first for first in range(lo >> 24, (hi >> 24) + 1))
+    elif tagged:
+        prefixes = {ip.split(b'.', 1)[0] + b'.' for ip in tagged}
+    if not prefixes or len(prefixes) > 256:
+        return None
+    alternation = b'|'.join(re.escape(prefix) for prefix in sorted(prefixes, key=len, reverse=True))
+    return re.compile(rb'(?<![0-9])(?:' + alternation + b')')
+
+
+class Searcher:
+    """在一块字节数据中找出匹配的行
+
+    有搜索模式时整块搜索模式，命中后再取出所在的行；只有 IP 条件时整块搜索 IP。
+    找到一行后从行尾继续搜索，每行最多输出一次。
+    字符串正则先把整块按 encoding 解码再搜索，无法解码的字节原样保留、原样输出；
+    有 \\r 时换行统一为 \\n 后搜索，输出的行保留原来的 \\r\\n
+    """
+
+    def __init__(self, regex, ip_filter=None, prefix=None, encoding='utf-8'):
+        self.regex = regex
+        self.ip_filter = ip_filter
+        self.prefix = prefix
+        self.encoding = encoding
+        if regex is not None:
+            # 单独一行上确认时与旧版逐行 re.search 相同，^ $ 只匹配行首、行尾
+            self.line_regex = re.compile(regex.pattern, regex.flags & ~re.MULTILINE)
+            self.line_mode = needs_line_mode(regex.pattern)
+
+    def line_ok(self, data, start, end):
+        """行内是否有满足 IP 条件的 IP"""
+        if self.ip_filter is None:
+            return True
+        ip_filter = self.ip_filter
+        for match in pattern_ip.finditer(data, start, end):
+            if ip_filter(match.group()):
+                return True
+        return False
+
+    def search(self, data, start=0, end=None):
+        """返回 data[start:end] 中匹配的行，start 与 end 须在行首"""
+        if end is None:
+            end = len(data)
+        if self.regex is None:
+            return self.search_ip(data, start, end)
+        crlf = data.find(b'\r', start, end) >= 0
+        if isinstance(self.regex.pattern, bytes):
+            if crlf:
+                data = data[start:end]
+                spans = self.matching_lines_crlf(data, pattern_line_end)
+            else:
+                spans = self.matching_lines(data, start, end)
+            return [data[a:b] for a, b in spans if self.line_ok(data, a, b)]
+        text = data[start:end].decode(self.encoding, 'surrogateescape')
+        if crlf:
+            spans = self.matching_lines_crlf(text, pattern_line_end_text)
+        else:
+            spans = self.matching_lines(text, 0, len(text))
+        lines = (text[a:b].encode(self.encoding, 'surrogateescape') for a, b in spans)
+        return [line for line in lines if self.line_ok(line, 0, len(line))]
+
+    def matching_lines_crlf(self, data, line_end):
+        """含 \\r 的数据：与按文本读取时相同，\\r\\n 与 \\r 都作为换行符 \\n 搜索，
+        再把匹配的行换算回原数据中的位置，输出的行保留原来的换行符
+        """
+        newline, cr = ('\n', '\r') if isinstance(data, str) else (b'\n', b'\r')
+        crlf = cr + newline
+        if data.count(crlf) == data.count(newline) == data.count(cr):
+            # 全部以 \r\n 结尾（Windows 下的常见情况）：原位置 = 去掉 \r 后的位置 + 之前的行数
+            normalized = data.replace(crlf, newline)
+            count = normalized.count
+            lines = 0
+            pos = 0
+            for a, b in self.matching_lines(normalized, 0, len(normalized)):
+                lines += count(newline, pos, a)
+                own = count(newline, a, b)
+                yield a + lines, b + lines + own
+                lines += own
+                pos = b
+            return
+        # 混有 \n 或单独的 \r 时逐个换行符记下原位置
+        ends = []
+        shifted = []
+        shift = 0
+        for match in line_end.finditer(data):
+            ends.append(match.end())
+            shift += match.end() - match.start() - 1
+            shifted.append(match.end() - shift)
+        normalized = line_end.sub(newline, data)
+        for a, b in self.matching_lines(normalized, 0, len(normalized)):
+            i = bisect.bisect_left(shifted, b)
+            yield (ends[i - 1] if i else 0), (ends[i] if i < len(ends) else len(data))
+
+    def matching_lines(self, data, start, end):
+        """data[start:end] 中与正则匹配的行，返回 (行首, 行尾) 位置，行尾含换行符
+
+        整块搜索找到的位置只是候选：跨行的匹配（如 \\s+ 匹配到换行）不算，
+        再在候选所在的一行上确认，结果与逐行匹配相同
+        """
+        line_search = self.line_regex.search
+        newline = '\n' if isinstance(data, str) else b'\n'
+        if self.line_mode:
+            pos = start
+            while pos < end:
+                line_end = data.find(newline, pos, end)
+                line_end = end if line_end < 0 else line_end + 1
+                if line_search(data[pos:line_end]):
+                    yield pos, line_end
+                pos = line_end
+            return
+        regex = self.regex
+        pos = start
+        while pos < end:
+            match = regex.search(data, pos, end)
+            if not match:
+                break
+            line_start = data.rfind(newline, start, match.start()) + 1 or start
+            if line_start == end:
+                # 最后一个换行之后的空位置（如 ^ 匹配到的）不是一行
+                break
+            line_end = data.find(newline, match.start(), end)
+            line_end = end if line_end < 0 else line_end + 1
+            if match.end() < line_end or line_search(data[line_start:line_end]):
+                yield line_start, line_end
+            pos = line_end
+
+    def search_ip(self, data, start, end):
+        """只有 IP 条件时，逐个检查块中的 IP，行内已有 IP 满足条件时跳过该行其余 IP
+        有共同前缀时只检查以前缀开头的位置
+        """
+        ip_filter = self.ip_filter
+        if self.prefix is None:
+            matches = pattern_ip.finditer(data, start, end)
+        else:
+            match_ip = pattern_ip.match
+            matches = (match_ip(data, m.start(), end) for m in self.prefix.finditer(data, start, end))
+        out = []
+        pos = start
+        for match in matches:
+            if match is None or match.start() < pos or not ip_filter(match.group()):
+                continue
+            line_start = data.rfind(b'\n', start, match.start()) + 1 or start
+            line_end = data.find(b'\n', match.end(), end)
+            line_end = end if line_end < 0 else line_end + 1
+            out.append(data[line_start:line_end])
+            pos = line_end
+        return out
+
+
+def split_file(file_path):
+    """将文件按行切分为约 chunk_size 字节的块，返回 (文件, 起始, 结束) 列表"""
+    size = os.path.getsize(file_path)
+    chunks = []
+    with open(file_path, 'rb') as f:
+        start = 0
+        while start < size:
+            f.seek(min(start + chunk_size, size))
+            f.readline()
+            end = min(f.tell(), size)
+            chunks.append((file_path, start, end))
+            start = end
+    return chunks
+
+
+def init_worker(patterns, use_regex, filter_data=None, encoding='utf-8'):
+    """子进程初始化：编译一次搜索模式，filter_data 为 load_ip_filter 展开的 IP 条件，encoding 为数据的编码"""
+    global searcher
+    regex = compile_patterns(patterns, use_regex, encoding)
+    if filter_data:
+        searcher = Searcher(regex, make_ip_filter(*filter_data), ip_prefix_regex(*filter_data), encoding=encoding)
+    else:
+        searcher = Searcher(regex, encoding=encoding)
+
+
+def search_chunk(chunk):
+    """子进程：用 mmap 映射文件，只搜索其中一块，返回匹配的行拼接成的字节串"""
+    file_path, start, end = chunk
+    with open(file_path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            lines = searcher.search(data, start, end)
+    if lines and not lines[-1].endswith(b'\n'):
+        lines[-1] += b'\n'
+    return b''.join(lines)
+
+
+def grep_stdin(fout):
+    """搜索标准输入，按块读入，在最后一个换行处切开"""
+    fin = sys.stdin.buffer
+    rest = b''
+    while True:
+        block = fin.read(stdin_block_size)
+        if not block:
+            break
+        block = rest + block
+        cut = block.rfind(b'\n') + 1
+        block, rest = block[:cut], block[cut:]
+        fout.write(b''.join(searcher.search(block)))
+    if rest:
+        lines = searcher.search(rest)
+        if lines:
+            fout.write(b''.join(lines) + b'\n')
+
+
+def grep(files, fout, jobs=1, initargs=()):
+    """
+    类似于grep的函数，输出文件中匹配的行，多个文件时每行前加上文件名。
+
+    参数：
+    files (list): 要搜索的文件
+    fout: 输出的二进制文件对象
+    jobs (int): 进程数，大文件按块分给多个进程，结果仍按文件及行的顺序输出
+    initargs (tuple): init_worker 的参数
+
+    返回：
+    None
+    """
+    chunks = []
+    for file_path in files:
+        if not os.path.isfile(file_path):
+            print(f"文件不存在: {file_path}", file=sys.stderr)
+            continue
+        chunks.extend(split_file(file_path))
+    prefix = len(files) > 1
+
+    def write(chunk, found):
+        if not found:
+            return
+        if prefix:
+            name = os.fsencode(chunk[0]) + b':'
+            found = b''.join(name + line + b'\n' for line in found.split(b'\n')[:-1])
+        fout.write(found)
+
+    if jobs <= 1 or len(chunks) <= 1:
+        init_worker(*initargs)
+        for chunk in chunks:
+            write(chunk, search_chunk(chunk))
+        return
+
+    import multiprocessing
+    with multiprocessing.Pool(jobs, initializer=init_worker, initargs=initargs) as pool:
+        for chunk, found in zip(chunks, pool.imap(search_chunk, chunks)):
+            write(chunk, found)
+
+
+def read_patterns(file_path):
+    """读取 -f 指定的模式文件，每行一个模式，忽略空行"""
+    with open(file_path, encoding='utf-8') as f:
+        return [line.rstrip('\r\n') for line in f if line.strip()]
+
+
+def main():
+    # pyinstaller 打包后在 windows 下使用多进程需要
+    if getattr(sys, 'frozen', False):
+        import multiprocessing
+        multiprocessing.freeze_support()
+
+    change_default_encoding()
+    # 创建命令行解析器
+    parser = argparse.ArgumentParser(description="类似于grep的命令行工具，按行进行匹配。")
+
+    # 添加命令行参数
+    parser.add_argument("-e", "--regex", action="store_true",
+                        help="使用正则表达式进行匹配")
+    parser.add_argument("-p", "--pattern", action="append", default=[],
+                        help="搜索模式，可指定多次；指定后位置参数都作为文件")
+    parser.add_argument("-f", "--file", dest="pattern_file", action="append", default=[],
+                        help="从文件读取搜索模式，每行一个")
+    parser.add_argument("--tag", type=str, default='',
+                        help="只保留含有该标签 IP 的行，支持 ip_notes --tags 表达式，如 '电脑 & !中毒'")
+    parser.add_argument("--cidr", action="append", default=[],
+                        help="只保留含有该网段内 IP 的行，如 10.0.0.0/8、10.0.0.1-10.0.0.99、10.1.*，可指定多次")
+    parser.add_argument("-d", "--data_file", type=str, default='',
+                        help="--tag 使用的 ip_notes 数据文件，默认同 ip_notes.py")
+    parser.add_argument("--encoding", type=str, default='',
+                        help="文件与标准输入的编码，默认为系统编码（与旧版按文本读取时相同）")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1,
+                        help="搜索文件的进程数，默认为 CPU 核数")
+    parser.add_argument("args", nargs='*',
+                        help="搜索模式与要搜索的文件；未用 -p/-f/--tag/--cidr 时第一个为搜索模式，未提供文件则从标准输入读取")
+
+    # 解析命令行参数
+    args = parser.parse_args()
+
+    patterns = list(args.pattern)
+    for file_path in args.pattern_file:
+        patterns.extend(read_patterns(file_path))
+    files = list(args.args)
+    if not (args.pattern or args.pattern_file or args.tag or args.cidr):
+        if not files:
+            parser.error("需要指定搜索模式")
+        patterns.append(files.pop(0))
+
+    try:
+        filter_data = load_ip_filter(args.data_file, args.tag, args.cidr) if args.tag or args.cidr else None
+        if not patterns and filter_data is None:
+            # 模式文件为空，没有可匹配的行
+            return
+        if args.encoding:
+            encoding = args.encoding
+        elif files:
+            encoding = locale.getpreferredencoding(False)
+        else:
+            encoding = sys.stdin.encoding or 'utf-8'
+        # 先在主进程中编译一次，模式有误时直接报错
+        compile_patterns(patterns, args.regex, encoding)
+        initargs = (patterns, args.regex, filter_data, encoding)
+        fout = sys.stdout.buffer
+        if files:
+            grep(files, fout, jobs=args.jobs, initargs=initargs)
+        else:
+            init_worker(*initargs)
+            grep_stdin(fout)
+        fout.flush()
+    except BrokenPipeError:
+        # 输出管道已关闭（如 | head）
+        sys.stderr.close()
+    except Exception as e:
+        print(f"发生错误: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()